@@ -1,36 +1,117 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException, Form, Header, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from schemas.video import VideoResponse, TaskResponse
 from services.video_processor import process_video_task
-from services.task_manager import create_task, get_task, TaskStatus
-import shutil
+from services.task_manager import (
+    create_task, get_task, find_task_by_key, update_task_status, update_task_result, update_task_error, TaskStatus
+)
+from services.upload_store import save_upload
+from services.result_cache import result_cache
+import hmac
 import os
-import uuid
+import time
 from core.config import settings
-from services.manga_processor import process_manga_generation
+from core.metrics import registry, collect_timings
+from services.manga_processor import (
+    process_manga_generation, render_style_previews, collapse_duplicates, SEGMENT_MODES, PREVIEW_STYLES
+)
+from services.video_manga_pipeline import process_video_to_manga_task, PipelineOptions
+from services.profiler import profile_task, run_profiled, profiler_busy, ProfilerBusy, PROFILE_MODES
+from services.volume_export import iter_volume, output_path, task_page_paths, EXPORT_FORMATS
+from services.checkpoints import has_live_checkpoint
 
 router = APIRouter()
 
+def _is_alive(task) -> bool:
+    """
+    Whether a running task still has a worker: it was updated recently, or its
+    job holds a fresh checkpoint lease. A task whose worker died before
+    checkpointing is never resumed and would otherwise be reused forever.
+    PENDING tasks always count as alive: they wait in the BackgroundTasks queue,
+    where nothing refreshes updated_at, however long the queue is.
+    """
+    if task.status != TaskStatus.PROCESSING:
+        return True
+    if time.time() - task.updated_at <= settings.CHECKPOINT_STALE_SECONDS:
+        return True
+    return has_live_checkpoint(task.id)
+
+def _outputs_exist(task) -> bool:
+    """Check that every /output/ URL in a completed task's result is still on disk."""
+    if task.status != TaskStatus.COMPLETED or not task.result:
+        return True
+    for value in task.result.values():
+        if isinstance(value, str) and value.startswith("/output/"):
+            rel_path = value[len("/output/"):]
+            if not os.path.exists(os.path.join(settings.OUTPUT_DIR, rel_path)):
+                return False
+    return True
+
+def _profile_mode(profile: bool, x_profile: str | None, x_admin_token: str | None) -> str | None:
+    """
+    Resolve the profiling mode requested with the `profile` form flag or the
+    X-Profile header ("sample" or "cprofile"). Profiling is admin-only.
+    """
+    if not profile and not x_profile:
+        return None
+    mode = (x_profile or "sample").lower()
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid profile mode. Use one of: {', '.join(PROFILE_MODES)}")
+    if not settings.ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid admin token.")
+    return mode
+
+_PROFILER_BUSY = "A cprofile run is already in progress. Retry later or use the sample profiler."
+
+def _check_profiler(mode: str | None):
+    # The slot is only taken once profiling starts, so nothing can leak if the request fails before that
+    if profiler_busy(mode):
+        raise HTTPException(status_code=409, detail=_PROFILER_BUSY)
+
 @router.post("/convert", response_model=TaskResponse)
 async def convert_video_endpoint(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    language: str = Form("en")
+    language: str = Form("en"),
+    profile: bool = Form(False),
+    x_profile: str | None = Header(None),
+    x_admin_token: str | None = Header(None)
 ):
     """
     Upload a video file to separate audio and video components in the background.
     """
     if not file.content_type.startswith("video/"):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a video.")
+    profile_mode = _profile_mode(profile, x_profile, x_admin_token)
 
-    task = create_task()
-    
-    # Save the file first
-    file_location = os.path.join(settings.INPUT_DIR, file.filename)
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream the file to disk, stored under its content hash
+    stored = await save_upload(file, settings.INPUT_DIR)
+
+    # The same video in the same language was already processed (or is in flight): reuse that task
+    dedup_key = f"convert:{stored.sha256}:{language}"
+    existing = find_task_by_key(dedup_key) if profile_mode is None else None
+    if existing is not None and not _is_alive(existing):
+        update_task_error(existing.id, "Processing failed: the worker running this task stopped")
+        existing = None
+    if existing is not None and _outputs_exist(existing):
+        return TaskResponse(
+            task_id=existing.id,
+            status=existing.status.value,
+            message="Identical upload already processed"
+        )
+
+    _check_profiler(profile_mode)
+    task = create_task(key=dedup_key)
     
     # Add background task
-    background_tasks.add_task(process_video_task, task.id, file_location, file.filename, language)
+    job_args = (task.id, stored.path, stored.filename, language)
+    if profile_mode:
+        background_tasks.add_task(
+            run_profiled, task.id, profile_mode, process_video_task, *job_args, content_hash=stored.sha256
+        )
+    else:
+        background_tasks.add_task(process_video_task, *job_args, content_hash=stored.sha256)
     
     return TaskResponse(task_id=task.id, status="pending")
 
@@ -45,6 +126,55 @@ async def get_task_status(task_id: str):
     
     return task
 
+@router.get("/export/{task_id}")
+async def export_volume_endpoint(task_id: str, export_format: str = Query("cbz", alias="format")):
+    """
+    Download a task's pages as one volume: `cbz` (ZIP of the page images, stored
+    without recompression) or `pdf` (one page per image).
+    The archive is streamed page by page, so server memory stays constant. For a
+    task that is still running, pages are written into the archive as they are
+    saved and the download ends when the task completes (it is cut off if the task fails).
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}")
+    task = get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task.status == TaskStatus.FAILED:
+        raise HTTPException(status_code=409, detail="Task failed; it has no volume to export")
+    if task.status == TaskStatus.COMPLETED:
+        manga_urls = (task.result or {}).get("manga_urls")
+        if not manga_urls:
+            raise HTTPException(status_code=409, detail="Task has no manga pages to export")
+        if not all(os.path.exists(output_path(url)) for url in manga_urls):
+            raise HTTPException(status_code=410, detail="Some pages of this task are no longer available")
+
+    filename = f"manga_{task_id}.{export_format}"
+    return StreamingResponse(
+        iter_volume(task_page_paths(task_id), export_format, title=filename),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Hit/miss counters of the demux/transcription result cache (per worker).
+    """
+    return result_cache.stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Stage latency histograms, bytes processed, queue depths and cache counters
+    in the Prometheus text format (per worker).
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def _check_segment_mode(segment_mode: str):
+    if segment_mode not in SEGMENT_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid segment_mode. Use one of: {', '.join(SEGMENT_MODES)}")
+
 @router.post("/manga-layout")
 async def create_manga_layout_endpoint(
     files: list[UploadFile] = File(...),
@@ -54,38 +184,182 @@ async def create_manga_layout_endpoint(
     seed: int = Form(42),
     stylize_style: str = Form("c"),
     segment_human: bool = Form(False),
-    show_mask: bool = Form(False)
+    show_mask: bool = Form(False),
+    segment_mode: str = Form("accuracy"),
+    dedup: bool = Form(False),
+    adaptive_pages: bool = Form(False),
+    profile: bool = Form(False),
+    x_profile: str | None = Header(None),
+    x_admin_token: str | None = Header(None)
 ):
     """
     Generate a manga layout from uploaded images.
+    With `dedup` (opt-in), runs of near-duplicate images are collapsed to their sharpest version first.
+    With `adaptive_pages` (opt-in), pages hold num_frames / 2 .. num_frames panels, fewer for sharper images;
+    by default every page but the last has num_frames panels.
+    The run is also recorded as a task, so its result stays available at /status/{task_id}.
     """
     if not files:
         raise HTTPException(status_code=400, detail="No files uploaded")
+    _check_segment_mode(segment_mode)
+    profile_mode = _profile_mode(profile, x_profile, x_admin_token)
 
     # Save files to INPUT_DIR
     image_paths = []
     for file in files:
-        # Generate a unique filename to avoid collisions
-        unique_filename = f"{uuid.uuid4()}_{file.filename}"
-        file_location = os.path.join(settings.INPUT_DIR, unique_filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        image_paths.append(file_location)
+        # Content-addressed names avoid collisions; identical images share one file
+        stored = await save_upload(file, settings.INPUT_DIR)
+        image_paths.append(stored.path)
     
+    _check_profiler(profile_mode)
+    task = create_task()
+    update_task_status(task.id, TaskStatus.PROCESSING)
     try:
-        manga_urls = await process_manga_generation(
-            image_paths=image_paths,
-            width=width,
-            height=height,
-            num_frames=num_frames,
-            seed=seed,
-            stylize_style=stylize_style,
-            segment_human=segment_human,
-            show_mask=show_mask
-        )
-        return {"manga_urls": manga_urls}
+        with profile_task(task.id, profile_mode) as profile_handle, collect_timings() as timings:
+            duplicates_removed = 0
+            # Sharpness measured while deduplicating is reused to plan the pages
+            sharpness = None
+            if dedup:
+                image_paths, duplicates_removed, sharpness = await run_in_threadpool(collapse_duplicates, image_paths)
+            manga_urls = await process_manga_generation(
+                image_paths=image_paths,
+                width=width,
+                height=height,
+                num_frames=num_frames,
+                seed=seed,
+                stylize_style=stylize_style,
+                segment_human=segment_human,
+                show_mask=show_mask,
+                segment_mode=segment_mode,
+                adaptive_pages=adaptive_pages,
+                task_id=task.id,
+                sharpness=sharpness
+            )
+        result = {"manga_urls": manga_urls, "duplicates_removed": duplicates_removed, "timings": timings.summary()}
+        if profile_handle:
+            result["profile_url"] = profile_handle.url
+        update_task_result(task.id, result)
+        return {"task_id": task.id, **result}
+    except ProfilerBusy:
+        # Another cprofile run started after the check above
+        update_task_error(task.id, _PROFILER_BUSY)
+        raise HTTPException(status_code=409, detail=_PROFILER_BUSY)
     except Exception as e:
         import traceback
         print(f"Error in manga-layout endpoint: {e}")
         print(traceback.format_exc())
+        update_task_error(task.id, str(e))
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/manga-preview")
+async def manga_preview_endpoint(
+    files: list[UploadFile] = File(...),
+    width: int = Form(1000),
+    height: int = Form(1400),
+    num_frames: int = Form(8),
+    seed: int = Form(42),
+    styles: str = Form("abc"),
+    preview_width: int = Form(400),
+    segment_human: bool = Form(False),
+    show_mask: bool = Form(False),
+    segment_mode: str = Form("accuracy"),
+    dedup: bool = Form(False),
+    adaptive_pages: bool = Form(False)
+):
+    """
+    Thumbnails of the first /manga-layout page in several styles ("abc" by default)
+    from one upload: images are decoded, segmented and laid out once for all styles.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    _check_segment_mode(segment_mode)
+    requested = list(dict.fromkeys(styles))
+    if not requested or any(style not in PREVIEW_STYLES for style in requested):
+        raise HTTPException(status_code=400, detail=f"Invalid styles. Use letters from: {''.join(PREVIEW_STYLES)}")
+    if not 16 <= preview_width <= width:
+        raise HTTPException(status_code=400, detail="preview_width must be between 16 and the page width")
+
+    image_paths = []
+    for file in files:
+        stored = await save_upload(file, settings.INPUT_DIR)
+        image_paths.append(stored.path)
+
+    try:
+        with collect_timings() as timings:
+            duplicates_removed = 0
+            # Sharpness measured while deduplicating is reused to plan the pages
+            sharpness = None
+            if dedup:
+                image_paths, duplicates_removed, sharpness = await run_in_threadpool(collapse_duplicates, image_paths)
+            previews = await render_style_previews(
+                image_paths,
+                styles=requested,
+                width=width,
+                height=height,
+                num_frames=num_frames,
+                seed=seed,
+                preview_width=preview_width,
+                segment_human=segment_human,
+                show_mask=show_mask,
+                segment_mode=segment_mode,
+                adaptive_pages=adaptive_pages,
+                sharpness=sharpness
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"previews": previews, "duplicates_removed": duplicates_removed, "timings": timings.summary()}
+
+@router.post("/video-to-manga", response_model=TaskResponse)
+async def video_to_manga_endpoint(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    language: str = Form("en"),
+    width: int = Form(1000),
+    height: int = Form(1400),
+    num_frames: int = Form(8),
+    seed: int = Form(42),
+    stylize_style: str = Form("c"),
+    segment_human: bool = Form(False),
+    show_mask: bool = Form(False),
+    segment_mode: str = Form("accuracy"),
+    temporal_masks: bool = Form(False),
+    dedup: bool = Form(True),
+    diarize: bool = Form(False),
+    frame_interval: float = Form(2.0),
+    adaptive_pages: bool = Form(False)
+):
+    """
+    Convert a video into manga pages with dialogue bubbles in the background.
+    With `adaptive_pages`, key scenes (sharp, long shots with dense dialogue) get fewer, larger panels per page;
+    the pages are planned once all frames and the transcript are ready, so stylization starts later.
+    """
+    if not file.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a video.")
+    if frame_interval <= 0:
+        raise HTTPException(status_code=400, detail="frame_interval must be positive.")
+    _check_segment_mode(segment_mode)
+
+    stored = await save_upload(file, settings.INPUT_DIR)
+    task = create_task()
+
+    options = PipelineOptions(
+        language=language,
+        width=width,
+        height=height,
+        num_frames=num_frames,
+        seed=seed,
+        stylize_style=stylize_style,
+        segment_human=segment_human,
+        show_mask=show_mask,
+        segment_mode=segment_mode,
+        temporal_masks=temporal_masks,
+        dedup=dedup,
+        diarize=diarize,
+        frame_interval=frame_interval,
+        adaptive_pages=adaptive_pages
+    )
+    background_tasks.add_task(
+        process_video_to_manga_task, task.id, stored.path, stored.filename, options, content_hash=stored.sha256
+    )
+
+    return TaskResponse(task_id=task.id, status="pending")
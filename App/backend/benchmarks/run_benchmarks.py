@@ -0,0 +1,284 @@
+"""
+Benchmark suite for the Frame and Speech hot paths.
+
+Synthetic fixtures (480p/1080p/4K images, a short audio clip) are generated
+locally, so results are reproducible without any media in the repository.
+
+Usage (from App/backend):
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --quick --only stylize
+    python -m benchmarks.run_benchmarks --compare baseline.json --threshold 0.15
+
+With --compare, cases whose median got slower than the baseline by more than
+the threshold are flagged and the runner exits with status 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from unittest.mock import MagicMock
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PROJECT_ROOT = os.path.abspath(os.path.join(BACKEND_DIR, "..", ".."))
+for path in (BACKEND_DIR, PROJECT_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import cv2
+import numpy as np
+from PIL import Image
+
+RESOLUTIONS = {
+    "480p": (854, 480),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+LAYOUT_FRAME_COUNTS = (8, 32, 128)
+
+def make_image(width, height, seed=0):
+    """Synthetic frame with gradients, shapes, text and noise so filters do realistic work."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = (x * 0.6 + y * 0.4).astype(np.uint8)
+    img[..., 1] = (255 - x * 0.5).astype(np.uint8) + np.zeros((height, 1), dtype=np.uint8)
+    img[..., 2] = (y * 0.8).astype(np.uint8) + np.zeros((1, width), dtype=np.uint8)
+
+    scale = width / 854
+    for _ in range(12):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(img, center, int(rng.integers(10, 80) * scale), color, -1)
+        cv2.rectangle(img, center, (center[0] + int(60 * scale), center[1] + int(40 * scale)), color, 3)
+    cv2.putText(img, "Vid2Manga", (int(40 * scale), height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                2 * scale, (255, 255, 255), max(1, int(3 * scale)))
+
+    noise = rng.normal(0, 6, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+def make_audio(path, seconds=10.0, sample_rate=16000):
+    """Write a 16 kHz mono WAV with voiced-like tone bursts separated by silence."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.15 * np.sin(2 * np.pi * 440 * t)
+    envelope = (np.sin(2 * np.pi * 0.5 * t) > 0).astype(np.float64)
+    pcm = (signal * envelope * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+class Fixtures:
+    def __init__(self, root, resolutions):
+        self.root = root
+        self.images = {}
+        for name in resolutions:
+            width, height = RESOLUTIONS[name]
+            path = os.path.join(root, f"frame_{name}.png")
+            cv2.imwrite(path, make_image(width, height))
+            self.images[name] = path
+        self.panels = [Image.fromarray(make_image(854, 480, seed=i)[..., ::-1]) for i in range(8)]
+        self.audio_path = os.path.join(root, "speech.wav")
+        make_audio(self.audio_path)
+
+def measure(fn, rounds, warmup=1, min_time=0.0):
+    """Run fn `warmup` times, then at least `rounds` times (and for at least `min_time` seconds)."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < rounds or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {
+        "rounds": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+def load_speech_module():
+    """
+    Import Speech.process_audio with the tiny Whisper model. If Whisper (or its
+    weights) is unavailable, a stub model is used so the wrapper overhead is still measured.
+    """
+    os.environ.setdefault("WHISPER_MODEL", "tiny")
+    try:
+        import whisper  # noqa: F401
+        from Speech import process_audio
+        return process_audio, f"whisper-{process_audio.MODEL_NAME}"
+    except Exception as e:
+        print(f"Whisper unavailable ({e}); using a stubbed model")
+        sys.modules["whisper"] = MagicMock()
+        sys.modules.pop("Speech.process_audio", None)
+        from Speech import process_audio
+        stub = MagicMock()
+        stub.transcribe.return_value = {"text": "", "segments": []}
+        process_audio.model = stub
+        return process_audio, "stub"
+
+def import_app():
+    """Cold-import the FastAPI app in a fresh interpreter (server startup time)."""
+    env = dict(os.environ, TASK_STORE_BACKEND="memory", WARMUP_MODELS="")
+    subprocess.run([sys.executable, "-c", "import main"], cwd=BACKEND_DIR, env=env, check=True)
+
+def build_cases(fixtures, include_speech=True):
+    from Frame.frame_processor import frame_clear, stylize_a, stylize_b, stylize_c, stylize_many
+    from Frame.manga_layout import generate_manga_layout, create_manga_page, create_bubble_mask
+    from services.manga_processor import draw_label_overlay
+
+    cases = [("startup[import main]", import_app, None)]
+    for name, path in fixtures.images.items():
+        width, height = RESOLUTIONS[name]
+        megapixels = width * height / 1e6
+        cases.append((f"frame_clear[{name}]", lambda p=path: frame_clear(p), megapixels))
+        for style, fn in (("a", stylize_a), ("b", stylize_b), ("c", stylize_c)):
+            cases.append((f"stylize_{style}[{name}]", lambda p=path, f=fn: f(p), megapixels))
+        for style, fn in (("a", stylize_a), ("c", stylize_c)):
+            cases.append((f"stylize_{style}_tiled[{name}]", lambda p=path, f=fn: f(p, tiled=True), megapixels))
+        cases.append((f"stylize_many_abc[{name}]", lambda p=path: stylize_many(p, "abc"), megapixels))
+
+        # A person-sized blob in the middle of the frame for the bubble search
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.ellipse(mask, (width // 2, height // 2), (width // 8, height // 3), 0, 0, 360, 255, -1)
+        axes = (width // 4, height // 6)
+        cases.append((
+            f"create_bubble_mask[{name}]",
+            lambda m=mask, a=axes, w=width, h=height: create_bubble_mask(
+                (h, w), a, character_mask=m, proximity_target=(w // 2, h // 3)),
+            megapixels,
+        ))
+
+        # Six people in one label map for the mask overlay
+        labels = np.zeros((height, width), dtype=np.uint8)
+        for person in range(6):
+            x = width * (person + 1) // 8
+            cv2.ellipse(labels, (x, height // 2), (width // 20, height // 3), 0, 0, 360, person + 1, -1)
+        image = make_image(width, height)
+        cases.append((
+            f"draw_label_overlay[{name}]",
+            lambda i=image, l=labels: draw_label_overlay(i, l, outline=2),
+            megapixels,
+        ))
+
+    for count in LAYOUT_FRAME_COUNTS:
+        cases.append((
+            f"generate_manga_layout[{count}]",
+            lambda c=count: generate_manga_layout(num_frames=c, seed=42, std_dev=0.05, margin=8),
+            None,
+        ))
+        frames = generate_manga_layout(num_frames=count, seed=42, std_dev=0.05, margin=8)
+        images = [fixtures.panels[i % len(fixtures.panels)] for i in range(count)]
+        cases.append((
+            f"create_manga_page[{count}]",
+            lambda i=images, f=frames: create_manga_page(i, f),
+            None,
+        ))
+
+    # All styles of an 8-panel page from 720p JPEG uploads; thumbnails go to the fixture directory
+    from core.config import settings
+    from services.manga_processor import render_style_previews
+    settings.OUTPUT_DIR = fixtures.root
+    uploads = []
+    for i in range(8):
+        path = os.path.join(fixtures.root, f"upload_{i}.jpg")
+        cv2.imwrite(path, make_image(1280, 720, seed=i))
+        uploads.append(path)
+    cases.append(("render_style_previews[8]", lambda: asyncio.run(render_style_previews(uploads)), None))
+
+    if include_speech:
+        process_audio, model_label = load_speech_module()
+        # speech2text resolves paths inside its audio directory; absolute paths pass through os.path.join
+        cases.append((
+            f"speech2text[{model_label}]",
+            lambda: process_audio.speech2text(fixtures.audio_path, language="en"),
+            None,
+        ))
+    return cases
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def run(args):
+    resolutions = ["480p", "1080p"] if args.quick else list(RESOLUTIONS)
+    rounds = 3 if args.quick else args.rounds
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="vid2manga-bench-") as root:
+        fixtures = Fixtures(root, resolutions)
+        for name, fn, megapixels in build_cases(fixtures, include_speech=not args.no_speech):
+            if args.only and not any(token in name for token in args.only):
+                continue
+            stats = measure(fn, rounds=rounds, min_time=args.min_time)
+            if megapixels:
+                stats["megapixels_per_second"] = megapixels / stats["median"]
+            results[name] = stats
+            print(f"{name:40s} median {stats['median'] * 1000:10.2f} ms  ({stats['rounds']} rounds)")
+    return {"environment": environment(), "results": results}
+
+def compare(current, baseline, threshold):
+    """
+    Compare medians against a baseline report.
+    Returns a list of (case, baseline_median, current_median, ratio, regressed).
+    """
+    rows = []
+    for name, stats in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = stats["median"] / base["median"] if base["median"] else float("inf")
+        rows.append((name, base["median"], stats["median"], ratio, ratio > 1.0 + threshold))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vid2Manga hot path benchmarks")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON report")
+    parser.add_argument("--rounds", type=int, default=5, help="timed rounds per case")
+    parser.add_argument("--min-time", type=float, default=0.0, help="minimum seconds spent per case")
+    parser.add_argument("--quick", action="store_true", help="skip 4K fixtures and use 3 rounds")
+    parser.add_argument("--only", nargs="*", help="run only cases whose name contains one of these")
+    parser.add_argument("--no-speech", action="store_true", help="skip the speech2text case")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown before a case counts as a regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare(report, baseline, args.threshold)
+        regressions = [row for row in rows if row[4]]
+        print(f"\n{'case':40s} {'baseline':>12s} {'current':>12s} {'ratio':>8s}")
+        for name, base, current, ratio, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:40s} {base * 1000:10.2f}ms {current * 1000:10.2f}ms {ratio:8.2f}{flag}")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
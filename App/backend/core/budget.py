@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from PIL import Image
+
+from core.config import settings
+from core.metrics import registry
+
+class PixelBudget:
+    """
+    Asynchronous semaphore counted in pixels.
+
+    A reservation larger than the whole budget is clamped to it, so an oversized
+    image still runs (alone) instead of waiting forever. Waiters are served in
+    FIFO order: a large reservation is not starved by a stream of small ones, and
+    reservations made in order by one job are granted in that order.
+
+    Accounting is protected by a thread lock and waiters are woken with
+    call_soon_threadsafe, so one budget can be shared by requests running on
+    different event loops or released from worker threads.
+    """
+
+    def __init__(self, limit: int, name: Optional[str] = None):
+        self.limit = max(1, int(limit))
+        self.name = name
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def _report(self):
+        if self.name:
+            registry.set_gauge("pixel_budget_in_use", self.in_use, {"budget": self.name})
+            registry.set_gauge("pixel_budget_waiters", len(self._waiters), {"budget": self.name})
+
+    def _wake(self):
+        # Caller holds the lock
+        while self._waiters and self.in_use + self._waiters[0][0] <= self.limit:
+            pixels, loop, future = self._waiters.popleft()
+            self.in_use += pixels
+            loop.call_soon_threadsafe(self._grant, future, pixels)
+
+    def _grant(self, future, pixels):
+        if future.cancelled():
+            # The waiter gave up after being granted; hand the pixels back
+            self.release(pixels)
+        else:
+            future.set_result(None)
+
+    async def acquire(self, pixels: int) -> int:
+        """Wait until `pixels` (clamped to the limit) are available. Returns the amount reserved."""
+        pixels = min(max(0, int(pixels)), self.limit)
+        with self._lock:
+            if not self._waiters and self.in_use + pixels <= self.limit:
+                self.in_use += pixels
+                self._report()
+                return pixels
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            entry = (pixels, loop, future)
+            self._waiters.append(entry)
+            self._report()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    self._wake()
+                    self._report()
+                    raise
+            if future.done() and not future.cancelled():
+                self.release(pixels)
+            raise
+        return pixels
+
+    def release(self, pixels: int) -> None:
+        with self._lock:
+            self.in_use -= pixels
+            self._wake()
+            self._report()
+
+    @asynccontextmanager
+    async def reserve(self, pixels: int):
+        reserved = await self.acquire(pixels)
+        try:
+            yield reserved
+        finally:
+            self.release(reserved)
+
+def image_pixels(path: str) -> int:
+    """Pixel count of an image file read from its header (no decoding), or 0 if unreadable."""
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        return 0
+    return width * height
+
+# Shared by every job in this worker process
+pixel_budget = PixelBudget(settings.PIXEL_BUDGET_TOTAL, name="global")
+
+registry.describe("pixel_budget_in_use", "Pixels currently reserved from a processing budget.")
+registry.describe("pixel_budget_waiters", "Reservations waiting for a processing budget.")
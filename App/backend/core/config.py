@@ -10,6 +10,59 @@ class Settings:
 
     CORS_ORIGINS: list = ["*"]
 
+    # Task storage: "sqlite" (shared across workers, survives restarts) or "memory"
+    TASK_STORE_BACKEND: str = os.getenv("TASK_STORE_BACKEND", "sqlite")
+    TASK_DB_PATH: str = os.getenv("TASK_DB_PATH", os.path.join(BASE_DIR, "data", "tasks.db"))
+    # Finished tasks older than this are evicted (0 keeps them forever)
+    TASK_TTL_SECONDS: int = int(os.getenv("TASK_TTL_SECONDS", 24 * 60 * 60))
+    TASK_CACHE_SIZE: int = int(os.getenv("TASK_CACHE_SIZE", 1024))
+
+    # Upper bound for cached demux/transcription results (OUTPUT_DIR/cache)
+    RESULT_CACHE_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+    # Transcribe only the speech spans of uploaded audio (silence, noise and music are skipped)
+    TRIM_SILENCE: bool = os.getenv("TRIM_SILENCE", "1") == "1"
+
+    # Long jobs checkpoint their stages under OUTPUT_DIR/checkpoints and resume after a restart.
+    # Transcription is done (and checkpointed) in chunks of this many seconds of audio.
+    TRANSCRIBE_CHUNK_SECONDS: int = int(os.getenv("TRANSCRIBE_CHUNK_SECONDS", 600))
+    # A running job touches its lease this often; jobs whose lease is older than
+    # CHECKPOINT_STALE_SECONDS lost their worker and are resumed by another one
+    CHECKPOINT_HEARTBEAT_SECONDS: float = float(os.getenv("CHECKPOINT_HEARTBEAT_SECONDS", 15))
+    CHECKPOINT_STALE_SECONDS: float = float(os.getenv("CHECKPOINT_STALE_SECONDS", 60))
+    # Checkpoints of failed jobs are kept this long for a retry of the same upload
+    CHECKPOINT_TTL_SECONDS: int = int(os.getenv("CHECKPOINT_TTL_SECONDS", 24 * 60 * 60))
+    # /export of a running task checks for newly saved pages this often
+    EXPORT_POLL_SECONDS: float = float(os.getenv("EXPORT_POLL_SECONDS", 1.0))
+    RESUME_JOBS: bool = os.getenv("RESUME_JOBS", "1") == "1"
+
+    # Capacity of the queues between /video-to-manga stages (bounds frames in flight)
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+
+    # Pixels of full-resolution images that may be decoded/stylized at once, per job and
+    # across all jobs of this worker (a 4K frame is ~8.3M pixels, ~25 MB per RGB copy).
+    # Jobs wait for budget instead of exhausting memory.
+    PIXEL_BUDGET_PER_JOB: int = int(os.getenv("PIXEL_BUDGET_PER_JOB", 40_000_000))
+    PIXEL_BUDGET_TOTAL: int = int(os.getenv("PIXEL_BUDGET_TOTAL", 160_000_000))
+
+    # Person segmentation backend: "torch" (eager PyTorch) or "onnx" (ONNX Runtime on CPU,
+    # exported once and cached in SEGMENTER_ONNX_DIR). SEGMENTER_THREADS=0 uses all cores.
+    SEGMENTER_BACKEND: str = os.getenv("SEGMENTER_BACKEND", "torch")
+    SEGMENTER_ONNX_DIR: str = os.getenv("SEGMENTER_ONNX_DIR", os.path.join(BASE_DIR, "data", "onnx"))
+    SEGMENTER_THREADS: int = int(os.getenv("SEGMENTER_THREADS", 0))
+
+    # Frames whose 64-bit perceptual hashes differ by at most this many bits are near-duplicates
+    DEDUP_HAMMING_THRESHOLD: int = int(os.getenv("DEDUP_HAMMING_THRESHOLD", 6))
+
+    # Models loaded in the background at startup instead of on the first request that needs them.
+    # Comma separated: "whisper", "segmenter". Empty keeps startup fast and loads lazily.
+    WARMUP_MODELS: list = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+
+    # Required in the X-Admin-Token header for admin-only features such as profiling.
+    # Admin features are disabled when unset.
+    ADMIN_TOKEN: str | None = os.getenv("ADMIN_TOKEN") or None
+    PROFILE_SAMPLE_INTERVAL: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+
 settings = Settings()
 
 os.makedirs(settings.INPUT_DIR, exist_ok=True)
@@ -0,0 +1,197 @@
+import bisect
+import functools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Seconds; covers quick layout calls up to long transcriptions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, math.inf)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted((labels or {}).items()))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe metrics registry rendered in the Prometheus text format.
+    Values are per process; with several uvicorn workers each one reports its own.
+    """
+
+    def __init__(self, prefix: str = "vid2manga"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: list[Callable[["MetricsRegistry"], None]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set_counter(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Mirror a monotonically increasing value that is counted elsewhere."""
+        with self._lock:
+            self._counters.setdefault(name, {})[_labels(labels)] = value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def register_collector(self, collector: Callable[["MetricsRegistry"], None]) -> None:
+        """Register a callback that refreshes gauges/counters right before rendering."""
+        self._collectors.append(collector)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector(self)
+
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    full_name = f"{self.prefix}_{name}"
+                    if name in self._help:
+                        lines.append(f"# HELP {full_name} {self._help[name]}")
+                    lines.append(f"# TYPE {full_name} {kind}")
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+
+            for name, series in sorted(self._histograms.items()):
+                full_name = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(labels, ("le", _format_value(bound)))
+                        lines.append(f"{full_name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+registry.describe("stage_duration_seconds", "Latency of a processing stage.")
+registry.describe("stage_bytes_total", "Bytes read by a processing stage.")
+registry.describe("pipeline_queue_depth", "Items waiting in a /video-to-manga stage queue.")
+
+class TaskTimings:
+    """Per-task accumulation of stage latencies, safe to update from worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                stage: {"calls": int(entry["calls"]), "seconds": round(entry["seconds"], 4)}
+                for stage, entry in self.stages.items()
+            }
+
+# Threadpool calls copy the context, so stages running off the event loop still report to their task
+_current_timings: ContextVar[Optional[TaskTimings]] = ContextVar("current_timings", default=None)
+
+@contextmanager
+def collect_timings():
+    """Collect the latency of every `timed` stage run inside this block (per task)."""
+    timings = TaskTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+@contextmanager
+def timed(stage: str, nbytes: int = 0):
+    """
+    Time a block as `stage`: records the latency histogram, the bytes processed
+    and the per-task breakdown of the surrounding `collect_timings` block.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("stage_duration_seconds", elapsed, {"stage": stage})
+        if nbytes:
+            registry.inc("stage_bytes_total", nbytes, {"stage": stage})
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+def timed_fn(stage: str):
+    """Decorator form of `timed`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def file_size(path: str) -> int:
+    """Size of a file in bytes, or 0 if it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
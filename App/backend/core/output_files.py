@@ -0,0 +1,162 @@
+import gzip
+import mimetypes
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from core.config import settings
+
+# Output names are UUID or content-hash based and never rewritten with other content,
+# so clients may cache them for a year without revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Internal state kept under OUTPUT_DIR that is not an output
+HIDDEN_DIRS = ("cache", "checkpoints")
+
+# Precompressed siblings, in order of preference: <name>.br, <name>.gz
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Read size when streaming files (Starlette's default is 64 KiB): fewer reads and
+# ASGI messages per request for multi-GB videos
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def _accepted_encodings(request_headers: Headers) -> set:
+    accepted = set()
+    for item in request_headers.get("accept-encoding", "").split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.lower())
+    return accepted
+
+class OutputFiles(StaticFiles):
+    """
+    Serves the generated outputs under /output.
+
+    Compared to a bare StaticFiles mount:
+        - the directory is settings.OUTPUT_DIR at request time (not at import)
+        - responses carry `Cache-Control: immutable` and a strong ETag built from
+          size and mtime in nanoseconds (no hashing of multi-GB videos)
+        - a `<name>.br` / `<name>.gz` sibling written by precompress() is served
+          with Content-Encoding when the client accepts it (Vary: Accept-Encoding)
+        - internal directories (result cache, checkpoints) are not served
+
+    Range requests (single and multipart, If-Range, 416) and If-None-Match /
+    If-Modified-Since (304) are handled by Starlette's FileResponse and
+    StaticFiles. Full responses use the ASGI `http.response.pathsend` extension
+    when the server offers it, so the server can send the file zero-copy;
+    otherwise files are streamed in STREAM_CHUNK_SIZE reads.
+    """
+
+    def __init__(self):
+        super().__init__(directory=None, check_dir=False)
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        if path.startswith(("/", "\\")) or path.split(os.sep)[0] in HIDDEN_DIRS:
+            return "", None
+        directory = os.path.realpath(settings.OUTPUT_DIR)
+        full_path = os.path.realpath(os.path.join(directory, path))
+        if os.path.commonpath([full_path, directory]) != directory:
+            # Don't allow misbehaving clients to break out of the output directory
+            return "", None
+        try:
+            return full_path, os.stat(full_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return "", None
+
+    @staticmethod
+    def _variant(full_path: str, stat_result: os.stat_result, request_headers: Headers):
+        accepted = _accepted_encodings(request_headers)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            # A variant older than the file belongs to earlier contents
+            if variant_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+                return encoding, full_path + suffix, variant_stat
+        return None, full_path, stat_result
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        encoding, served_path, served_stat = self._variant(full_path, stat_result, request_headers)
+
+        headers = {
+            "cache-control": IMMUTABLE_CACHE_CONTROL,
+            # Strong validator; every encoding is a different representation with its own tag
+            "etag": f'"{served_stat.st_size:x}-{served_stat.st_mtime_ns:x}"',
+        }
+        if any(os.path.exists(full_path + suffix) for _, suffix in ENCODINGS):
+            headers["vary"] = "Accept-Encoding"
+        if encoding:
+            headers["content-encoding"] = encoding
+
+        response = FileResponse(
+            served_path,
+            status_code=status_code,
+            headers=headers,
+            media_type=mimetypes.guess_type(full_path)[0] or "application/octet-stream",
+            stat_result=served_stat,
+        )
+        response.chunk_size = STREAM_CHUNK_SIZE
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+def precompress(path: str, min_ratio: float = 0.9) -> list:
+    """
+    Write `<path>.gz` (and `<path>.br` when the optional `brotli` package is
+    installed) next to an output, for OutputFiles to serve to clients that accept
+    them. Only worth it for compressible outputs (text, JSON, .npz), not for
+    PNG/JPEG/MP4. Variants that do not shrink the file below min_ratio are skipped.
+
+    Returns:
+        list of the written variant paths
+    """
+    size = os.path.getsize(path)
+    written = []
+    compressors = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+        compressors.insert(0, (".br", lambda data: brotli.compress(data, quality=11)))
+    except ImportError:
+        pass
+
+    with open(path, "rb") as f:
+        data = f.read()
+    for suffix, compress in compressors:
+        compressed = compress(data)
+        if len(compressed) > min_ratio * size:
+            continue
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp_path, path + suffix)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        written.append(path + suffix)
+    return written
@@ -5,13 +5,33 @@ from core.config import settings
 if settings.BASE_DIR not in sys.path:
     sys.path.append(settings.BASE_DIR)
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from api.v1.api import router as api_router
+from services.warmup import warm_up
+from services.checkpoints import recovery_loop
+from core.output_files import OutputFiles
 import uvicorn
 
-app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy models load lazily on first use; optionally preload them in the
+    # background so the server accepts requests right away
+    warmup = None
+    if settings.WARMUP_MODELS:
+        warmup = asyncio.ensure_future(run_in_threadpool(warm_up, settings.WARMUP_MODELS))
+    # Jobs interrupted by a restart (or by a worker that died) continue from their checkpoints
+    recovery = asyncio.ensure_future(recovery_loop()) if settings.RESUME_JOBS else None
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    if recovery is not None:
+        recovery.cancel()
+
+app = FastAPI(title=settings.PROJECT_NAME, version=settings.PROJECT_VERSION, lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -22,8 +42,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount the output directory to serve files (StaticFiles)
-app.mount("/output", StaticFiles(directory=settings.OUTPUT_DIR), name="output")
+# Serve the generated outputs (immutable caching, ETags, Range requests, precompressed variants)
+app.mount("/output", OutputFiles(), name="output")
 
 # Include the router
 app.include_router(api_router)
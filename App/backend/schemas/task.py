@@ -0,0 +1,23 @@
+import time
+from enum import Enum
+from typing import Dict, Any, Optional
+from pydantic import BaseModel, Field
+
+class TaskStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+# Tasks in these states are never modified again, so they can be cached and evicted
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+class Task(BaseModel):
+    id: str
+    status: TaskStatus
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # Identifies the work a task performs (e.g. content hash + parameters) for deduplication
+    key: Optional[str] = None
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
@@ -0,0 +1,374 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from core.config import settings
+from schemas.task import TaskStatus
+from services.result_cache import _to_builtin
+from services.task_manager import get_task, restore_task, update_task_error
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"), ensure_ascii=False, default=_to_builtin)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def checkpoint_root() -> str:
+    # Resolved at call time so checkpoints follow settings.OUTPUT_DIR
+    return os.path.join(settings.OUTPUT_DIR, "checkpoints")
+
+def job_key(kind: str, content_hash: str, params: Dict[str, Any]) -> str:
+    """Identify a job by its input and parameters, so a retry of the same work finds its checkpoint."""
+    payload = json.dumps({"kind": kind, "content_hash": content_hash, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ChunkStore:
+    """
+    Dict-like store of finished chunk results, one JSON file per chunk.
+    Passed to transcribe_pcm as `chunks`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        entry = _read_json(self._path(key))
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key: str, value: Dict[str, Any]) -> None:
+        _write_json(self._path(key), value)
+
+    def __len__(self) -> int:
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+class JobCheckpoint:
+    """
+    Progress of a long background job, kept under OUTPUT_DIR/checkpoints/<job_key>/.
+
+        manifest.json: kind, task, arguments to restart the job with, finished
+            stages (e.g. demux outputs) and rendered pages
+        chunks/<name>/: per-chunk transcription results (ChunkStore)
+        lease: touched every CHECKPOINT_HEARTBEAT_SECONDS while a worker runs the job
+
+    A job whose lease has not been touched for CHECKPOINT_STALE_SECONDS lost its
+    worker (restart, crash, preempted instance) and is resumed by
+    resume_orphaned_jobs. The manifest is rewritten atomically after every step,
+    so a crash never leaves it half written.
+    """
+
+    def __init__(self, key: str, root: Optional[str] = None):
+        self.key = key
+        self.directory = os.path.join(root or checkpoint_root(), key)
+        self.lease_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    @property
+    def lease_path(self) -> str:
+        return os.path.join(self.directory, "lease")
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        return _read_json(self.manifest_path)
+
+    def _update(self, change: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            manifest = self.read() or {}
+            change(manifest)
+            manifest["updated_at"] = time.time()
+            _write_json(self.manifest_path, manifest)
+
+    def lease_age(self, now: Optional[float] = None) -> float:
+        try:
+            return (now or time.time()) - os.path.getmtime(self.lease_path)
+        except FileNotFoundError:
+            return float("inf")
+
+    def is_stale(self) -> bool:
+        return self.lease_age() > settings.CHECKPOINT_STALE_SECONDS
+
+    def heartbeat(self) -> None:
+        try:
+            os.utime(self.lease_path)
+        except FileNotFoundError:
+            pass
+
+    def stage(self, name: str) -> Optional[Any]:
+        """Output of a finished stage, or None."""
+        return (self.read() or {}).get("stages", {}).get(name)
+
+    def complete_stage(self, name: str, value: Any) -> None:
+        self._update(lambda manifest: manifest.setdefault("stages", {}).__setitem__(name, value))
+
+    def pages(self) -> Dict[int, str]:
+        """Rendered pages by index whose files still exist."""
+        pages = (self.read() or {}).get("pages", {})
+        return {
+            int(index): url for index, url in pages.items()
+            if os.path.exists(os.path.join(settings.OUTPUT_DIR, url[len("/output/"):]))
+        }
+
+    def save_page(self, index: int, url: str) -> None:
+        self._update(lambda manifest: manifest.setdefault("pages", {}).__setitem__(str(index), url))
+
+    def chunks(self, name: str) -> ChunkStore:
+        return ChunkStore(os.path.join(self.directory, "chunks", name))
+
+    def release(self) -> None:
+        """Stop the heartbeat and keep the checkpoint, so a retry or the recovery loop can resume it."""
+        _heartbeats.remove(self)
+        try:
+            os.utime(self.lease_path, (0, 0))
+        except FileNotFoundError:
+            pass
+
+    def finish(self) -> None:
+        """The job completed: stop the heartbeat and delete its checkpoint (the outputs stay)."""
+        _heartbeats.remove(self)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class _Heartbeats:
+    """One daemon thread touching the lease of every checkpoint this process is running."""
+
+    def __init__(self):
+        self._active: Dict[str, JobCheckpoint] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, checkpoint: JobCheckpoint) -> None:
+        with self._lock:
+            self._active[checkpoint.directory] = checkpoint
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="checkpoint-heartbeat", daemon=True)
+                self._thread.start()
+
+    def remove(self, checkpoint: JobCheckpoint) -> None:
+        with self._lock:
+            self._active.pop(checkpoint.directory, None)
+
+    def running(self, directory: str) -> bool:
+        with self._lock:
+            return directory in self._active
+
+    def _run(self):
+        while True:
+            time.sleep(settings.CHECKPOINT_HEARTBEAT_SECONDS)
+            with self._lock:
+                active = list(self._active.values())
+            for checkpoint in active:
+                checkpoint.heartbeat()
+
+_heartbeats = _Heartbeats()
+
+@contextmanager
+def _claim_lock(directory: str, timeout: float = 5.0):
+    # Cross-process mutex for taking over a checkpoint (O_EXCL works on every OS and on shared volumes)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "claim.lock")
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                # A claimer that died while holding the lock
+                if time.time() - os.path.getmtime(path) > timeout:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"Could not lock checkpoint {directory}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _claim(checkpoint: JobCheckpoint, task_id: str) -> bool:
+    """Take over a checkpoint unless another live worker is running it for a different task."""
+    with _claim_lock(checkpoint.directory):
+        manifest = checkpoint.read()
+        if manifest and manifest.get("task_id") != task_id and not checkpoint.is_stale():
+            return False
+        if _heartbeats.running(checkpoint.directory):
+            return False
+        checkpoint.lease_id = uuid.uuid4().hex
+        with open(checkpoint.lease_path, "w", encoding="utf-8") as f:
+            f.write(checkpoint.lease_id)
+    _heartbeats.add(checkpoint)
+    return True
+
+def open_checkpoint(
+    kind: str,
+    task_id: str,
+    args: Dict[str, Any],
+    content_hash: Optional[str] = None,
+    params: Optional[Dict[str, Any]] = None,
+) -> JobCheckpoint:
+    """
+    Open (or resume) the checkpoint of a job and start its heartbeat.
+
+    Jobs with a content_hash are keyed by their input and parameters, so a retried
+    upload continues where the failed attempt stopped. If that checkpoint is being
+    run right now by another task, the job falls back to a checkpoint of its own.
+
+    Args:
+        kind: job type, used by resume_orphaned_jobs to find its runner
+        task_id: the task running the job
+        args: JSON-serializable keyword arguments that restart the job
+        content_hash: hash of the uploaded input, if known
+        params: parameters that change the job's outputs (part of the key)
+    """
+    if content_hash:
+        checkpoint = JobCheckpoint(job_key(kind, content_hash, params or {}))
+        if not _claim(checkpoint, task_id):
+            checkpoint = None
+    else:
+        checkpoint = None
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(job_key(kind, task_id, {}))
+        _claim(checkpoint, task_id)
+
+    task = get_task(task_id)
+    # The deduplication key is restored with the task if the task store loses it
+    task_key = task.key if task is not None else None
+
+    def start(manifest):
+        resumed = manifest.get("task_id") is not None
+        manifest.update({"kind": kind, "task_id": task_id, "task_key": task_key, "args": args})
+        manifest.setdefault("created_at", time.time())
+        manifest.setdefault("stages", {})
+        manifest.setdefault("pages", {})
+        if resumed:
+            manifest["resumed"] = manifest.get("resumed", 0) + 1
+
+    checkpoint._update(start)
+    return checkpoint
+
+# kind -> coroutine function called as runner(task_id, **args)
+_RUNNERS: Dict[str, Callable[..., Awaitable[None]]] = {}
+
+def register_resumable(kind: str, runner: Callable[..., Awaitable[None]]) -> None:
+    """Register the job function that resume_orphaned_jobs calls for checkpoints of this kind."""
+    _RUNNERS[kind] = runner
+
+def orphaned_checkpoints(root: Optional[str] = None) -> List[JobCheckpoint]:
+    """Checkpoints whose lease went stale, i.e. no worker is running them anymore."""
+    root = root or checkpoint_root()
+    if not os.path.isdir(root):
+        return []
+    orphans = []
+    for name in sorted(os.listdir(root)):
+        checkpoint = JobCheckpoint(name, root)
+        if not _heartbeats.running(checkpoint.directory) and checkpoint.is_stale():
+            orphans.append(checkpoint)
+    return orphans
+
+def has_live_checkpoint(task_id: str, root: Optional[str] = None) -> bool:
+    """Whether a worker is running the task right now, i.e. one of its checkpoints has a fresh lease."""
+    root = root or checkpoint_root()
+    if not os.path.isdir(root):
+        return False
+    for name in os.listdir(root):
+        checkpoint = JobCheckpoint(name, root)
+        if not checkpoint.is_stale() and (checkpoint.read() or {}).get("task_id") == task_id:
+            return True
+    return False
+
+async def resume_orphaned_jobs() -> List[str]:
+    """
+    Restart the interrupted jobs of orphaned checkpoints.
+
+    Pending/processing tasks (or tasks lost with an in-memory store) are claimed
+    and their job is started again with the arguments from the manifest; it then
+    skips every stage, chunk and page that is already checkpointed. Checkpoints
+    of completed tasks are deleted, those of failed tasks are kept for a retry
+    until CHECKPOINT_TTL_SECONDS. Returns the ids of the resumed tasks.
+    """
+    resumed = []
+    for checkpoint in orphaned_checkpoints():
+        manifest = checkpoint.read()
+        if not manifest or "task_id" not in manifest:
+            if checkpoint.lease_age() > settings.CHECKPOINT_TTL_SECONDS:
+                shutil.rmtree(checkpoint.directory, ignore_errors=True)
+            continue
+        task_id = manifest["task_id"]
+        task = get_task(task_id)
+        if task is not None and task.status == TaskStatus.COMPLETED:
+            shutil.rmtree(checkpoint.directory, ignore_errors=True)
+            continue
+        if task is not None and task.status == TaskStatus.FAILED:
+            if time.time() - manifest.get("updated_at", 0) > settings.CHECKPOINT_TTL_SECONDS:
+                shutil.rmtree(checkpoint.directory, ignore_errors=True)
+            continue
+
+        runner = _RUNNERS.get(manifest.get("kind"))
+        if runner is None:
+            continue
+        # Claim before starting so other workers scanning at the same time skip it
+        try:
+            if not _claim(checkpoint, task_id):
+                continue
+        except TimeoutError:
+            continue
+        if task is None:
+            restore_task(task_id, key=manifest.get("task_key"))
+        if not os.path.exists(manifest["args"].get("file_location", "")):
+            update_task_error(task_id, "Processing failed: input file is no longer available")
+            checkpoint.finish()
+            continue
+        print(f"Resuming interrupted {manifest['kind']} task {task_id}")
+        # The job re-opens the checkpoint itself and takes over the lease
+        _heartbeats.remove(checkpoint)
+        asyncio.ensure_future(runner(task_id, **manifest["args"]))
+        resumed.append(task_id)
+    return resumed
+
+async def recovery_loop():
+    """Resume orphaned jobs at startup and then every CHECKPOINT_STALE_SECONDS (for workers that die later)."""
+    while True:
+        try:
+            await resume_orphaned_jobs()
+        except Exception as e:
+            print(f"Checkpoint recovery failed: {e}")
+        await asyncio.sleep(settings.CHECKPOINT_STALE_SECONDS)
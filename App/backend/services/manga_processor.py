@@ -1,35 +1,323 @@
+import asyncio
 import os
 import sys
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
+from starlette.concurrency import run_in_threadpool
 
 from core.config import settings
+from core.metrics import registry, timed, file_size
+from core.budget import PixelBudget, pixel_budget, image_pixels
+from services.task_manager import merge_task_result
 
 if settings.BASE_DIR not in sys.path:
     sys.path.append(settings.BASE_DIR)
 
-from Frame.frame_processor import stylize_a, stylize_b, stylize_c, cv2_to_pil
+from Frame.frame_processor import stylize_a, stylize_b, stylize_c, cv2_to_pil, default_engine, sharpness_score, STYLE_OUTPUTS
 from Frame.manga_layout import generate_manga_layout, create_manga_page
-from Frame.detection import PersonSegmenter
+from Frame.dedup import dedup_frames
+from Frame.pagination import panel_importance, panel_range, paginate
+from Frame.detection import (
+    create_segmenter, TieredPersonSegmenter, TemporalMaskPropagator, SEGMENT_MODES,
+    segmentation_labels, masks_to_label_map
+)
 import uuid
 
-segmenter = PersonSegmenter()
+def _segmenter_options():
+    if settings.SEGMENTER_BACKEND == "onnx":
+        return {"cache_dir": settings.SEGMENTER_ONNX_DIR, "intra_op_threads": settings.SEGMENTER_THREADS}
+    return {}
+
+segmenter = create_segmenter(settings.SEGMENTER_BACKEND, **_segmenter_options())
+# HOG person boxes first, Mask2Former (the segmenter above) only when needed
+fast_segmenter = TieredPersonSegmenter(precise=segmenter)
+
+registry.describe("segment_tier_total", "Frames segmented per tier in segment_mode=speed.")
+registry.describe("segment_temporal_total", "Video frames segmented as anchors or by mask propagation.")
+
+def temporal_segmenter(segment_mode="accuracy", precise=False):
+    """
+    Mask propagator for the frames of one video: anchors are segmented with the
+    tier for `segment_mode`, the frames in between get optical-flow warped masks.
+    """
+    if segment_mode == "speed":
+        return TemporalMaskPropagator(fast_segmenter, precise=precise)
+    return TemporalMaskPropagator(segmenter)
+
+def segment_people(path, segment_mode="accuracy", precise=False, propagator=None):
+    """
+    Person label map for an image file: uint8, 0 for background and i + 1 for the i-th person.
+
+    segment_mode:
+        "accuracy": always run the segmentation model
+        "speed": coarse masks from the HOG detector, escalating to the model for
+            ambiguous detections or when precise outlines are needed (precise=True)
+
+    propagator: a temporal_segmenter() for consecutive video frames (takes precedence)
+    """
+    if propagator is not None:
+        with timed("segment_temporal"):
+            _, instance_map, person_masks, outputs = propagator.segment(path)
+        registry.inc("segment_temporal_total", labels={"result": outputs["temporal"]})
+    elif segment_mode == "speed":
+        with timed("segment_speed"):
+            _, instance_map, person_masks, outputs = fast_segmenter.segment(path, precise=precise)
+        registry.inc("segment_tier_total", labels={"tier": outputs["tier"]})
+    else:
+        with timed("segment"):
+            _, instance_map, person_masks, outputs = segmenter.segment(path)
+    return segmentation_labels(instance_map, person_masks, outputs)
+
+# Instance colors (RGB); the first person keeps the original red
+MASK_PALETTE = (
+    (255, 0, 0), (0, 160, 255), (60, 200, 60), (255, 170, 0),
+    (200, 0, 200), (0, 210, 200), (255, 90, 150), (140, 110, 255),
+)
+
+def _color_lut(colors):
+    lut = np.zeros((256, 3), dtype=np.uint8)
+    colors = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    lut[1:] = colors[np.arange(255) % len(colors)]
+    return lut
+
+def draw_label_overlay(image_np, labels, colors=MASK_PALETTE, alpha=0.5, outline=0, out=None):
+    """
+    Tint every person of a label map (0 = background, i + 1 = person i) in one pass.
+
+    The colors come from a 256-entry cv2.LUT, the whole frame is blended once with
+    cv2.addWeighted and copied back only where labels > 0 (cv2.copyTo), so the
+    cost does not depend on the number of people.
+
+    Args:
+        image_np: RGB uint8 image.
+        labels: uint8 label map with the image's height and width.
+        colors: RGB color per person, cycled when there are more people than colors.
+        alpha: Opacity of the tint.
+        outline: Thickness in pixels of an opaque outline around each person (0 for none).
+        out: Output array; pass image_np to draw in place. A new array by default.
+
+    Returns:
+        The RGB image with the overlay.
+    """
+    if out is None:
+        out = image_np.copy()
+    elif out is not image_np:
+        np.copyto(out, image_np)
+    if not labels.any():
+        return out
+
+    lut = _color_lut(colors).reshape(256, 1, 3)
+    tint = cv2.LUT(cv2.merge([labels] * 3), lut)
+    blended = cv2.addWeighted(image_np, 1 - alpha, tint, alpha, 0)
+    cv2.copyTo(blended, labels, out)
+
+    if outline > 0:
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * outline + 1, 2 * outline + 1))
+        # Non-zero where the label changes within the kernel: instance/background and instance/instance borders
+        edges = cv2.morphologyEx(labels, cv2.MORPH_GRADIENT, kernel)
+        dilated = cv2.dilate(labels, kernel)
+        cv2.copyTo(cv2.LUT(cv2.merge([dilated] * 3), lut), edges, out)
+    return out
 
 def draw_masks_on_image(image_np, masks, color=(255, 0, 0), alpha=0.5):
     """
     Draw red masks on the image (RGB).
+    Kept for callers holding a list of masks; returns a new image.
+    """
+    masks = [mask for mask in masks if mask.ndim == 2]
+    if not masks:
+        return image_np.copy()
+    labels = masks_to_label_map(masks, image_np.shape[:2])
+    return draw_label_overlay(image_np, labels, colors=[color], alpha=alpha)
+
+def collapse_duplicates(image_paths, threshold=None):
     """
-    # Create a copy to avoid modifying the original if shared
-    result = image_np.copy()
-    
-    for mask in masks:
-        mask_indices = mask > 0
-        if len(mask_indices.shape) == 2:
-            # Binary mask, broadcast to 3 channels
-            result[mask_indices] = (result[mask_indices] * (1 - alpha) + np.array(color) * alpha).astype(np.uint8)
-            
-    return result
+    Replace runs of near-duplicate images by their sharpest member, placed where
+    the first one appeared. Returns (image_paths, number_of_images_removed, sharpness),
+    sharpness being the Laplacian variance of every kept image (0 if unreadable), for plan_pages.
+    """
+    threshold = settings.DEDUP_HAMMING_THRESHOLD if threshold is None else threshold
+    with timed("dedup"):
+        clusters = dedup_frames(image_paths, threshold=threshold)
+    return (
+        [cluster.representative.path for cluster in clusters],
+        len(image_paths) - len(clusters),
+        [cluster.representative.sharpness for cluster in clusters],
+    )
+
+def stylize_image(path, stylize_style='c'):
+    """
+    Stylize an image file with pipeline 'a', 'b' or 'c' (unknown styles fall back to 'c').
+    Returns an RGB array, or the original image if stylization fails, or None if unreadable.
+    """
+    if stylize_style not in ('a', 'b'):
+        stylize_style = 'c'
+    stylize = {'a': stylize_a, 'b': stylize_b, 'c': stylize_c}[stylize_style]
+    with timed(f"stylize_{stylize_style}", nbytes=file_size(path)):
+        processed_cv2 = stylize(path)
+
+    if processed_cv2 is None:
+        # Fallback to original image if processing fails
+        img = cv2.imread(path)
+        if img is not None:
+            processed_cv2 = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return processed_cv2
+
+def _process_image(path, stylize_style, segment_human, show_mask, segment_mode="accuracy"):
+    """Stylize (and optionally segment) one image. Returns a PIL image, or None if unreadable."""
+    processed_cv2 = stylize_image(path, stylize_style)
+    if processed_cv2 is None:
+        return None
+
+    # Human Segmentation
+    if segment_human:
+        try:
+            # Segment on the original image for better accuracy
+            labels = segment_people(path, segment_mode, precise=show_mask)
+
+            if show_mask:
+                # Draw masks on the stylized image (in RGB), in place: the array is ours
+                draw_label_overlay(processed_cv2, labels, out=processed_cv2)
+        except Exception as e:
+            print(f"Error during human segmentation for {path}: {e}")
+
+    return cv2_to_pil(processed_cv2)
+
+def _shrink_to_cover(img, width, height):
+    """Downscale an image as long as it still covers a width x height page."""
+    scale = max(width / img.width, height / img.height)
+    if scale >= 1:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+def _image_sharpness(path):
+    # Only compared between the images of one upload, so a reduced decode is enough
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    return None if gray is None else float(sharpness_score(gray))
+
+def plan_pages(image_paths, num_frames=8, adaptive=True, sharpness=None):
+    """
+    Split images (in reading order) into manga pages.
+
+    With `adaptive`, pages hold num_frames / 2 .. num_frames panels depending on
+    how sharp (frame_clear score) each image is compared to the others, planned
+    for the whole upload at once (Frame.pagination); unreadable images are
+    dropped. Otherwise every page but the last has num_frames panels.
+    Pass the `sharpness` scores from collapse_duplicates to skip decoding the
+    images again (unreadable ones are then skipped while the pages are written).
+
+    Returns (image_paths, page_sizes); page_sizes is None for a single page of
+    all images (num_frames <= 0).
+    """
+    if num_frames <= 0:
+        return image_paths, None
+    if not adaptive:
+        full, rest = divmod(len(image_paths), num_frames)
+        return image_paths, [num_frames] * full + ([rest] if rest else [])
+
+    with timed("paginate"):
+        if sharpness is not None:
+            return image_paths, paginate(panel_importance(sharpness), *panel_range(num_frames))
+        scores = [_image_sharpness(path) for path in image_paths]
+        for path, score in zip(image_paths, scores):
+            if score is None:
+                print(f"Skipping unreadable image {path}")
+        image_paths = [path for path, score in zip(image_paths, scores) if score is not None]
+        importance = panel_importance([score for score in scores if score is not None])
+        return image_paths, paginate(importance, *panel_range(num_frames))
+
+class _PageWriter:
+    """
+    Collects panels for the current page and saves it as soon as it is full.
+
+    With planned page sizes the layout of a page is known when its first image
+    arrives, so each image is fitted into its frame on arrival and only
+    panel-sized copies are kept. Every page is laid out for exactly its number
+    of panels: a short last page gets its own layout instead of blank padding.
+    """
+
+    def __init__(self, width, height, page_sizes, seed, task_id=None):
+        self.width = width
+        self.height = height
+        # None: a single page whose layout depends on how many images turn out readable
+        self.page_sizes = list(page_sizes) if page_sizes is not None else None
+        self.seed = seed
+        # Saved pages are published in the task's result while it runs (for /export)
+        self.task_id = task_id
+        self.page_start = 0
+        self.frames = None
+        self.images = []
+        self.added = 0
+        self.manga_urls = []
+
+    def _layout(self, count):
+        with timed("generate_manga_layout"):
+            return generate_manga_layout(
+                width=self.width,
+                height=self.height,
+                num_frames=count,
+                seed=self.seed + self.page_start,
+                std_dev=0.05,
+                margin=8
+            )
+
+    def add(self, img):
+        self.added += 1
+        if self.page_sizes is None:
+            self.images.append(_shrink_to_cover(img, self.width, self.height))
+            return
+
+        if self.frames is None:
+            self.frames = self._layout(self.page_sizes[len(self.manga_urls)])
+        _, _, w, h = self.frames[len(self.images)]
+        self.images.append(ImageOps.fit(img, (int(w), int(h)), method=Image.Resampling.LANCZOS))
+        if len(self.images) == len(self.frames):
+            self._write_page()
+
+    def skip(self):
+        """An image turned out unreadable: the following images move up one panel and the last page shrinks."""
+        if self.page_sizes is None:
+            return
+        self.page_sizes[-1] -= 1
+        if self.page_sizes[-1] == 0:
+            self.page_sizes.pop()
+
+    def finish(self):
+        if not self.images:
+            return
+        if self.page_sizes is None:
+            self.frames = self._layout(len(self.images))
+        elif len(self.images) < len(self.frames):
+            # The last page lost images after its layout was made
+            self.frames = self.frames[:len(self.images)]
+        self._write_page()
+
+    def _write_page(self):
+        # Create Manga Page
+        with timed("create_manga_page"):
+            manga_page = create_manga_page(
+                images=self.images,
+                frames=self.frames,
+                width=self.width,
+                height=self.height,
+                bg_color="white"
+            )
+
+        # Save Result
+        output_filename = f"manga_{uuid.uuid4()}.png"
+        output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
+        with timed("save_page"):
+            manga_page.save(output_path)
+        self.manga_urls.append(f"/output/{output_filename}")
+        if self.task_id:
+            merge_task_result(self.task_id, {"manga_urls": list(self.manga_urls)})
+
+        # Release the page's panels before the next page is started
+        self.page_start += len(self.images)
+        self.images = []
+        self.frames = None
 
 async def process_manga_generation(
     image_paths, 
@@ -39,86 +327,186 @@ async def process_manga_generation(
     seed=42, 
     stylize_style='c', 
     segment_human=False, 
-    show_mask=False):
-    
-    processed_images = []
-    
-    for path in image_paths:
-        # Stylize
-        if stylize_style == 'a':
-            processed_cv2 = stylize_a(path)
-        elif stylize_style == 'b':
-            processed_cv2 = stylize_b(path)
-        elif stylize_style == 'c':
-            processed_cv2 = stylize_c(path)
-        else:
-            processed_cv2 = stylize_c(path)
-            
-        if processed_cv2 is None:
-            # Fallback to original image if processing fails
-            img = cv2.imread(path)
-            if img is not None:
-                processed_cv2 = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            else:
-                continue # Skip if image cannot be read
-
-        # Human Segmentation
-        if segment_human:
+    show_mask=False,
+    segment_mode='accuracy',
+    adaptive_pages=False,
+    task_id=None,
+    sharpness=None):
+    """
+    Stylize the images and lay them out on manga pages of up to `num_frames` panels
+    (all images on one page if num_frames <= 0). With adaptive_pages the panels per
+    page follow the images' sharpness (see plan_pages); otherwise every page but
+    the last has num_frames panels. Returns the URLs of the saved pages.
+
+    Images are processed concurrently in the threadpool with bounded memory:
+        - before an image is decoded, its pixel count is reserved from a per-job
+          budget and from the worker-wide `pixel_budget`; jobs over budget wait
+        - a stylized image is fitted into its panel right away, so only a page of
+          panel-sized images is kept, and each page is saved as soon as it is full
+
+    segment_mode picks the person segmentation tier ("accuracy" or "speed", see segment_people).
+    With a task_id, every saved page is added to the task's result right away.
+    sharpness: scores from collapse_duplicates, reused to plan the pages.
+    """
+    image_paths, page_sizes = await run_in_threadpool(plan_pages, image_paths, num_frames, adaptive_pages, sharpness)
+    writer = _PageWriter(width, height, page_sizes, seed, task_id)
+    job_budget = PixelBudget(settings.PIXEL_BUDGET_PER_JOB)
+    # Panels are placed in upload order even though images finish out of order
+    turns = [asyncio.Event() for _ in range(len(image_paths) + 1)]
+    turns[0].set()
+
+    async def handle(index, path):
+        pixels = image_pixels(path)
+        async with job_budget.reserve(pixels), pixel_budget.reserve(pixels):
+            img = await run_in_threadpool(_process_image, path, stylize_style, segment_human, show_mask, segment_mode)
+            await turns[index].wait()
             try:
-                # Segment on the original image for better accuracy
-                _, _, person_masks, _ = segmenter.segment(path)
-                
-                if show_mask and person_masks:
-                    # Draw masks on the stylized image (in RGB)
-                    processed_cv2 = draw_masks_on_image(processed_cv2, person_masks)
-            except Exception as e:
-                print(f"Error during human segmentation for {path}: {e}")
-
-        pil_img = cv2_to_pil(processed_cv2)
-        processed_images.append(pil_img)
-
-    if not processed_images:
+                if img is not None:
+                    await run_in_threadpool(writer.add, img)
+                else:
+                    print(f"Skipping unreadable image {path}")
+                    writer.skip()
+            finally:
+                turns[index + 1].set()
+
+    # Stylizer scratch buffers are freed once no job is running
+    with default_engine.batch():
+        tasks = [asyncio.ensure_future(handle(i, path)) for i, path in enumerate(image_paths)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    if writer.added == 0:
         raise ValueError("No images were successfully processed.")
 
-    # Handle chunking into multiple pages
-    actual_num_frames = num_frames if num_frames > 0 else len(processed_images)
-    
-    manga_urls = []
-    
-    for i in range(0, len(processed_images), actual_num_frames):
-        chunk = processed_images[i:i + actual_num_frames]
-        
-        # Fill remaining frames with blank white images if chunk is too small
-        current_chunk_size = len(chunk)
-        if current_chunk_size < actual_num_frames:
-            blank_img = Image.new('RGB', (100, 100), "white")
-            for j in range(actual_num_frames - current_chunk_size):
-                chunk.append(blank_img)
-
-        # Generate Layout
-        frames = generate_manga_layout(
-            width=width,
-            height=height,
-            num_frames=actual_num_frames,
-            seed=seed + i, 
-            std_dev=0.05,
-            margin=8
-        )
+    await run_in_threadpool(writer.finish)
+    return writer.manga_urls
 
-        # Create Manga Page
-        manga_page = create_manga_page(
-            images=chunk,
-            frames=frames,
-            width=width,
-            height=height,
-            bg_color="white"
-        )
+PREVIEW_STYLES = tuple(STYLE_OUTPUTS)
+# Coarsest first: JPEG decoders scale in the DCT domain, other formats are resized after decoding
+_REDUCED_DECODES = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
 
-        # Save Result
-        output_filename = f"manga_{uuid.uuid4()}.png"
-        output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
-        manga_page.save(output_path)
-        
-        manga_urls.append(f"/output/{output_filename}")
-        
-    return manga_urls
+def decode_for_panel(path, panel_width, panel_height):
+    """
+    Decode an image (BGR) at the coarsest IMREAD_REDUCED factor that still covers
+    a panel_width x panel_height panel. Returns None if the image cannot be read.
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        return None
+    for factor, flag in _REDUCED_DECODES:
+        if width // factor >= panel_width and height // factor >= panel_height:
+            return cv2.imread(path, flag)
+    return cv2.imread(path)
+
+def _preview_panels(path, panel_size, styles, segment_human, show_mask, segment_mode):
+    """
+    One image in every style, fitted to its panel: a single reduced decode resized
+    to cover the panel, one graph evaluation (shared grayscale/edge stages) and at
+    most one segmentation.
+    Returns {style: PIL image}, or None if the image is unreadable.
+    """
+    panel_width, panel_height = panel_size
+    with timed("preview_decode", nbytes=file_size(path)):
+        bgr = decode_for_panel(path, panel_width, panel_height)
+    if bgr is None:
+        return None
+    # Filters cost per pixel: stylize at the size that just covers the panel
+    scale = max(panel_width / bgr.shape[1], panel_height / bgr.shape[0])
+    if scale < 1:
+        size = (max(panel_width, round(bgr.shape[1] * scale)), max(panel_height, round(bgr.shape[0] * scale)))
+        bgr = cv2.resize(bgr, size, interpolation=cv2.INTER_AREA)
+    with timed("preview_stylize"):
+        # Thumbnails are far below TILE_MIN_PIXELS; never split them into strips
+        images = default_engine.render(bgr, styles, tiled=False)
+
+    if segment_human and show_mask:
+        try:
+            labels = segment_people(path, segment_mode, precise=True)
+            labels = cv2.resize(labels, (bgr.shape[1], bgr.shape[0]), interpolation=cv2.INTER_NEAREST)
+            for image in images.values():
+                draw_label_overlay(image, labels, out=image)
+        except Exception as e:
+            print(f"Error during human segmentation for {path}: {e}")
+
+    return {
+        style: ImageOps.fit(Image.fromarray(image), panel_size, method=Image.Resampling.LANCZOS)
+        for style, image in images.items()
+    }
+
+def _write_preview(panels, frames, width, height, style):
+    with timed("create_preview_page"):
+        page = Image.new("RGB", (width, height), "white")
+        for panel, (x, y, _, _) in zip(panels, frames):
+            if panel is not None:
+                page.paste(panel[style], (x, y))
+    output_filename = f"preview_{uuid.uuid4()}_{style}.jpg"
+    with timed("save_preview"):
+        page.save(os.path.join(settings.OUTPUT_DIR, output_filename), quality=85)
+    return f"/output/{output_filename}"
+
+async def render_style_previews(
+    image_paths,
+    styles=PREVIEW_STYLES,
+    width=1000,
+    height=1400,
+    num_frames=8,
+    seed=42,
+    preview_width=400,
+    segment_human=False,
+    show_mask=False,
+    segment_mode='accuracy',
+    adaptive_pages=False,
+    sharpness=None):
+    """
+    Thumbnails of the first manga page in several styles, for comparing styles
+    without running /manga-layout once per style.
+
+    The page layout is the one process_manga_generation would use, scaled to
+    `preview_width`. Each image is decoded once at the smallest size covering its
+    panel and segmented at most once; all styles are rendered from that decode.
+    Images run concurrently, then the style pages are composed and saved concurrently.
+
+    sharpness: scores from collapse_duplicates, reused to plan the pages.
+
+    Returns {style: URL of the JPEG thumbnail}.
+    """
+    image_paths, page_sizes = await run_in_threadpool(plan_pages, image_paths, num_frames, adaptive_pages, sharpness)
+    if not image_paths:
+        raise ValueError("No images were successfully processed.")
+    count = page_sizes[0] if page_sizes else len(image_paths)
+    image_paths = image_paths[:count]
+    scale = preview_width / width
+    preview_height = max(1, round(height * scale))
+
+    with timed("generate_manga_layout"):
+        frames = generate_manga_layout(width=width, height=height, num_frames=count, seed=seed, std_dev=0.05, margin=8)
+    frames = [
+        (round(x * scale), round(y * scale), max(1, round(w * scale)), max(1, round(h * scale)))
+        for x, y, w, h in frames
+    ]
+
+    async def handle(path, frame):
+        pixels = image_pixels(path)
+        async with pixel_budget.reserve(pixels):
+            return await run_in_threadpool(
+                _preview_panels, path, frame[2:], styles, segment_human, show_mask, segment_mode
+            )
+
+    with default_engine.batch():
+        panels = await asyncio.gather(*(handle(path, frame) for path, frame in zip(image_paths, frames)))
+    if not any(panels):
+        raise ValueError("No images were successfully processed.")
+
+    # Missing images leave their panel blank, like the padding of a partial page
+    urls = await asyncio.gather(*(
+        run_in_threadpool(_write_preview, panels, frames, preview_width, preview_height, style)
+        for style in styles
+    ))
+    return dict(zip(styles, urls))
@@ -0,0 +1,182 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from core.config import settings
+from core.output_files import precompress
+from services.task_manager import merge_task_result, update_task_error
+
+PROFILE_MODES = ("sample", "cprofile")
+
+# cProfile hooks the thread it is enabled on (the event loop): a second run would
+# replace the first one's hook, so only one cprofile run may be active at a time
+_cprofile_lock = threading.Lock()
+
+class ProfilerBusy(RuntimeError):
+    """Another cprofile run is in progress."""
+
+def profiler_busy(mode: Optional[str]) -> bool:
+    """
+    True if `mode` is "cprofile" and another cprofile run is in progress, so a
+    request can be rejected (409) before any work is queued. Only a hint: the
+    slot itself is taken when the profile starts, and released when it ends.
+    """
+    return mode == "cprofile" and _cprofile_lock.locked()
+
+class SamplingProfiler:
+    """
+    Statistical profiler.
+
+    A daemon thread reads stacks via sys._current_frames() every `interval` seconds
+    and counts identical stacks. The profiled code runs unmodified, so overhead
+    stays low even for long jobs.
+
+    With thread_id=None every thread is sampled (stacks are rooted at the thread
+    name), which covers work offloaded to the threadpool. Requests running at the
+    same time show up in the same profile.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, frame, root=None):
+        stack = []
+        while frame is not None:
+            stack.append(self._frame_name(frame))
+            frame = frame.f_back
+        if root:
+            stack.append(root)
+        if stack:
+            self.counts[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                self._sample(frames.get(self.thread_id))
+                continue
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id != own_id:
+                    self._sample(frame, root=names.get(thread_id, str(thread_id)))
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+class ProfileHandle:
+    def __init__(self, task_id: str, mode: str):
+        self.task_id = task_id
+        self.mode = mode
+        self.directory = os.path.join(settings.OUTPUT_DIR, "profiles", task_id)
+        self.filename = "profile.collapsed" if mode == "sample" else "profile.prof"
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.filename)
+
+    @property
+    def url(self) -> str:
+        return f"/output/profiles/{self.task_id}/{self.filename}"
+
+@contextmanager
+def _profile(task_id: str, mode: str):
+    # Taken on entry and released on exit, so a slot can never outlive its run
+    if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A cprofile run is already in progress")
+    try:
+        handle = ProfileHandle(task_id, mode)
+        os.makedirs(handle.directory, exist_ok=True)
+
+        if mode == "sample":
+            profiler = SamplingProfiler(interval=settings.PROFILE_SAMPLE_INTERVAL)
+            profiler.start()
+            try:
+                yield handle
+            finally:
+                profiler.stop()
+                with open(handle.path, "w", encoding="utf-8") as f:
+                    f.write(profiler.collapsed())
+                precompress(handle.path)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield handle
+            finally:
+                profiler.disable()
+                profiler.dump_stats(handle.path)
+                # Human-readable summary next to the binary stats
+                summary = io.StringIO()
+                pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(50)
+                summary_path = os.path.join(handle.directory, "profile.txt")
+                with open(summary_path, "w", encoding="utf-8") as f:
+                    f.write(summary.getvalue())
+                precompress(summary_path)
+    finally:
+        if mode == "cprofile":
+            _cprofile_lock.release()
+
+def profile_task(task_id: str, mode: Optional[str]):
+    """
+    Profile the block for a task, writing the result under OUTPUT_DIR/profiles/<task_id>.
+
+    mode:
+        None: profiling disabled, returns a no-op context (zero overhead)
+        "sample": sampling profiler over all threads -> profile.collapsed
+        "cprofile": deterministic cProfile of the current thread -> profile.prof + profile.txt.
+            Runs one at a time: entering the context raises ProfilerBusy while
+            another run is active. It only sees the event loop thread: work offloaded to
+            the threadpool is missing and other requests on the loop are included,
+            so prefer "sample" for whole jobs.
+
+    The context yields a ProfileHandle (or None when disabled) whose `url` points to the profile.
+    """
+    if mode is None:
+        return nullcontext()
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    return _profile(task_id, mode)
+
+async def run_profiled(task_id: str, mode: str, job, *args, **kwargs):
+    """
+    Await job(*args, **kwargs) under the profiler and link the profile from the task result.
+    Runs as a background task: a failure to write the profile marks the task failed instead of escaping.
+    If another cprofile run started since the request was accepted, the job runs unprofiled.
+    """
+    try:
+        with profile_task(task_id, mode) as handle:
+            await job(*args, **kwargs)
+    except ProfilerBusy as e:
+        print(f"Running task {task_id} without profiling: {e}")
+        await job(*args, **kwargs)
+        merge_task_result(task_id, {"profile_error": str(e)})
+        return
+    except Exception as e:
+        print(f"Profiling failed for task {task_id}: {e}")
+        update_task_error(task_id, f"Profiling failed: {e}")
+        return
+    merge_task_result(task_id, {"profile_url": handle.url})
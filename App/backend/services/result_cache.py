@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+from core.metrics import registry
+
+def _to_builtin(value):
+    # Whisper results may carry NumPy scalars/arrays; store them as plain JSON
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class ResultCache:
+    """
+    On-disk cache for the video pipeline, stored next to the outputs.
+
+    Two kinds of entries are kept:
+        demux/<content_hash>.json: paths of the audio/video split from an upload
+        transcripts/<key>.json: the full Whisper result (segments + word timestamps)
+            for a (content_hash, language, model) combination
+
+    Entries are compact JSON. When the cache grows past `max_bytes` the least
+    recently used entries (by mtime, refreshed on every hit) are deleted.
+    Hit/miss counters are kept per process and reported by `stats()`.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self._root = root
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {
+            "demux_hits": 0,
+            "demux_misses": 0,
+            "transcript_hits": 0,
+            "transcript_misses": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def root(self) -> str:
+        # Resolved lazily so the cache follows settings.OUTPUT_DIR
+        return self._root or os.path.join(settings.OUTPUT_DIR, "cache")
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None else settings.RESULT_CACHE_MAX_BYTES
+
+    @staticmethod
+    def transcript_key(content_hash: str, language: str, model_name: str) -> str:
+        return hashlib.sha256(f"{content_hash}:{language}:{model_name}".encode()).hexdigest()
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, f"{key}.json")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Refresh mtime so eviction is least-recently-used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def _write(self, path: str, entry: Dict[str, Any]) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, separators=(",", ":"), ensure_ascii=False, default=_to_builtin)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def get_demux(self, content_hash: str) -> Optional[Tuple[str, str]]:
+        """Return (audio_path, video_path) if this upload was already split and both files still exist."""
+        entry = self._read(self._path("demux", content_hash))
+        if entry and os.path.exists(entry["audio_path"]) and os.path.exists(entry["video_path"]):
+            self._count("demux_hits")
+            return entry["audio_path"], entry["video_path"]
+        self._count("demux_misses")
+        return None
+
+    def put_demux(self, content_hash: str, audio_path: str, video_path: str) -> None:
+        self._write(self._path("demux", content_hash), {"audio_path": audio_path, "video_path": video_path})
+
+    def get_transcript(self, content_hash: str, language: str, model_name: str) -> Optional[Dict[str, Any]]:
+        """Return the cached Whisper result for this upload/language/model, if any."""
+        entry = self._read(self._path("transcripts", self.transcript_key(content_hash, language, model_name)))
+        if entry is not None:
+            self._count("transcript_hits")
+            return entry["result"]
+        self._count("transcript_misses")
+        return None
+
+    def put_transcript(self, content_hash: str, language: str, model_name: str, result: Dict[str, Any]) -> None:
+        entry = {
+            "content_hash": content_hash,
+            "language": language,
+            "model": model_name,
+            "result": result,
+        }
+        self._write(self._path("transcripts", self.transcript_key(content_hash, language, model_name)), entry)
+
+    def evict(self) -> int:
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        total = 0
+        for kind in ("demux", "transcripts"):
+            directory = os.path.join(self.root, kind)
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as it:
+                for item in it:
+                    if item.is_file() and item.name.endswith(".json"):
+                        stat = item.stat()
+                        entries.append((stat.st_mtime, stat.st_size, item.path))
+                        total += stat.st_size
+
+        evicted = 0
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+        if evicted:
+            with self._lock:
+                self.counters["evictions"] += evicted
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+result_cache = ResultCache()
+
+def _collect_cache_metrics(metrics):
+    for event, value in result_cache.stats().items():
+        metrics.set_counter("result_cache_events_total", value, {"event": event})
+
+registry.describe("result_cache_events_total", "Demux/transcript result cache hits, misses and evictions.")
+registry.register_collector(_collect_cache_metrics)
@@ -1,43 +1,56 @@
 import uuid
-from enum import Enum
 from typing import Dict, Any, Optional
-from pydantic import BaseModel
 
-class TaskStatus(str, Enum):
-    PENDING = "pending"
-    PROCESSING = "processing"
-    COMPLETED = "completed"
-    FAILED = "failed"
+from schemas.task import Task, TaskStatus
+from services.task_store import create_store
 
-class Task(BaseModel):
-    id: str
-    status: TaskStatus
-    result: Optional[Dict[str, Any]] = None
-    error: Optional[str] = None
+# Pluggable storage (SQLite by default, see settings.TASK_STORE_BACKEND).
+# The store behaves like a dict keyed by task id.
+tasks = create_store()
 
-# Simple in-memory storage
-# In a production app, use Redis or a database
-tasks: Dict[str, Task] = {}
-
-def create_task() -> Task:
+def create_task(key: Optional[str] = None) -> Task:
+    tasks.maybe_evict()
     task_id = str(uuid.uuid4())
-    task = Task(id=task_id, status=TaskStatus.PENDING)
-    tasks[task_id] = task
+    task = Task(id=task_id, status=TaskStatus.PENDING, key=key)
+    tasks.save(task)
+    return task
+
+def restore_task(task_id: str, key: Optional[str] = None) -> Task:
+    """Recreate a task lost with its store (e.g. an in-memory store after a restart) so a resumed job can report to it."""
+    task = Task(id=task_id, status=TaskStatus.PENDING, key=key)
+    tasks.save(task)
     return task
 
 def get_task(task_id: str) -> Optional[Task]:
-    return tasks.get(task_id)
+    return tasks.load(task_id)
+
+def find_task_by_key(key: str) -> Optional[Task]:
+    """Return the newest pending, processing or completed task created with this key."""
+    return tasks.find_by_key(key)
 
 def update_task_status(task_id: str, status: TaskStatus):
-    if task_id in tasks:
-        tasks[task_id].status = status
+    task = tasks.load(task_id)
+    if task is not None:
+        task.status = status
+        tasks.save(task)
 
 def update_task_result(task_id: str, result: Dict[str, Any]):
-    if task_id in tasks:
-        tasks[task_id].result = result
-        tasks[task_id].status = TaskStatus.COMPLETED
+    task = tasks.load(task_id)
+    if task is not None:
+        task.result = result
+        task.status = TaskStatus.COMPLETED
+        tasks.save(task)
 
 def update_task_error(task_id: str, error: str):
-    if task_id in tasks:
-        tasks[task_id].error = error
-        tasks[task_id].status = TaskStatus.FAILED
+    task = tasks.load(task_id)
+    if task is not None:
+        task.error = error
+        task.status = TaskStatus.FAILED
+        tasks.save(task)
+
+def merge_task_result(task_id: str, extra: Dict[str, Any]):
+    """Add fields to a task's result without changing its status."""
+    task = tasks.load(task_id)
+    if task is not None:
+        task.result = {**(task.result or {}), **extra}
+        tasks.save(task)
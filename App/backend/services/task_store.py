@@ -0,0 +1,297 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+from core.config import settings
+from schemas.task import Task, TaskStatus, FINISHED_STATUSES
+
+class TaskStore(ABC):
+    """
+    Base class for task persistence backends.
+
+    Subclasses implement `load`, `save`, `delete`, `clear`, `ids`, `find_by_key` and `_evict`
+    (abstract: a backend missing one cannot be instantiated).
+    The mapping helpers (`store[task_id]`, `task_id in store`, `len(store)`) are
+    built on top of those so callers can keep treating the store like a dict.
+    """
+
+    def __init__(self, ttl_seconds: int = 0, evict_interval: int = 60):
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self._last_eviction = 0.0
+
+    @abstractmethod
+    def load(self, task_id: str) -> Optional[Task]:
+        ...
+
+    @abstractmethod
+    def save(self, task: Task) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, task_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def ids(self) -> Iterator[str]:
+        ...
+
+    @abstractmethod
+    def find_by_key(self, key: str) -> Optional[Task]:
+        """Return the newest task with this key that has not failed, if any."""
+
+    @abstractmethod
+    def _evict(self, cutoff: float) -> int:
+        ...
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        """
+        Delete tasks that finished (completed/failed) more than `ttl_seconds` ago,
+        going by their last update, so a long job is kept for the full TTL after it ends.
+        Returns the number of evicted tasks. A ttl of 0 disables eviction.
+        """
+        if not self.ttl_seconds:
+            return 0
+        now = now if now is not None else time.time()
+        self._last_eviction = now
+        return self._evict(now - self.ttl_seconds)
+
+    def maybe_evict(self) -> int:
+        """Run `evict_expired` at most once every `evict_interval` seconds."""
+        now = time.time()
+        if now - self._last_eviction < self.evict_interval:
+            return 0
+        return self.evict_expired(now)
+
+    def __getitem__(self, task_id: str) -> Task:
+        task = self.load(task_id)
+        if task is None:
+            raise KeyError(task_id)
+        return task
+
+    def __setitem__(self, task_id: str, task: Task) -> None:
+        self.save(task)
+
+    def __delitem__(self, task_id: str) -> None:
+        self.delete(task_id)
+
+    def __contains__(self, task_id: object) -> bool:
+        return isinstance(task_id, str) and self.load(task_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return self.ids()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.ids())
+
+    def get(self, task_id: str, default: Optional[Task] = None) -> Optional[Task]:
+        task = self.load(task_id)
+        return task if task is not None else default
+
+class MemoryTaskStore(TaskStore):
+    """
+    Process-local store. Fast, but not shared between workers and lost on restart.
+    """
+
+    def __init__(self, ttl_seconds: int = 0, evict_interval: int = 60):
+        super().__init__(ttl_seconds, evict_interval)
+        self._tasks: Dict[str, Task] = {}
+
+    def load(self, task_id: str) -> Optional[Task]:
+        return self._tasks.get(task_id)
+
+    def save(self, task: Task) -> None:
+        task.updated_at = time.time()
+        self._tasks[task.id] = task
+
+    def delete(self, task_id: str) -> None:
+        self._tasks.pop(task_id, None)
+
+    def clear(self) -> None:
+        self._tasks.clear()
+
+    def ids(self) -> Iterator[str]:
+        return iter(list(self._tasks))
+
+    def find_by_key(self, key: str) -> Optional[Task]:
+        matches = [
+            task for task in self._tasks.values()
+            if task.key == key and task.status != TaskStatus.FAILED
+        ]
+        return max(matches, key=lambda task: task.created_at, default=None)
+
+    def _evict(self, cutoff: float) -> int:
+        expired = [
+            task_id for task_id, task in self._tasks.items()
+            if task.status in FINISHED_STATUSES and task.updated_at < cutoff
+        ]
+        for task_id in expired:
+            del self._tasks[task_id]
+        return len(expired)
+
+class SQLiteTaskStore(TaskStore):
+    """
+    SQLite-backed store shared by every worker on the host.
+
+    The database runs in WAL mode so status polls never block the worker that is
+    writing results. Rows are indexed by (status, updated_at) for TTL eviction,
+    by created_at for listing and by key for upload deduplication. Finished tasks
+    rarely change, so they are kept in a small in-process LRU cache, but they can
+    (a profile added to a completed task, a late merge_task_result): a cached
+    task is only served while its row still has the same updated_at, which is
+    checked in the same query that would read the row anyway. Pending/processing
+    tasks are always read from disk because another worker may be updating them.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            key TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks(status, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at);
+    """
+    _KEY_INDEX = "CREATE INDEX IF NOT EXISTS idx_tasks_key ON tasks(key, created_at)"
+
+    def __init__(self, path: str, ttl_seconds: int = 0, cache_size: int = 1024, evict_interval: int = 60):
+        super().__init__(ttl_seconds, evict_interval)
+        self.path = path
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Task]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Background tasks run on the threadpool, so one connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self._SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        # Databases created before deduplication lack the key column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tasks)")}
+        if "key" not in columns:
+            self._conn.execute("ALTER TABLE tasks ADD COLUMN key TEXT")
+        self._conn.execute(self._KEY_INDEX)
+        # Eviction used to go by created_at
+        self._conn.execute("DROP INDEX IF EXISTS idx_tasks_status_created")
+
+    def _cache_get(self, task_id: str) -> Optional[Task]:
+        task = self._cache.get(task_id)
+        if task is not None:
+            self._cache.move_to_end(task_id)
+        return task
+
+    def _cache_put(self, task: Task) -> None:
+        if self.cache_size <= 0:
+            return
+        self._cache[task.id] = task
+        self._cache.move_to_end(task.id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def load(self, task_id: str) -> Optional[Task]:
+        with self._lock:
+            cached = self._cache_get(task_id)
+            # The row's data is only read when it changed since it was cached
+            row = self._conn.execute(
+                "SELECT CASE WHEN updated_at = ? THEN NULL ELSE data END FROM tasks WHERE id = ?",
+                (cached.updated_at if cached is not None else None, task_id),
+            ).fetchone()
+            if row is None:
+                self._cache.pop(task_id, None)
+                return None
+            if row[0] is None:
+                return cached.model_copy(deep=True)
+            task = Task.model_validate_json(row[0])
+            if task.status in FINISHED_STATUSES:
+                self._cache_put(task)
+                return task.model_copy(deep=True)
+            self._cache.pop(task_id, None)
+            return task
+
+    def save(self, task: Task) -> None:
+        task.updated_at = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks (id, status, created_at, updated_at, key, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (task.id, task.status.value, task.created_at, task.updated_at, task.key, task.model_dump_json()),
+            )
+            if task.status in FINISHED_STATUSES:
+                self._cache_put(task.model_copy(deep=True))
+            else:
+                self._cache.pop(task.id, None)
+
+    def delete(self, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            self._cache.pop(task_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tasks")
+            self._cache.clear()
+
+    def ids(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM tasks ORDER BY created_at").fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def find_by_key(self, key: str) -> Optional[Task]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM tasks WHERE key = ? AND status != ? ORDER BY created_at DESC LIMIT 1",
+                (key, TaskStatus.FAILED.value),
+            ).fetchone()
+        return self.load(row[0]) if row else None
+
+    def _evict(self, cutoff: float) -> int:
+        statuses = [status.value for status in FINISHED_STATUSES]
+        placeholders = ",".join("?" for _ in statuses)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*statuses, cutoff),
+            )
+            # Only finished tasks are cached, so anything older than the cutoff is gone
+            for task_id in [k for k, task in self._cache.items() if task.updated_at < cutoff]:
+                del self._cache[task_id]
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def create_store() -> TaskStore:
+    """Build the task store selected by `settings.TASK_STORE_BACKEND`."""
+    backend = settings.TASK_STORE_BACKEND.lower()
+    if backend == "memory":
+        return MemoryTaskStore(ttl_seconds=settings.TASK_TTL_SECONDS)
+    if backend == "sqlite":
+        return SQLiteTaskStore(
+            settings.TASK_DB_PATH,
+            ttl_seconds=settings.TASK_TTL_SECONDS,
+            cache_size=settings.TASK_CACHE_SIZE,
+        )
+    raise ValueError(f"Unknown task store backend: {settings.TASK_STORE_BACKEND}")
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+# Read uploads in 1 MiB chunks: large enough to amortize the threadpool hop,
+# small enough to keep memory flat for multi-GB videos
+CHUNK_SIZE = 1024 * 1024
+
+@dataclass
+class StoredUpload:
+    path: str
+    filename: str
+    sha256: str
+    size: int
+    # True if an identical file was already stored
+    existed: bool = False
+
+def _write_chunk(buffer, hasher, chunk):
+    # hashlib and file writes both release the GIL, so this runs off the event loop
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+async def save_upload(file: UploadFile, dest_dir: str, chunk_size: int = CHUNK_SIZE) -> StoredUpload:
+    """
+    Stream an upload to disk while hashing it, without blocking the event loop.
+
+    The file is stored content-addressed as `<sha256><ext>` inside dest_dir, so
+    identical uploads share one file and different files never clobber each other.
+
+    Input:
+        file: the uploaded file
+        dest_dir: directory to store the file in
+        chunk_size: number of bytes read per iteration
+
+    Output:
+        StoredUpload describing the stored file
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    ext = os.path.splitext(file.filename or "")[1].lower()
+
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+                size += len(chunk)
+
+        digest = hasher.hexdigest()
+        filename = f"{digest}{ext}"
+        final_path = os.path.join(dest_dir, filename)
+
+        existed = os.path.exists(final_path)
+        if existed:
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return StoredUpload(path=final_path, filename=filename, sha256=digest, size=size, existed=existed)
@@ -0,0 +1,542 @@
+import asyncio
+import math
+import os
+import shutil
+import sys
+import traceback
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from core.metrics import registry, timed, collect_timings, file_size
+from core.budget import pixel_budget, image_pixels
+
+if settings.BASE_DIR not in sys.path:
+    sys.path.append(settings.BASE_DIR)
+
+from Frame.frame_processor import extract_frames, frame_clear, sharpness_score, cv2_to_pil, default_engine
+from Frame.dedup import inspect_frame, is_near_duplicate
+from Frame.manga_layout import generate_manga_layout, create_manga_page, draw_speech_bubble
+from Frame.pagination import panel_importance, panel_range, paginate
+from services.manga_processor import stylize_image, segment_people, temporal_segmenter, draw_label_overlay
+from services.video_processor import demux_and_transcribe, to_output_url, describe_ffmpeg_error, save_transcript_index
+from Speech.transcript_index import TranscriptIndex
+from services.task_manager import update_task_status, update_task_result, update_task_error, merge_task_result, TaskStatus
+from services.checkpoints import open_checkpoint, register_resumable
+
+# End-of-stream marker passed through the stage queues
+_DONE = object()
+
+@dataclass
+class Panel:
+    path: str
+    start: float
+    # Dialogue spoken until `end` belongs to this panel (set once the next kept frame is known)
+    end: float = math.inf
+    image: Optional[np.ndarray] = None
+    character_mask: Optional[np.ndarray] = None
+    # Variance of the Laplacian from frame_clear
+    sharpness: float = 0.0
+    # Index of the page the panel is laid out on (set by the paginate stage)
+    page: int = 0
+    # The panel's page was rendered by an earlier run of the job (checkpointed): skip its work
+    rendered: bool = False
+
+@dataclass
+class Page:
+    index: int
+    panels: List[Panel]
+    frames: list
+    image: Optional[Image.Image]
+    # Set for pages restored from a checkpoint
+    url: Optional[str] = None
+
+@dataclass
+class PipelineOptions:
+    language: str = "en"
+    width: int = 1000
+    height: int = 1400
+    num_frames: int = 8
+    seed: int = 42
+    stylize_style: str = "c"
+    segment_human: bool = False
+    show_mask: bool = False
+    # "accuracy" (segmentation model on every frame) or "speed" (HOG tier, see segment_people)
+    segment_mode: str = "accuracy"
+    # Segment shot anchors only and propagate masks to the frames in between with optical flow
+    temporal_masks: bool = False
+    # Collapse consecutive near-duplicate frames (same shot) to the sharpest one
+    dedup: bool = True
+    # Label dialogue with speakers (MFCC-statistics diarization on the decoded audio)
+    diarize: bool = False
+    frame_interval: float = 2.0
+    # Vary the panels per page (num_frames / 2 .. num_frames) with the importance of the scenes;
+    # otherwise every page but the last has num_frames panels. Off by default: the whole volume
+    # is planned at once, so stylization waits for every frame and the transcript
+    adaptive_pages: bool = False
+
+class StageQueue(asyncio.Queue):
+    """Bounded queue between two stages that reports its depth as a gauge."""
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize=maxsize)
+        self.name = name
+
+    def _report(self):
+        registry.set_gauge("pipeline_queue_depth", self.qsize(), {"queue": self.name})
+
+    async def put(self, item):
+        await super().put(item)
+        self._report()
+
+    async def get(self):
+        item = await super().get()
+        self._report()
+        return item
+
+@dataclass
+class PipelineStats:
+    frames_extracted: int = 0
+    frames_dropped: int = 0
+    frames_duplicate: int = 0
+    manga_urls: List[str] = field(default_factory=list)
+
+def _next_frame(frames):
+    with timed("extract_frame"):
+        return next(frames, None)
+
+def _inspect_frame(path, dedup):
+    """Decode a frame once for the clarity check, its sharpness and (optionally) its perceptual hash."""
+    with timed("frame_clear", nbytes=file_size(path)):
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return False, "Failed to load image.", None, 0.0
+        sharpness = float(sharpness_score(gray))
+        is_clear, reason = frame_clear(path, gray=gray, sharpness=sharpness)
+        info = inspect_frame(path, gray=gray, sharpness=sharpness) if dedup and is_clear else None
+    return is_clear, reason, info, sharpness
+
+async def _extract_stage(video_path, frames_dir, options, out_q, stats):
+    frames = extract_frames(video_path, frames_dir, interval=options.frame_interval)
+    try:
+        while True:
+            item = await run_in_threadpool(_next_frame, frames)
+            if item is None:
+                break
+            frame_path, timestamp = item
+            stats.frames_extracted += 1
+            await out_q.put(Panel(path=frame_path, start=timestamp))
+    finally:
+        frames.close()
+    await out_q.put(_DONE)
+
+async def _filter_stage(in_q, out_q, options, stats):
+    kept = 0
+    last_dropped = None
+    # The last clear frame is held back until the next one shows it is not a near-duplicate
+    pending = pending_info = None
+    while (panel := await in_q.get()) is not _DONE:
+        is_clear, reason, info, panel.sharpness = await run_in_threadpool(_inspect_frame, panel.path, options.dedup)
+        if not is_clear:
+            stats.frames_dropped += 1
+            last_dropped = panel
+            print(f"Dropping frame at {panel.start:.2f}s: {reason}")
+            continue
+
+        if is_near_duplicate(pending_info, info, settings.DEDUP_HAMMING_THRESHOLD):
+            stats.frames_duplicate += 1
+            if info.sharpness > pending_info.sharpness:
+                # The sharpest frame represents the shot from its first appearance
+                panel.start = pending.start
+                pending, pending_info = panel, info
+            continue
+
+        if pending is not None:
+            kept += 1
+            await out_q.put(pending)
+        pending, pending_info = panel, info
+    if pending is not None:
+        kept += 1
+        await out_q.put(pending)
+    # Never end up with an empty volume because every frame was blurry or dark
+    if kept == 0 and last_dropped is not None:
+        stats.frames_dropped -= 1
+        await out_q.put(last_dropped)
+    await out_q.put(_DONE)
+
+def _plan_pages(panels, index, options):
+    """
+    Page sizes for a volume from the importance of its panels: frame_clear
+    sharpness, shot length (until the next kept frame) and word density.
+    """
+    with timed("paginate"):
+        starts = np.array([panel.start for panel in panels], dtype=np.float64)
+        ends = np.append(starts[1:], np.inf)
+        shots = ends - starts
+        # The last shot runs to the end of the video: count it as a typical one
+        shots[-1] = np.median(shots[:-1]) if len(panels) > 1 else options.frame_interval
+        shots = np.maximum(shots, 1e-3)
+        words = np.searchsorted(index.starts, ends) - np.searchsorted(index.starts, starts)
+        importance = panel_importance(
+            [panel.sharpness for panel in panels],
+            shot_seconds=shots,
+            words_per_second=words / shots if len(index) else None,
+        )
+        return paginate(importance, *panel_range(options.num_frames))
+
+async def _paginate_stage(in_q, out_q, options, transcript_index, rendered_pages=None, checkpoint=None):
+    rendered_pages = rendered_pages or {}
+    if not options.adaptive_pages:
+        # Fixed pages: the page of every panel is known as soon as it is kept
+        per_page = max(1, options.num_frames)
+        kept = 0
+        while (panel := await in_q.get()) is not _DONE:
+            panel.page = kept // per_page
+            panel.rendered = panel.page in rendered_pages
+            kept += 1
+            await out_q.put(panel)
+        await out_q.put(_DONE)
+        return
+
+    # Adaptive pages are planned for the whole volume, so every kept frame
+    # (paths and scores only, nothing is decoded yet) and the transcript are needed first
+    panels = []
+    while (panel := await in_q.get()) is not _DONE:
+        panels.append(panel)
+    if panels:
+        sizes = checkpoint.stage("pagination") if checkpoint is not None else None
+        if sizes is None or sum(sizes) != len(panels):
+            # Pages of an earlier plan do not match this one
+            rendered_pages.clear()
+            sizes = await run_in_threadpool(_plan_pages, panels, await transcript_index, options)
+            if checkpoint is not None:
+                await run_in_threadpool(checkpoint.complete_stage, "pagination", sizes)
+        for panel, page in zip(panels, np.repeat(np.arange(len(sizes)), sizes)):
+            panel.page = int(page)
+            panel.rendered = panel.page in rendered_pages
+            await out_q.put(panel)
+    await out_q.put(_DONE)
+
+async def _stylize_stage(in_q, out_q, options):
+    # Same-sized frames reuse the stylizer's scratch buffers until the video is done
+    with default_engine.batch():
+        while (panel := await in_q.get()) is not _DONE:
+            if panel.rendered:
+                await out_q.put(panel)
+                continue
+            # Decoding and stylizing full-resolution frames shares the worker-wide pixel budget
+            async with pixel_budget.reserve(image_pixels(panel.path)):
+                panel.image = await run_in_threadpool(stylize_image, panel.path, options.stylize_style)
+            if panel.image is None:
+                print(f"Skipping unreadable frame {panel.path}")
+                continue
+            await out_q.put(panel)
+    await out_q.put(_DONE)
+
+def _segment_panel(panel, show_mask, segment_mode, propagator=None):
+    try:
+        labels = segment_people(panel.path, segment_mode, precise=show_mask, propagator=propagator)
+    except Exception as e:
+        print(f"Error during human segmentation for {panel.path}: {e}")
+        return
+    if labels.any():
+        panel.character_mask = (labels > 0).astype(np.uint8)
+        if show_mask:
+            draw_label_overlay(panel.image, labels, out=panel.image)
+
+async def _segment_stage(in_q, out_q, options):
+    # Frames arrive in time order, so masks can be carried from one frame to the next
+    propagator = temporal_segmenter(options.segment_mode, options.show_mask) if options.temporal_masks else None
+    while (panel := await in_q.get()) is not _DONE:
+        if panel.rendered:
+            await out_q.put(panel)
+            continue
+        await run_in_threadpool(_segment_panel, panel, options.show_mask, options.segment_mode, propagator)
+        await out_q.put(panel)
+    await out_q.put(_DONE)
+
+def _compose_page(index, panels, options):
+    with timed("generate_manga_layout"):
+        frames = generate_manga_layout(
+            width=options.width,
+            height=options.height,
+            num_frames=len(panels),
+            seed=options.seed + index * options.num_frames,
+            std_dev=0.05,
+            margin=8
+        )
+    with timed("create_manga_page"):
+        image = create_manga_page(
+            images=[cv2_to_pil(panel.image) for panel in panels],
+            frames=frames,
+            width=options.width,
+            height=options.height,
+            bg_color="white"
+        )
+    # The stylized frames are now on the page; drop the full-size copies
+    for panel in panels:
+        panel.image = None
+    return Page(index=index, panels=panels, frames=frames, image=image)
+
+async def _layout_page(index, panels, options, rendered_pages):
+    if index in rendered_pages:
+        return Page(index=index, panels=panels, frames=[], image=None, url=rendered_pages[index])
+    return await run_in_threadpool(_compose_page, index, panels, options)
+
+async def _layout_stage(in_q, out_q, options, rendered_pages=None):
+    rendered_pages = rendered_pages or {}
+    buffer = []
+    while (panel := await in_q.get()) is not _DONE:
+        if buffer:
+            buffer[-1].end = panel.start
+            # A page is laid out once the first panel of the next page arrives,
+            # so the last panel of a page knows its end time
+            if panel.page != buffer[0].page:
+                await out_q.put(await _layout_page(buffer[0].page, buffer, options, rendered_pages))
+                buffer = []
+        buffer.append(panel)
+    if buffer:
+        await out_q.put(await _layout_page(buffer[0].page, buffer, options, rendered_pages))
+    await out_q.put(_DONE)
+
+def _speaker_name(speaker):
+    return chr(ord("A") + speaker % 26)
+
+def _panel_dialogue(panel, index):
+    # Words spoken while the panel's frame is the current one
+    turns = index.turns_between(panel.start, panel.end)
+    if len({speaker for speaker, _ in turns}) > 1:
+        # Several diarized speakers share the panel: name each turn
+        return " ".join(f"{_speaker_name(speaker)}: {text}" for speaker, text in turns)
+    return " ".join(text for _, text in turns)
+
+def _draw_bubbles(page, index):
+    with timed("draw_bubbles"):
+        _draw_page_bubbles(page, index)
+
+def _draw_page_bubbles(page, index):
+    for panel, frame in zip(page.panels, page.frames):
+        text = _panel_dialogue(panel, index)
+        if not text:
+            continue
+        mask = None
+        if panel.character_mask is not None:
+            # Fit the mask exactly like create_manga_page fits the image
+            _, _, w, h = frame
+            fitted = ImageOps.fit(Image.fromarray(panel.character_mask * 255), (int(w), int(h)),
+                                  method=Image.Resampling.NEAREST)
+            mask = np.array(fitted)
+        draw_speech_bubble(page.image, frame, text, character_mask=mask)
+
+def _build_transcript_index(transcription):
+    with timed("transcript_index"):
+        return TranscriptIndex.from_whisper(transcription[2] if transcription else {})
+
+async def _bubble_stage(in_q, out_q, transcript_index):
+    index = None
+    while (page := await in_q.get()) is not _DONE:
+        if page.url:
+            await out_q.put(page)
+            continue
+        if index is None:
+            # Frames keep flowing into the upstream queues while transcription finishes
+            index = await transcript_index
+        if len(index):
+            await run_in_threadpool(_draw_bubbles, page, index)
+        await out_q.put(page)
+    await out_q.put(_DONE)
+
+def _save_page(page):
+    output_filename = f"manga_{uuid.uuid4()}.png"
+    output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
+    with timed("save_page"):
+        page.image.save(output_path)
+    return f"/output/{output_filename}"
+
+async def _encode_stage(in_q, stats, checkpoint=None, task_id=None):
+    while (page := await in_q.get()) is not _DONE:
+        if page.url:
+            url = page.url
+        else:
+            url = await run_in_threadpool(_save_page, page)
+            if checkpoint is not None:
+                await run_in_threadpool(checkpoint.save_page, page.index, url)
+        stats.manga_urls.append(url)
+        if task_id:
+            # Published while the task runs, so /export can stream the pages saved so far
+            await run_in_threadpool(merge_task_result, task_id, {"manga_urls": list(stats.manga_urls)})
+
+async def _run_stages(coros):
+    """Run all stages concurrently; if one fails, cancel the others and re-raise."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def run_video_to_manga(
+    video_path, original_filename, options, content_hash=None, work_dir=None, task_id=None, checkpoint=None
+):
+    """
+    Convert a video into manga pages.
+
+    Stages are connected by bounded queues and run concurrently, so a frame can be
+    stylized while the next one is decoded and a page is encoded while the next
+    one is laid out:
+
+        extract -> frame_clear + dedup filter -> paginate -> stylize -> [segment] -> layout -> bubbles -> encode
+
+    Demuxing and transcription run in parallel with the frame stages. With
+    options.adaptive_pages the paginate stage collects every kept frame (paths
+    and sharpness only) and waits for the transcript, then plans the pages of
+    the whole volume at once (Frame.pagination); otherwise frames pass through
+    it and only the bubble stage waits for the transcript. The transcript is turned into a
+    TranscriptIndex once, and each panel gets the words spoken between its frame
+    and the next kept frame. With a task_id the index is saved next to the pages.
+
+    With a JobCheckpoint, demux outputs, transcription chunks and every saved
+    page, as well as the page plan, are checkpointed. A resumed run still extracts
+    and filters all frames (cheap, and needed to assign panels to pages) but panels of pages that were
+    already rendered skip stylization, segmentation, layout and encoding.
+
+    Returns:
+        dict with manga_urls, video/audio URLs, transcript text and frame statistics.
+    """
+    work_dir = work_dir or os.path.join(settings.INPUT_DIR, "frames", uuid.uuid4().hex)
+    stats = PipelineStats()
+    transcript_error = None
+
+    async def transcribe():
+        nonlocal transcript_error
+        try:
+            return await run_in_threadpool(
+                demux_and_transcribe, original_filename, options.language, content_hash, options.diarize, checkpoint
+            )
+        except Exception as e:
+            # Pages are still useful without dialogue
+            transcript_error = f"{e}{describe_ffmpeg_error(e)}"
+            print(f"Transcription failed for {original_filename}: {transcript_error}")
+            return None
+
+    transcript_task = asyncio.ensure_future(transcribe())
+
+    async def index_transcript():
+        return await run_in_threadpool(_build_transcript_index, await transcript_task)
+
+    index_task = asyncio.ensure_future(index_transcript())
+
+    rendered_pages = checkpoint.pages() if checkpoint is not None else {}
+    if rendered_pages:
+        print(f"Resuming {original_filename}: {len(rendered_pages)} pages already rendered")
+
+    queue_size = settings.PIPELINE_QUEUE_SIZE
+    extracted, filtered, paged, stylized, laid_out, bubbled = (
+        StageQueue(name, queue_size)
+        for name in ("extracted", "filtered", "paged", "stylized", "laid_out", "bubbled")
+    )
+    if options.segment_human:
+        segmented = StageQueue("segmented", queue_size)
+        segment_stages = [_segment_stage(stylized, segmented, options)]
+    else:
+        segmented = stylized
+        segment_stages = []
+
+    try:
+        await _run_stages([
+            _extract_stage(video_path, work_dir, options, extracted, stats),
+            _filter_stage(extracted, filtered, options, stats),
+            _paginate_stage(filtered, paged, options, index_task, rendered_pages, checkpoint),
+            _stylize_stage(paged, stylized, options),
+            *segment_stages,
+            _layout_stage(segmented, laid_out, options, rendered_pages),
+            _bubble_stage(laid_out, bubbled, index_task),
+            _encode_stage(bubbled, stats, checkpoint, task_id),
+        ])
+        transcription = await transcript_task
+        index = await index_task
+    except BaseException:
+        transcript_task.cancel()
+        index_task.cancel()
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not stats.manga_urls:
+        raise ValueError("No frames could be extracted from the video.")
+
+    result: Dict[str, Any] = {
+        "manga_urls": stats.manga_urls,
+        "frames_extracted": stats.frames_extracted,
+        "frames_used": stats.frames_extracted - stats.frames_dropped - stats.frames_duplicate,
+        "frames_deduplicated": stats.frames_duplicate,
+    }
+    if transcription:
+        audio_path, demuxed_video_path, transcription_result = transcription
+        result.update({
+            "video_url": to_output_url(demuxed_video_path),
+            "audio_url": to_output_url(audio_path),
+            "text": transcription_result.get("text", ""),
+            "word_count": len(index),
+        })
+        if "audio_skipped_percent" in transcription_result:
+            result["audio_skipped_percent"] = transcription_result["audio_skipped_percent"]
+        if task_id:
+            transcript_index_url = await run_in_threadpool(save_transcript_index, task_id, index)
+            if transcript_index_url:
+                result["transcript_index_url"] = transcript_index_url
+    if transcript_error:
+        result["transcript_error"] = transcript_error
+    return result
+
+async def process_video_to_manga_task(
+    task_id: str,
+    file_location: str,
+    original_filename: str,
+    options: PipelineOptions,
+    content_hash: str | None = None
+):
+    checkpoint = None
+    try:
+        update_task_status(task_id, TaskStatus.PROCESSING)
+        print(f"Processing video-to-manga task {task_id}: {original_filename}")
+        if isinstance(options, dict):
+            # Resumed from a checkpoint manifest
+            options = PipelineOptions(**options)
+        checkpoint = open_checkpoint(
+            "video_to_manga",
+            task_id,
+            args={
+                "file_location": file_location,
+                "original_filename": original_filename,
+                "options": asdict(options),
+                "content_hash": content_hash,
+            },
+            content_hash=content_hash,
+            params=asdict(options),
+        )
+        work_dir = os.path.join(settings.INPUT_DIR, "frames", task_id)
+        with collect_timings() as timings:
+            result = await run_video_to_manga(
+                file_location, original_filename, options, content_hash=content_hash, work_dir=work_dir,
+                task_id=task_id, checkpoint=checkpoint
+            )
+        result["timings"] = timings.summary()
+        update_task_result(task_id, result)
+        checkpoint.finish()
+    except Exception as e:
+        print(f"Error processing task {task_id}: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        update_task_error(task_id, f"Processing failed: {str(e)}")
+        if checkpoint is not None:
+            checkpoint.release()
+
+register_resumable("video_to_manga", process_video_to_manga_task)
@@ -1,30 +1,33 @@
-import shutil
 import os
 import sys
 from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
 from core.config import settings
+from core.metrics import timed, collect_timings, file_size
 import traceback
 import ffmpeg
 
 if settings.BASE_DIR not in sys.path:
     sys.path.append(settings.BASE_DIR)
 
-from Speech.process_audio import split_video_audio, speech2text
+from Speech.process_audio import split_video_audio, speech2text, MODEL_NAME
+from Speech.transcript_index import TranscriptIndex
 from services.task_manager import update_task_status, update_task_error, update_task_result, TaskStatus
+from services.upload_store import save_upload
+from services.result_cache import result_cache
+from services.checkpoints import open_checkpoint, register_resumable
+from core.output_files import precompress
 
 async def process_video(file: UploadFile) -> tuple[str, str, str | None]:
     if not file.content_type.startswith("video/"):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload a video.")
     
     try:
-        file_location = os.path.join(settings.INPUT_DIR, file.filename)
-        
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored = await save_upload(file, settings.INPUT_DIR)
 
-        print(f"Processing file: {file.filename}")
+        print(f"Processing file: {file.filename} ({stored.filename})")
         
-        audio_path, video_path = split_video_audio(file.filename)
+        audio_path, video_path = split_video_audio(stored.filename)
         
         # Convert absolute paths to Relative URLs for serving on FE
         audio_rel_path = os.path.relpath(audio_path, settings.OUTPUT_DIR).replace("\\", "/")
@@ -60,32 +63,145 @@ async def process_video(file: UploadFile) -> tuple[str, str, str | None]:
             raise e
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)} | Check server logs for details.")
 
-async def process_video_task(task_id: str, file_location: str, original_filename: str, language: str = "en"):
+def to_output_url(path: str) -> str:
+    """Convert an absolute path inside OUTPUT_DIR to a relative URL for serving on FE."""
+    rel_path = os.path.relpath(path, settings.OUTPUT_DIR).replace("\\", "/")
+    return f"/output/{rel_path}"
+
+def describe_ffmpeg_error(e: Exception) -> str:
+    """Return the FFmpeg stderr attached to an exception, formatted for error messages."""
+    if not hasattr(e, 'stderr'):
+        return ""
     try:
-        update_task_status(task_id, TaskStatus.PROCESSING)
-        print(f"Processing task {task_id}: {original_filename}")
-        
-        audio_path, video_path = split_video_audio(original_filename)
-        
-        # Convert absolute paths to Relative URLs for serving on FE
-        audio_rel_path = os.path.relpath(audio_path, settings.OUTPUT_DIR).replace("\\", "/")
-        video_rel_path = os.path.relpath(video_path, settings.OUTPUT_DIR).replace("\\", "/")
-        
-        # speech-to-text
+        stderr_output = e.stderr.decode() if isinstance(e.stderr, bytes) else str(e.stderr)
+        return f" | FFmpeg stderr: {stderr_output}"
+    except Exception as decode_error:
+        print(f"Could not decode stderr: {decode_error}")
+        return ""
+
+def demux_and_transcribe(
+    original_filename: str,
+    language: str = "en",
+    content_hash: str | None = None,
+    diarize: bool = False,
+    checkpoint=None
+):
+    """
+    Split an uploaded video (stored in INPUT_DIR) into audio/video and transcribe the audio.
+    When content_hash is given, demux and transcription results are reused from
+    the result cache, so repeated uploads skip ffmpeg and Whisper entirely.
+    With diarize, segments and words are also labelled with speakers.
+    With a JobCheckpoint, the demux outputs and every transcribed chunk
+    (TRANSCRIBE_CHUNK_SECONDS of audio) are checkpointed, and a resumed job
+    continues after the last finished chunk.
+
+    Returns:
+        (audio_path, video_path, transcription_result)
+    """
+    demuxed = result_cache.get_demux(content_hash) if content_hash else None
+    if not demuxed and checkpoint is not None:
+        stage = checkpoint.stage("demux")
+        if stage and os.path.exists(stage["audio_path"]) and os.path.exists(stage["video_path"]):
+            demuxed = stage["audio_path"], stage["video_path"]
+    if demuxed:
+        audio_path, video_path = demuxed
+    else:
+        with timed("split_video_audio", nbytes=file_size(os.path.join(settings.INPUT_DIR, original_filename))):
+            audio_path, video_path = split_video_audio(original_filename)
+        if content_hash:
+            result_cache.put_demux(content_hash, audio_path, video_path)
+        if checkpoint is not None:
+            checkpoint.complete_stage("demux", {"audio_path": audio_path, "video_path": video_path})
+
+    # speech-to-text
+    # Diarized and trimmed transcripts are cached separately from plain ones
+    model_key = MODEL_NAME + ("+diarize" if diarize else "") + ("+trim" if settings.TRIM_SILENCE else "")
+    transcription_result = result_cache.get_transcript(content_hash, language, model_key) if content_hash else None
+    if transcription_result is None:
         audio_filename = os.path.basename(audio_path)
         print(f"Transcribing audio: {audio_filename} in language {language}")
-        transcription_result = speech2text(audio_filename, language=language)
-        extracted_text = transcription_result.get("text", "")
+        resume = {}
+        if checkpoint is not None:
+            resume = {
+                "chunk_seconds": settings.TRANSCRIBE_CHUNK_SECONDS,
+                "chunks": checkpoint.chunks(f"{language}-{model_key}"),
+            }
+        with timed("speech2text", nbytes=file_size(audio_path)):
+            transcription_result = speech2text(
+                audio_filename, language=language, diarize=diarize, trim_silence=settings.TRIM_SILENCE, **resume
+            )
+        if content_hash:
+            result_cache.put_transcript(content_hash, language, model_key, transcription_result)
+    else:
+        print(f"Using cached transcription for {original_filename}")
 
-        video_url = f"/output/{video_rel_path}"
-        audio_url = f"/output/{audio_rel_path}"
+    return audio_path, video_path, transcription_result
+
+def save_transcript_index(task_id: str, index: TranscriptIndex) -> str | None:
+    """
+    Persist a task's word-timestamp index as OUTPUT_DIR/transcripts/<task_id>.npz.
+    Returns its output URL, or None for an empty transcript.
+    """
+    if len(index) == 0:
+        return None
+    path = os.path.join(settings.OUTPUT_DIR, "transcripts", f"{task_id}.npz")
+    with timed("save_transcript_index"):
+        index.save(path)
+        # Word arrays and text compress well; served as .br/.gz to clients that accept it
+        precompress(path)
+    return to_output_url(path)
+
+def _transcribe_and_index(task_id, original_filename, language, content_hash, checkpoint):
+    audio_path, video_path, transcription_result = demux_and_transcribe(
+        original_filename, language=language, content_hash=content_hash, checkpoint=checkpoint
+    )
+    index = TranscriptIndex.from_whisper(transcription_result)
+    return audio_path, video_path, transcription_result, index, save_transcript_index(task_id, index)
+
+async def process_video_task(
+    task_id: str,
+    file_location: str,
+    original_filename: str,
+    language: str = "en",
+    content_hash: str | None = None
+):
+    checkpoint = None
+    try:
+        update_task_status(task_id, TaskStatus.PROCESSING)
+        print(f"Processing task {task_id}: {original_filename}")
+        checkpoint = open_checkpoint(
+            "convert",
+            task_id,
+            args={
+                "file_location": file_location,
+                "original_filename": original_filename,
+                "language": language,
+                "content_hash": content_hash,
+            },
+            content_hash=content_hash,
+            params={"language": language},
+        )
+        
+        with collect_timings() as timings:
+            # ffmpeg and Whisper block for minutes: keep them off the event loop, so the
+            # server still answers while this job (or one resumed at startup) runs
+            audio_path, video_path, transcription_result, index, transcript_index_url = await run_in_threadpool(
+                _transcribe_and_index, task_id, original_filename, language, content_hash, checkpoint
+            )
         
         result = {
-            "video_url": video_url,
-            "audio_url": audio_url,
-            "text": extracted_text
+            "video_url": to_output_url(video_path),
+            "audio_url": to_output_url(audio_path),
+            "text": transcription_result.get("text", ""),
+            "word_count": len(index),
+            "timings": timings.summary()
         }
+        if transcript_index_url:
+            result["transcript_index_url"] = transcript_index_url
+        if "audio_skipped_percent" in transcription_result:
+            result["audio_skipped_percent"] = transcription_result["audio_skipped_percent"]
         update_task_result(task_id, result)
+        checkpoint.finish()
 
     except Exception as e:
         error_trace = traceback.format_exc()
@@ -93,13 +209,12 @@ async def process_video_task(task_id: str, file_location: str, original_filename
         print(f"Traceback: {error_trace}")
         
         # Capture FFmpeg stderr if available
-        stderr_msg = ""
-        if hasattr(e, 'stderr'):
-            try:
-                stderr_output = e.stderr.decode() if isinstance(e.stderr, bytes) else str(e.stderr)
-                stderr_msg = f" | FFmpeg stderr: {stderr_output}"
-                print(stderr_msg)
-            except Exception as decode_error:
-                print(f"Could not decode stderr: {decode_error}")
+        stderr_msg = describe_ffmpeg_error(e)
+        if stderr_msg:
+            print(stderr_msg)
         
         update_task_error(task_id, f"Processing failed: {str(e)}{stderr_msg}")
+        if checkpoint is not None:
+            checkpoint.release()
+
+register_resumable("convert", process_video_task)
@@ -0,0 +1,286 @@
+import os
+import struct
+import time
+import zipfile
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+from PIL import Image
+
+from core.config import settings
+from core.metrics import registry
+from services.task_manager import get_task, TaskStatus
+
+EXPORT_FORMATS = {
+    "cbz": "application/vnd.comicbook+zip",
+    "pdf": "application/pdf",
+}
+
+# Bytes read from a page file at a time; bounds the server memory per download
+READ_SIZE = 1024 * 1024
+
+# Page images are placed at this resolution, so a 1000x1400 page is 6.7 x 9.3 in (close to B5)
+PDF_DPI = 150
+
+def output_path(url: str) -> str:
+    """Path of an /output/ URL inside OUTPUT_DIR."""
+    return os.path.join(settings.OUTPUT_DIR, url[len("/output/"):])
+
+class ExportError(RuntimeError):
+    """The task cannot be exported (any more); raised before or while streaming."""
+
+def task_page_paths(task_id: str, poll_seconds: Optional[float] = None) -> Iterator[str]:
+    """
+    Paths of a task's pages in order. While the task runs, the pipeline publishes
+    every saved page in its result's manga_urls; this keeps polling for new ones
+    (blocking the calling thread for poll_seconds at a time) until the task finishes.
+
+    Raises:
+        ExportError: the task failed or disappeared, a page file is gone, or it finished without pages
+    """
+    poll_seconds = settings.EXPORT_POLL_SECONDS if poll_seconds is None else poll_seconds
+    sent = 0
+    while True:
+        task = get_task(task_id)
+        if task is None:
+            raise ExportError("Task not found")
+        # Pages and status from the same snapshot: a completed task has published all its pages
+        urls = (task.result or {}).get("manga_urls") or []
+        for url in urls[sent:]:
+            path = output_path(url)
+            if not os.path.exists(path):
+                raise ExportError(f"Page {url} is no longer available")
+            yield path
+        sent = len(urls)
+        if task.status == TaskStatus.FAILED:
+            raise ExportError(f"Task failed: {task.error}")
+        if task.status == TaskStatus.COMPLETED:
+            if sent == 0:
+                raise ExportError("Task finished without manga pages")
+            return
+        time.sleep(poll_seconds)
+
+class _Sink:
+    """Write-only, non-seekable file object collecting bytes until the generator yields them."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self.offset = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self.offset += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def iter_cbz(page_paths: Iterable[str], title: str = "") -> Iterator[bytes]:
+    """
+    Stream a CBZ (a ZIP of the page images) without building it in memory or on disk.
+
+    Pages are stored (ZIP_STORED): PNG/JPEG are already compressed, so the archive
+    costs no CPU and every page is copied in READ_SIZE pieces as it is read. The
+    output stream is not seekable, so zipfile writes sizes and CRCs in data
+    descriptors after each entry, which every ZIP reader supports.
+
+    Yields:
+        consecutive pieces of the archive
+    """
+    sink = _Sink()
+    count = 0
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for count, path in enumerate(page_paths, start=1):
+            stat = os.stat(path)
+            info = zipfile.ZipInfo(
+                f"{count:04d}{os.path.splitext(path)[1].lower()}",
+                date_time=time.localtime(stat.st_mtime)[:6],
+            )
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = stat.st_size
+            with open(path, "rb") as src, archive.open(info, "w") as dst:
+                while chunk := src.read(READ_SIZE):
+                    dst.write(chunk)
+                    yield sink.take()
+        # Page count and reading direction for comic readers
+        archive.writestr(
+            "ComicInfo.xml",
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<ComicInfo xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+            'xmlns:xsd="http://www.w3.org/2001/XMLSchema">\n'
+            f"  <Title>{_xml_escape(title)}</Title>\n"
+            f"  <PageCount>{count}</PageCount>\n"
+            "  <Manga>Yes</Manga>\n"
+            "</ComicInfo>\n",
+        )
+    yield sink.take()
+
+def _xml_escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _png_idat(path):
+    """
+    Header fields and IDAT chunk spans of a PNG, or None when it cannot be embedded as is.
+
+    PDF's FlateDecode with the PNG predictor reads PNG image data unchanged, so
+    8-bit gray/RGB non-interlaced PNGs (what the page writers produce) are copied
+    into the PDF without decoding or recompressing them.
+    """
+    with open(path, "rb") as f:
+        if f.read(8) != b"\x89PNG\r\n\x1a\n":
+            return None
+        spans = []
+        header = None
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                return None
+            length, kind = struct.unpack(">I4s", head)
+            if kind == b"IHDR":
+                width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", f.read(13))
+                f.seek(4, os.SEEK_CUR)
+                if depth != 8 or color not in (0, 2) or interlace:
+                    return None
+                header = (width, height, 1 if color == 0 else 3)
+                continue
+            if kind == b"IDAT":
+                spans.append((f.tell(), length))
+            elif kind == b"IEND":
+                break
+            f.seek(length + 4, os.SEEK_CUR)
+    return (*header, spans) if header and spans else None
+
+def _jpeg_info(path):
+    with Image.open(path) as image:
+        if image.format != "JPEG" or image.mode not in ("L", "RGB"):
+            return None
+        return image.width, image.height, 1 if image.mode == "L" else 3
+
+class _PdfWriter:
+    # Objects are written as soon as they are complete; only byte offsets are kept
+
+    def __init__(self, sink: _Sink):
+        self.sink = sink
+        self.offsets = {}
+        self.next_id = 3  # 1: catalog, 2: page tree (written last)
+        sink.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def begin(self, obj_id: int, dictionary: str):
+        self.offsets[obj_id] = self.sink.offset
+        self.sink.write(f"{obj_id} 0 obj\n{dictionary}".encode("latin-1"))
+
+    def obj(self, obj_id: int, dictionary: str):
+        self.begin(obj_id, dictionary)
+        self.sink.write(b"\nendobj\n")
+
+    def stream(self, obj_id: int, dictionary: str, data: bytes):
+        self.begin(obj_id, dictionary)
+        self.sink.write(b"\nstream\n" + data + b"\nendstream\nendobj\n")
+
+    def finish(self, page_ids: List[int]):
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        self.obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>")
+        self.obj(1, "<< /Type /Catalog /Pages 2 0 R /ViewerPreferences << /Direction /R2L >> >>")
+        xref = self.sink.offset
+        size = self.next_id
+        lines = ["xref", f"0 {size}", "0000000000 65535 f "]
+        for obj_id in range(1, size):
+            lines.append(f"{self.offsets.get(obj_id, 0):010d} 00000 n ")
+        lines.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        self.sink.write("\n".join(lines).encode("latin-1"))
+
+def iter_pdf(page_paths: Iterable[str]) -> Iterator[bytes]:
+    """
+    Stream a multi-page PDF with one full-page image per page.
+
+    PNG pages are embedded with their original compressed data (FlateDecode with
+    the PNG predictor) and JPEG pages as DCTDecode, so nothing is re-encoded and
+    each page is copied in READ_SIZE pieces. Pages that cannot be embedded
+    directly (alpha, palette, 16-bit, interlaced) are decoded and Flate-compressed
+    one at a time. The page tree and cross-reference table are written at the end,
+    so the document is produced in a single forward pass.
+
+    Yields:
+        consecutive pieces of the document
+    """
+    sink = _Sink()
+    pdf = _PdfWriter(sink)
+    page_ids = []
+    for path in page_paths:
+        image_id, content_id, page_id = pdf.reserve(), pdf.reserve(), pdf.reserve()
+        png = _png_idat(path)
+        jpeg = None if png else _jpeg_info(path)
+        if png:
+            width, height, colors, spans = png
+            color_space = "/DeviceGray" if colors == 1 else "/DeviceRGB"
+            pdf.begin(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /FlateDecode "
+                f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {width} >> "
+                f"/Length {sum(length for _, length in spans)} >>"
+            ))
+            sink.write(b"\nstream\n")
+            with open(path, "rb") as f:
+                for offset, length in spans:
+                    f.seek(offset)
+                    while length > 0:
+                        chunk = f.read(min(READ_SIZE, length))
+                        length -= len(chunk)
+                        sink.write(chunk)
+                        yield sink.take()
+            sink.write(b"\nendstream\nendobj\n")
+        elif jpeg:
+            width, height, colors = jpeg
+            color_space = "/DeviceGray" if colors == 1 else "/DeviceRGB"
+            pdf.begin(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode /Length {os.path.getsize(path)} >>"
+            ))
+            sink.write(b"\nstream\n")
+            with open(path, "rb") as f:
+                while chunk := f.read(READ_SIZE):
+                    sink.write(chunk)
+                    yield sink.take()
+            sink.write(b"\nendstream\nendobj\n")
+        else:
+            with Image.open(path) as image:
+                rgb = image.convert("RGB")
+            width, height = rgb.size
+            data = zlib.compress(rgb.tobytes(), 6)
+            del rgb
+            pdf.stream(image_id, (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>"
+            ), data)
+
+        page_w, page_h = width * 72 / PDF_DPI, height * 72 / PDF_DPI
+        content = f"q {page_w:.2f} 0 0 {page_h:.2f} 0 0 cm /Im0 Do Q".encode("latin-1")
+        pdf.stream(content_id, f"<< /Length {len(content)} >>", content)
+        pdf.obj(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.2f} {page_h:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ))
+        page_ids.append(page_id)
+        yield sink.take()
+    pdf.finish(page_ids)
+    yield sink.take()
+
+def iter_volume(page_paths: Iterable[str], export_format: str, title: str = "") -> Iterator[bytes]:
+    """Stream the pages as a CBZ or PDF volume; page_paths may still be growing (task_page_paths)."""
+    pieces = iter_cbz(page_paths, title) if export_format == "cbz" else iter_pdf(page_paths)
+    total = 0
+    for piece in pieces:
+        if piece:
+            total += len(piece)
+            yield piece
+    registry.inc("stage_bytes_total", total, {"stage": f"export_{export_format}"})
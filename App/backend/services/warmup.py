@@ -0,0 +1,45 @@
+import sys
+
+from core.config import settings
+from core.metrics import timed
+
+if settings.BASE_DIR not in sys.path:
+    sys.path.append(settings.BASE_DIR)
+
+WARMUP_MODELS = ("whisper", "segmenter")
+
+def _load_whisper():
+    from Speech.process_audio import model
+    model.load()
+
+def _load_segmenter():
+    from services.manga_processor import segmenter
+    segmenter.load()
+
+_LOADERS = {
+    "whisper": _load_whisper,
+    "segmenter": _load_segmenter,
+}
+
+def warm_up(models):
+    """
+    Load the given heavy models ahead of the first request that needs them.
+    Failures are logged and left to surface on first use.
+
+    Returns:
+        list of the models that loaded successfully
+    """
+    loaded = []
+    for name in models:
+        loader = _LOADERS.get(name)
+        if loader is None:
+            print(f"Unknown warm-up model '{name}', expected one of {', '.join(WARMUP_MODELS)}")
+            continue
+        try:
+            with timed(f"warmup_{name}"):
+                loader()
+            loaded.append(name)
+            print(f"Warm-up: {name} loaded")
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+    return loaded
@@ -7,6 +7,9 @@ from unittest.mock import MagicMock, patch
 # Mock whisper before it gets imported by anything
 sys.modules["whisper"] = MagicMock()
 
+# Keep tasks in memory so tests never touch the on-disk task database
+os.environ.setdefault("TASK_STORE_BACKEND", "memory")
+
 BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 PROJECT_ROOT = os.path.abspath(os.path.join(BACKEND_DIR, "..", ".."))
 
@@ -42,3 +42,204 @@ def test_convert_video_endpoint(client):
         assert status_data["id"] == task_id
         assert status_data["status"] == "completed"
         assert status_data["result"]["text"] == "System test transcription"
+
+def test_convert_deduplicates_identical_upload(client):
+    with patch("services.video_processor.split_video_audio") as mock_split, \
+         patch("services.video_processor.speech2text") as mock_speech:
+
+        from core.config import settings
+        audio_path = os.path.join(settings.OUTPUT_DIR, "audio", "dup.wav")
+        video_path = os.path.join(settings.OUTPUT_DIR, "video", "dup.mp4")
+        for path in (audio_path, video_path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+
+        mock_split.return_value = (audio_path, video_path)
+        mock_speech.return_value = {"text": "Deduplicated"}
+
+        files = {"file": ("dup.mp4", b"duplicate video content", "video/mp4")}
+        first = client.post("/convert", files=files, data={"language": "en"}).json()
+        second = client.post("/convert", files=files, data={"language": "en"}).json()
+
+        # The second upload reuses the finished task instead of reprocessing
+        assert second["task_id"] == first["task_id"]
+        assert second["status"] == "completed"
+        assert mock_split.call_count == 1
+
+        # A different language is a different job, but the demuxed audio/video is reused
+        third = client.post("/convert", files=files, data={"language": "fr"}).json()
+        assert third["task_id"] != first["task_id"]
+        assert mock_split.call_count == 1
+        assert mock_speech.call_count == 2
+        assert mock_speech.call_args.kwargs["language"] == "fr"
+
+def test_profiling_requires_admin_token(client, monkeypatch):
+    from core.config import settings
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+    files = {"file": ("profiled.mp4", b"profiled video content", "video/mp4")}
+    response = client.post("/convert", files=files, headers={"X-Profile": "sample"})
+    assert response.status_code == 403
+
+    response = client.post("/convert", files=files, headers={"X-Profile": "sample", "X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+def test_convert_with_profiling(client, monkeypatch):
+    from core.config import settings
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+    with patch("services.video_processor.split_video_audio") as mock_split, \
+         patch("services.video_processor.speech2text") as mock_speech:
+        mock_split.return_value = ("output/audio.wav", "output/video.mp4")
+        mock_speech.return_value = {"text": "Profiled"}
+
+        files = {"file": ("profiled.mp4", b"profiled video content", "video/mp4")}
+        response = client.post(
+            "/convert", files=files, headers={"X-Profile": "cprofile", "X-Admin-Token": "secret"}
+        )
+        assert response.status_code == 200
+
+        result = client.get(f"/status/{response.json()['task_id']}").json()["result"]
+        assert result["text"] == "Profiled"
+        profile_url = result["profile_url"]
+        assert profile_url.endswith("profile.prof")
+        assert os.path.exists(os.path.join(settings.OUTPUT_DIR, profile_url[len("/output/"):]))
+
+def test_concurrent_cprofile_is_rejected(client, monkeypatch):
+    from core.config import settings
+    from services.profiler import profile_task
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+    files = {"file": ("profiled.mp4", b"profiled video content", "video/mp4")}
+    headers = {"X-Profile": "cprofile", "X-Admin-Token": "secret"}
+    with profile_task("running", "cprofile"):
+        assert client.post("/convert", files=files, headers=headers).status_code == 409
+
+def test_cprofile_slot_is_not_leaked_when_the_request_fails(client, monkeypatch):
+    from core.config import settings
+    from services.profiler import profiler_busy
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+
+    files = [("files", ("a.png", b"png", "image/png"))]
+    headers = {"X-Profile": "cprofile", "X-Admin-Token": "secret"}
+    with patch("api.v1.api.create_task", side_effect=RuntimeError("store unavailable")):
+        with pytest.raises(RuntimeError):
+            client.post("/manga-layout", files=files, headers=headers)
+    assert not profiler_busy("cprofile")
+
+def test_export_streams_a_volume(client):
+    import io
+    import zipfile
+    from PIL import Image
+    from core.config import settings
+    from services.task_manager import create_task, update_task_result, update_task_error
+
+    urls = []
+    for i in range(3):
+        Image.new("RGB", (40, 56), (i * 80, 0, 0)).save(os.path.join(settings.OUTPUT_DIR, f"manga_{i}.png"))
+        urls.append(f"/output/manga_{i}.png")
+    task = create_task()
+    update_task_result(task.id, {"manga_urls": urls})
+
+    response = client.get(f"/export/{task.id}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.comicbook+zip"
+    assert f'filename="manga_{task.id}.cbz"' in response.headers["content-disposition"]
+    # Streamed: the length is not known up front
+    assert "content-length" not in response.headers
+    assert len(zipfile.ZipFile(io.BytesIO(response.content)).namelist()) == 4
+
+    pdf = client.get(f"/export/{task.id}", params={"format": "pdf"})
+    assert pdf.headers["content-type"] == "application/pdf"
+    assert pdf.content.startswith(b"%PDF") and b"/Count 3" in pdf.content
+
+    assert client.get(f"/export/{task.id}", params={"format": "epub"}).status_code == 400
+    assert client.get("/export/missing").status_code == 404
+    failed = create_task()
+    update_task_error(failed.id, "boom")
+    assert client.get(f"/export/{failed.id}").status_code == 409
+    converted = create_task()
+    update_task_result(converted.id, {"text": "no pages"})
+    assert client.get(f"/export/{converted.id}").status_code == 409
+    os.remove(os.path.join(settings.OUTPUT_DIR, "manga_1.png"))
+    assert client.get(f"/export/{task.id}").status_code == 410
+
+def test_export_follows_a_running_task(client, monkeypatch):
+    import io
+    import threading
+    import zipfile
+    from PIL import Image
+    from core.config import settings
+    from services.task_manager import create_task, merge_task_result, update_task_result, update_task_status, TaskStatus
+    monkeypatch.setattr(settings, "EXPORT_POLL_SECONDS", 0.01)
+
+    paths = [os.path.join(settings.OUTPUT_DIR, f"page_{i}.png") for i in range(3)]
+    for i, path in enumerate(paths):
+        Image.new("RGB", (40, 56), (0, i * 80, 0)).save(path)
+    task = create_task()
+    update_task_status(task.id, TaskStatus.PROCESSING)
+    merge_task_result(task.id, {"manga_urls": ["/output/page_0.png"]})
+
+    def finish_later():
+        # The remaining pages are saved while the download is already running
+        threading.Event().wait(0.1)
+        merge_task_result(task.id, {"manga_urls": ["/output/page_0.png", "/output/page_1.png"]})
+        threading.Event().wait(0.1)
+        update_task_result(task.id, {"manga_urls": [f"/output/page_{i}.png" for i in range(3)]})
+
+    worker = threading.Thread(target=finish_later)
+    worker.start()
+    response = client.get(f"/export/{task.id}")
+    worker.join()
+
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.namelist() == ["0001.png", "0002.png", "0003.png", "ComicInfo.xml"]
+    assert [archive.read(f"000{i + 1}.png") for i in range(3)] == [open(path, "rb").read() for path in paths]
+
+def test_convert_replaces_a_task_whose_worker_died(client):
+    import hashlib
+    import time
+    from services.checkpoints import open_checkpoint
+    from services.task_manager import create_task, get_task, tasks, update_task_status, TaskStatus
+
+    content = b"interrupted video content"
+    key = f"convert:{hashlib.sha256(content).hexdigest()}:en"
+    files = {"file": ("stuck.mp4", content, "video/mp4")}
+
+    def stuck_task():
+        task = create_task(key=key)
+        update_task_status(task.id, TaskStatus.PROCESSING)
+        # Last touched long ago, e.g. queued when the process exited
+        tasks.load(task.id).updated_at = time.time() - 3600
+        return task
+
+    with patch("api.v1.api.process_video_task") as job:
+        # Still running somewhere: its checkpoint lease is fresh, so the task is reused
+        running = stuck_task()
+        checkpoint = open_checkpoint("convert", running.id, {})
+        assert client.post("/convert", files=files).json()["task_id"] == running.id
+        checkpoint.finish()
+
+        # No worker and no checkpoint: the task is failed and the upload gets a new one
+        response = client.post("/convert", files=files).json()
+        assert response["task_id"] != running.id
+        assert get_task(running.id).status == TaskStatus.FAILED
+        assert job.call_count == 1
+
+def test_convert_reuses_a_task_still_waiting_in_the_queue(client):
+    import hashlib
+    import time
+    from services.task_manager import create_task, get_task, tasks, TaskStatus
+
+    content = b"queued video content"
+    key = f"convert:{hashlib.sha256(content).hexdigest()}:en"
+    queued = create_task(key=key)
+    # Under load a task can wait in the queue past CHECKPOINT_STALE_SECONDS
+    tasks.load(queued.id).updated_at = time.time() - 3600
+
+    with patch("api.v1.api.process_video_task") as job:
+        files = {"file": ("queued.mp4", content, "video/mp4")}
+        assert client.post("/convert", files=files).json()["task_id"] == queued.id
+        assert job.call_count == 0
+    assert get_task(queued.id).status == TaskStatus.PENDING
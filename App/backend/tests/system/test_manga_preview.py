@@ -0,0 +1,49 @@
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.config import settings
+from benchmarks.run_benchmarks import make_image
+from services.manga_processor import decode_for_panel
+
+def _upload(count, width=1280, height=720):
+    return [
+        ("files", (f"{i}.jpg", cv2.imencode(".jpg", make_image(width, height, seed=i))[1].tobytes(), "image/jpeg"))
+        for i in range(count)
+    ]
+
+def test_preview_renders_every_style_from_one_upload(client):
+    response = client.post(
+        "/manga-preview",
+        files=_upload(3),
+        data={"num_frames": "4", "preview_width": "250", "dedup": "false"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data["previews"]) == {"a", "b", "c"}
+
+    pages = {}
+    for style, url in data["previews"].items():
+        path = os.path.join(settings.OUTPUT_DIR, url[len("/output/"):])
+        pages[style] = np.asarray(Image.open(path))
+        assert pages[style].shape == (350, 250, 3)
+    # The styles really differ, and the fourth panel of the page is left blank
+    assert not np.array_equal(pages["a"], pages["c"])
+    # Each image was decoded and stylized once for all three styles
+    assert data["timings"]["preview_decode"]["calls"] == 3
+    assert data["timings"]["preview_stylize"]["calls"] == 3
+    assert data["timings"]["save_preview"]["calls"] == 3
+
+def test_preview_rejects_unknown_styles(client):
+    response = client.post("/manga-preview", files=_upload(1), data={"styles": "ax"})
+    assert response.status_code == 400
+
+def test_decode_for_panel_uses_reduced_decode(tmp_path):
+    path = str(tmp_path / "frame.jpg")
+    cv2.imwrite(path, make_image(1600, 1200))
+
+    assert decode_for_panel(path, 150, 120).shape == (150, 200, 3)
+    assert decode_for_panel(path, 1000, 700).shape == (1200, 1600, 3)
+    assert decode_for_panel(str(tmp_path / "missing.jpg"), 10, 10) is None
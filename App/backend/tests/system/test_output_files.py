@@ -0,0 +1,84 @@
+import gzip
+import os
+
+from core.config import settings
+from core.output_files import precompress, IMMUTABLE_CACHE_CONTROL
+
+def _write_output(name, data):
+    path = os.path.join(settings.OUTPUT_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def test_outputs_are_cacheable_and_revalidate(client):
+    # OUTPUT_DIR is a per-test directory: it is resolved at request time
+    _write_output("video/clip.mp4", bytes(range(256)) * 4)
+
+    response = client.get("/output/video/clip.mp4")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-type"] == "video/mp4"
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+
+    cached = client.get("/output/video/clip.mp4", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert cached.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+def test_range_requests_for_seeking(client):
+    data = bytes(range(256)) * 4
+    _write_output("video/clip.mp4", data)
+
+    response = client.get("/output/video/clip.mp4", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 100-199/1024"
+    assert response.content == data[100:200]
+
+    tail = client.get("/output/video/clip.mp4", headers={"Range": "bytes=-24"})
+    assert tail.status_code == 206 and tail.content == data[-24:]
+
+    # If-Range with a stale validator falls back to the full file
+    stale = client.get("/output/video/clip.mp4", headers={"Range": "bytes=0-9", "If-Range": '"0-0"'})
+    assert stale.status_code == 200 and stale.content == data
+
+    beyond = client.get("/output/video/clip.mp4", headers={"Range": "bytes=5000-"})
+    assert beyond.status_code == 416
+    assert beyond.headers["content-range"] == "bytes */1024"
+
+def test_precompressed_variants(client):
+    text = ("frame;stylize_c;bilateralFilter 42\n" * 500).encode()
+    path = _write_output("profiles/t1/profile.collapsed", text)
+    written = precompress(path)
+    assert path + ".gz" in written
+    assert gzip.decompress(open(path + ".gz", "rb").read()) == text
+
+    encoded = client.get("/output/profiles/t1/profile.collapsed", headers={"Accept-Encoding": "gzip"})
+    assert encoded.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in encoded.headers["vary"]
+    assert int(encoded.headers["content-length"]) < len(text) / 10
+    assert encoded.content == text
+
+    plain = client.get("/output/profiles/t1/profile.collapsed", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.content == text
+    # Each representation has its own validator
+    assert plain.headers["etag"] != encoded.headers["etag"]
+
+    refused = client.get("/output/profiles/t1/profile.collapsed", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in refused.headers
+
+def test_incompressible_outputs_get_no_variant():
+    path = _write_output("manga.png", os.urandom(4096))
+    assert precompress(path) == []
+    assert not os.path.exists(path + ".gz")
+
+def test_internal_directories_are_not_served(client):
+    _write_output("checkpoints/job/manifest.json", b"{}")
+    _write_output("cache/demux/abc.json", b"{}")
+
+    assert client.get("/output/checkpoints/job/manifest.json").status_code == 404
+    assert client.get("/output/cache/demux/abc.json").status_code == 404
+    assert client.get("/output/missing.png").status_code == 404
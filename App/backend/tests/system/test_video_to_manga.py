@@ -0,0 +1,133 @@
+
+import os
+import cv2
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+def write_test_video(path, num_frames=50, fps=10, size=(160, 120), shot_length=1):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    rng = np.random.default_rng(0)
+    for i in range(num_frames):
+        # Noise is sharp and bright enough to pass frame_clear; a shot repeats the same image
+        if i % shot_length == 0:
+            frame = rng.integers(60, 255, (size[1], size[0], 3), dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+
+@pytest.fixture
+def video_bytes(tmp_path):
+    path = tmp_path / "clip.mp4"
+    write_test_video(path)
+    if not path.exists() or path.stat().st_size == 0:
+        pytest.skip("OpenCV was built without an mp4 writer")
+    return path.read_bytes()
+
+def test_video_to_manga_endpoint(client, video_bytes):
+    transcription = {
+        "text": "Hello there. General Kenobi.",
+        "segments": [
+            {"start": 0.1, "end": 1.0, "text": " Hello there."},
+            {"start": 3.2, "end": 4.0, "text": " General Kenobi."},
+        ],
+    }
+    with patch("services.video_manga_pipeline.demux_and_transcribe") as mock_transcribe:
+        from core.config import settings
+        mock_transcribe.return_value = (
+            os.path.join(settings.OUTPUT_DIR, "audio", "clip.wav"),
+            os.path.join(settings.OUTPUT_DIR, "video", "clip.mp4"),
+            transcription,
+        )
+
+        files = {"file": ("clip.mp4", video_bytes, "video/mp4")}
+        # 5 second clip sampled every second -> 5 frames -> 2 pages of up to 4 panels
+        data = {"num_frames": "4", "frame_interval": "1.0", "width": "400", "height": "560"}
+        response = client.post("/video-to-manga", files=files, data=data)
+        assert response.status_code == 200
+        task_id = response.json()["task_id"]
+
+        status = client.get(f"/status/{task_id}").json()
+        assert status["status"] == "completed", status.get("error")
+        result = status["result"]
+
+        assert result["frames_extracted"] == 5
+        assert result["text"] == transcription["text"]
+        # Segments without word timestamps are indexed one entry each
+        assert result["word_count"] == 2
+        assert os.path.exists(os.path.join(settings.OUTPUT_DIR, result["transcript_index_url"][len("/output/"):]))
+        assert len(result["manga_urls"]) == 2
+        # Stages running in the threadpool still report to the task's timing breakdown
+        assert result["timings"]["stylize_c"]["calls"] == 5
+        assert result["timings"]["save_page"]["calls"] == 2
+        for url in result["manga_urls"]:
+            assert os.path.exists(os.path.join(settings.OUTPUT_DIR, url[len("/output/"):]))
+
+        # Working frames are cleaned up
+        assert not os.path.exists(os.path.join(settings.INPUT_DIR, "frames", task_id))
+
+def test_video_to_manga_rejects_non_video(client):
+    files = {"file": ("notes.txt", b"text", "text/plain")}
+    response = client.post("/video-to-manga", files=files)
+    assert response.status_code == 400
+
+def test_video_to_manga_collapses_duplicate_frames(client, tmp_path):
+    path = tmp_path / "static.mp4"
+    # Two 2.5 second shots of a still image each, sampled every second
+    write_test_video(path, shot_length=25)
+    if not path.exists() or path.stat().st_size == 0:
+        pytest.skip("OpenCV was built without an mp4 writer")
+
+    with patch("services.video_manga_pipeline.demux_and_transcribe", side_effect=RuntimeError("no audio")):
+        files = {"file": ("static.mp4", path.read_bytes(), "video/mp4")}
+        data = {"num_frames": "4", "frame_interval": "1.0", "width": "400", "height": "560"}
+        task_id = client.post("/video-to-manga", files=files, data=data).json()["task_id"]
+
+        result = client.get(f"/status/{task_id}").json()["result"]
+        assert result["frames_extracted"] == 5
+        assert result["frames_deduplicated"] == 3
+        assert result["frames_used"] == 2
+        assert result["timings"]["stylize_c"]["calls"] == 2
+
+def test_video_to_manga_retry_resumes_from_rendered_pages(client, video_bytes):
+    from services import video_manga_pipeline
+    save_page = video_manga_pipeline._save_page
+    saved = []
+
+    def crash_after_first_page(page):
+        if saved:
+            raise RuntimeError("worker preempted")
+        saved.append(save_page(page))
+        return saved[-1]
+
+    files = {"file": ("clip.mp4", video_bytes, "video/mp4")}
+    data = {"num_frames": "4", "frame_interval": "1.0", "width": "400", "height": "560"}
+    with patch("services.video_manga_pipeline.demux_and_transcribe", side_effect=RuntimeError("no audio")):
+        with patch("services.video_manga_pipeline._save_page", side_effect=crash_after_first_page):
+            failed_id = client.post("/video-to-manga", files=files, data=data).json()["task_id"]
+        assert client.get(f"/status/{failed_id}").json()["status"] == "failed"
+
+        task_id = client.post("/video-to-manga", files=files, data=data).json()["task_id"]
+        result = client.get(f"/status/{task_id}").json()["result"]
+
+    # Page 1 (4 panels) was checkpointed: only the panel of page 2 is stylized and saved again
+    assert result["manga_urls"][0] == saved[0]
+    assert len(result["manga_urls"]) == 2
+    assert result["frames_extracted"] == 5
+    assert result["timings"]["stylize_c"]["calls"] == 1
+    assert result["timings"]["save_page"]["calls"] == 1
+
+def test_video_to_manga_adaptive_pages_is_opt_in(client, video_bytes):
+    from services import video_manga_pipeline
+    files = {"file": ("clip.mp4", video_bytes, "video/mp4")}
+    data = {"num_frames": "4", "frame_interval": "1.0", "width": "400", "height": "560"}
+    with patch("services.video_manga_pipeline.demux_and_transcribe", side_effect=RuntimeError("no audio")), \
+         patch("services.video_manga_pipeline._plan_pages", wraps=video_manga_pipeline._plan_pages) as plan:
+        task_id = client.post("/video-to-manga", files=files, data=data).json()["task_id"]
+        # Fixed pages by default: frames stream into stylization without a volume plan
+        assert plan.call_count == 0
+        assert len(client.get(f"/status/{task_id}").json()["result"]["manga_urls"]) == 2
+
+        task_id = client.post("/video-to-manga", files=files, data={**data, "adaptive_pages": "true"}).json()["task_id"]
+        assert plan.call_count == 1
+        result = client.get(f"/status/{task_id}").json()["result"]
+        assert len(result["manga_urls"]) == 2
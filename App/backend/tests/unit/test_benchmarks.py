@@ -0,0 +1,22 @@
+
+from benchmarks.run_benchmarks import compare, measure, make_image
+
+def test_compare_flags_regressions_above_threshold():
+    baseline = {"results": {"fast": {"median": 1.0}, "slow": {"median": 1.0}, "gone": {"median": 1.0}}}
+    current = {"results": {"fast": {"median": 1.05}, "slow": {"median": 1.5}, "new": {"median": 1.0}}}
+
+    rows = {name: regressed for name, _, _, _, regressed in compare(current, baseline, threshold=0.10)}
+
+    # Cases missing from either report are not compared
+    assert rows == {"fast": False, "slow": True}
+
+def test_measure_reports_statistics():
+    stats = measure(lambda: None, rounds=4, warmup=0)
+    assert stats["rounds"] == 4
+    assert stats["min"] <= stats["median"]
+    assert stats["stdev"] >= 0
+
+def test_synthetic_image_is_deterministic():
+    a = make_image(64, 48, seed=1)
+    assert a.shape == (48, 64, 3)
+    assert (a == make_image(64, 48, seed=1)).all()
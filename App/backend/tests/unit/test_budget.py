@@ -0,0 +1,99 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from unittest.mock import patch
+
+from core.budget import PixelBudget, image_pixels
+
+async def test_reservation_waits_for_release():
+    budget = PixelBudget(100)
+    first = await budget.acquire(80)
+    waiter = asyncio.ensure_future(budget.acquire(50))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    budget.release(first)
+    assert await asyncio.wait_for(waiter, 1) == 50
+    assert budget.in_use == 50
+
+async def test_oversized_reservation_is_clamped():
+    budget = PixelBudget(100)
+    async with budget.reserve(10_000) as reserved:
+        assert reserved == 100
+    assert budget.in_use == 0
+
+async def test_waiters_are_served_in_order():
+    budget = PixelBudget(100)
+    held = await budget.acquire(100)
+    order = []
+
+    async def job(name, pixels):
+        async with budget.reserve(pixels):
+            order.append(name)
+
+    large = asyncio.ensure_future(job("large", 90))
+    await asyncio.sleep(0)
+    small = asyncio.ensure_future(job("small", 10))
+    await asyncio.sleep(0)
+    budget.release(held)
+    await asyncio.gather(large, small)
+    # The small reservation would fit earlier but must not overtake the large one
+    assert order == ["large", "small"]
+
+async def test_cancelled_waiter_does_not_leak():
+    budget = PixelBudget(100)
+    held = await budget.acquire(100)
+    waiter = asyncio.ensure_future(budget.acquire(60))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    budget.release(held)
+    assert budget.in_use == 0
+    assert await budget.acquire(100) == 100
+
+def test_image_pixels_reads_header(tmp_path):
+    path = tmp_path / "frame.png"
+    Image.new("RGB", (64, 48)).save(path)
+    assert image_pixels(str(path)) == 64 * 48
+    assert image_pixels(str(tmp_path / "missing.png")) == 0
+
+async def test_manga_generation_streams_within_budget(tmp_path, monkeypatch):
+    from core.config import settings
+    from services import manga_processor
+
+    paths = []
+    rng = np.random.default_rng(0)
+    for i in range(5):
+        path = tmp_path / f"still_{i}.png"
+        cv2.imwrite(str(path), rng.integers(0, 255, (120, 160, 3), dtype=np.uint8))
+        paths.append(str(path))
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+    paths.insert(2, str(tmp_path / "broken.png"))
+
+    # Room for two frames at a time within the job
+    monkeypatch.setattr(settings, "PIXEL_BUDGET_PER_JOB", 2 * 160 * 120)
+    peak = 0
+    original = manga_processor._process_image
+
+    def tracked(path, *args):
+        nonlocal peak
+        peak = max(peak, manga_processor.pixel_budget.in_use)
+        return original(path, *args)
+
+    with patch.object(manga_processor, "_process_image", side_effect=tracked):
+        urls = await manga_processor.process_manga_generation(
+            paths, width=400, height=560, num_frames=2, stylize_style="b"
+        )
+
+    # 5 readable images, 2 per page -> 3 pages (the last one padded)
+    assert len(urls) == 3
+    for url in urls:
+        page = Image.open(f"{settings.OUTPUT_DIR}/{url[len('/output/'):]}")
+        assert page.size == (400, 560)
+    assert 0 < peak <= 2 * 160 * 120
+    assert manga_processor.pixel_budget.in_use == 0
@@ -0,0 +1,174 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from core.config import settings
+from services import checkpoints
+from services.checkpoints import open_checkpoint, resume_orphaned_jobs, register_resumable, ChunkStore
+from services.task_manager import create_task, get_task, update_task_result, update_task_status, tasks, TaskStatus
+from services.video_processor import process_video_task
+from Speech import process_audio
+from Speech.speech_activity import plan_chunks
+
+def _expire(checkpoint):
+    # Simulate a worker that stopped touching its lease long ago
+    os.utime(checkpoint.lease_path, (0, 0))
+    checkpoints._heartbeats.remove(checkpoint)
+
+def test_plan_chunks_respects_the_chunk_length():
+    pcm = np.ones(100 * 160, dtype=np.float32)
+    pcm[60 * 160:61 * 160] = 0  # a quiet frame inside the last fifth of the first chunk
+    spans = np.array([[0, 100 * 160]])
+
+    chunks = plan_chunks(pcm, spans, 70 * 160)
+    assert [chunk.tolist() for chunk in chunks] == [[[0, 60 * 160]], [[60 * 160, 100 * 160]]]
+
+    # Short spans are grouped while they fit in one chunk
+    spans = np.array([[0, 10], [20, 30], [50, 60], [90, 95]])
+    assert [len(chunk) for chunk in plan_chunks(pcm, spans, 60)] == [3, 1]
+
+def test_transcribe_pcm_resumes_after_the_last_finished_chunk(tmp_path):
+    rate = process_audio.SAMPLE_RATE
+    pcm = np.full(30 * rate, 0.1, dtype=np.float32)
+    # Pauses where the (at most 12 s) chunks are cut
+    pcm[11 * rate:11 * rate + 160] = pcm[22 * rate:22 * rate + 160] = 0
+    store = ChunkStore(str(tmp_path / "chunks"))
+    calls = []
+
+    def fake_transcribe(audio, **kwargs):
+        calls.append(len(audio))
+        if len(calls) == 2:
+            raise RuntimeError("worker preempted")
+        return {"text": f" part{len(calls)}", "language": "en",
+                "segments": [{"start": 1.0, "end": 2.0, "text": " hi", "words": [{"word": " hi", "start": 1.0, "end": 2.0}]}]}
+
+    process_audio.model.transcribe.side_effect = fake_transcribe
+    try:
+        with pytest.raises(RuntimeError):
+            process_audio.transcribe_pcm(pcm, chunk_seconds=12, chunks=store)
+        assert len(store) == 1
+        result = process_audio.transcribe_pcm(pcm, chunk_seconds=12, chunks=store)
+    finally:
+        process_audio.model.transcribe.side_effect = None
+
+    # The first chunk came from the store: only the two remaining chunks were transcribed again
+    assert len(calls) == 4
+    assert result["text"] == " part1 part3 part4"
+    # Timestamps are in original time and segment ids are renumbered
+    assert [s["start"] for s in result["segments"]] == [1.0, 12.0, 23.0]
+    assert [s["id"] for s in result["segments"]] == [0, 1, 2]
+
+def test_checkpoint_is_shared_by_retries_but_not_by_running_jobs():
+    first, second = create_task(), create_task()
+    args = {"file_location": "x"}
+
+    running = open_checkpoint("convert", first.id, args, content_hash="abc", params={"language": "en"})
+    # Same work, but the first job is alive: the second gets its own checkpoint
+    concurrent = open_checkpoint("convert", second.id, args, content_hash="abc", params={"language": "en"})
+    assert concurrent.directory != running.directory
+    concurrent.finish()
+
+    running.complete_stage("demux", {"audio_path": "a.wav", "video_path": "v.mp4"})
+    running.release()
+    retry = open_checkpoint("convert", second.id, args, content_hash="abc", params={"language": "en"})
+    assert retry.directory == running.directory
+    assert retry.stage("demux") == {"audio_path": "a.wav", "video_path": "v.mp4"}
+    assert retry.read()["resumed"] == 1
+    retry.finish()
+    assert not os.path.exists(retry.directory)
+
+@pytest.mark.asyncio
+async def test_resume_orphaned_jobs(tmp_path):
+    input_file = tmp_path / "video.mp4"
+    input_file.write_bytes(b"v")
+    resumed = []
+
+    async def runner(task_id, **kwargs):
+        resumed.append((task_id, kwargs))
+
+    register_resumable("test_job", runner)
+    processing, completed = create_task(key="k"), create_task()
+    update_task_status(processing.id, TaskStatus.PROCESSING)
+    update_task_result(completed.id, {})
+    args = {"file_location": str(input_file)}
+    stuck = open_checkpoint("test_job", processing.id, args)
+    done = open_checkpoint("test_job", completed.id, args)
+    alive = open_checkpoint("test_job", create_task().id, args)
+    _expire(stuck)
+    _expire(done)
+
+    # The task store lost the task (in-memory store after a restart)
+    tasks.delete(processing.id)
+    assert await resume_orphaned_jobs() == [processing.id]
+    await asyncio.sleep(0)
+
+    assert resumed == [(processing.id, args)]
+    assert get_task(processing.id).key == "k"
+    # Claimed for the resumed job, so no other worker picks it up
+    assert not stuck.is_stale()
+    assert not os.path.exists(done.directory)
+    assert os.path.exists(alive.directory)
+    alive.finish()
+    stuck.finish()
+
+@pytest.mark.asyncio
+async def test_convert_task_resumes_from_its_demux_checkpoint(tmp_path):
+    audio_path, video_path = tmp_path / "audio.wav", tmp_path / "video.mp4"
+    audio_path.write_bytes(b"a")
+    video_path.write_bytes(b"v")
+    task = create_task()
+
+    with patch("services.video_processor.split_video_audio", return_value=(str(audio_path), str(video_path))) as split, \
+         patch("services.video_processor.speech2text", side_effect=RuntimeError("killed")) as speech:
+        await process_video_task(task.id, "input/test.mp4", "test.mp4", content_hash="h1")
+        assert get_task(task.id).status == TaskStatus.FAILED
+
+        speech.side_effect = None
+        speech.return_value = {"text": "Hello"}
+        retry = create_task()
+        await process_video_task(retry.id, "input/test.mp4", "test.mp4", content_hash="h1")
+
+    assert get_task(retry.id).status == TaskStatus.COMPLETED
+    split.assert_called_once()
+    # Transcription is chunked into the checkpoint
+    assert speech.call_args.kwargs["chunk_seconds"] == settings.TRANSCRIBE_CHUNK_SECONDS
+    assert isinstance(speech.call_args.kwargs["chunks"], ChunkStore)
+    # Completed jobs leave no checkpoint behind
+    assert os.listdir(checkpoints.checkpoint_root()) == []
+
+@pytest.mark.asyncio
+async def test_resumed_convert_job_does_not_block_the_server(tmp_path):
+    import threading
+    import httpx
+    from main import app
+
+    input_file = tmp_path / "video.mp4"
+    input_file.write_bytes(b"v")
+    task = create_task()
+    update_task_status(task.id, TaskStatus.PROCESSING)
+    args = {"file_location": str(input_file), "original_filename": "video.mp4", "language": "en", "content_hash": None}
+    _expire(open_checkpoint("convert", task.id, args))
+
+    release = threading.Event()
+
+    def slow_transcription(*args, **kwargs):
+        # A long Whisper run, blocking its thread
+        release.wait(5)
+        return str(tmp_path / "a.wav"), str(input_file), {"text": "Hello"}
+
+    with patch("services.video_processor.demux_and_transcribe", side_effect=slow_transcription):
+        assert await resume_orphaned_jobs() == [task.id]
+        await asyncio.sleep(0.05)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            response = await asyncio.wait_for(http.get(f"/status/{task.id}"), timeout=2)
+        assert response.json()["status"] == "processing"
+
+        release.set()
+        for _ in range(100):
+            if get_task(task.id).status == TaskStatus.COMPLETED:
+                break
+            await asyncio.sleep(0.02)
+    assert get_task(task.id).status == TaskStatus.COMPLETED
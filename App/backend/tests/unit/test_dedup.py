@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+import pytest
+
+from Frame.dedup import (
+    dhash, phash, hamming_distances, FrameHashIndex, dedup_frames, inspect_frame, is_near_duplicate
+)
+
+def _texture(seed, shape=(120, 160)):
+    noise = np.random.default_rng(seed).integers(0, 255, shape, dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (9, 9), 0)
+
+def test_hashes_tolerate_small_changes():
+    gray = _texture(0)
+    brighter = cv2.add(gray, 4)
+    other = _texture(1)
+    for fn in (dhash, phash):
+        base = fn(gray)
+        assert isinstance(base, np.uint64)
+        distances = hamming_distances(np.array([fn(brighter), fn(other)], dtype=np.uint64), base)
+        assert distances[0] <= 6
+        assert distances[1] > 16
+
+def test_hamming_distances_match_python_popcount():
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, 100, dtype=np.uint64) * np.uint64(2) + rng.integers(0, 2, 100, dtype=np.uint64)
+    value = hashes[3]
+    expected = [bin(int(h) ^ int(value)).count("1") for h in hashes]
+    assert hamming_distances(hashes, value).tolist() == expected
+
+def test_hash_index_grows_and_finds_nearest():
+    index = FrameHashIndex(capacity=2)
+    for value in (0b0, 0b1111, 0b11110000):
+        index.add(np.uint64(value))
+    assert index.size == 3
+    assert index.nearest(np.uint64(0b0111)) == (1, 1)
+    assert FrameHashIndex().nearest(np.uint64(5)) == (None, None)
+
+def test_dedup_keeps_sharpest_at_first_position(tmp_path):
+    sharp = _texture(0)
+    blurred = cv2.GaussianBlur(sharp, (5, 5), 0)
+    paths = {}
+    for name, image in (("blurred", blurred), ("other", _texture(1)), ("sharp", sharp)):
+        paths[name] = str(tmp_path / f"{name}.png")
+        cv2.imwrite(paths[name], image)
+    paths["broken"] = str(tmp_path / "broken.png")
+    (tmp_path / "broken.png").write_bytes(b"not an image")
+
+    clusters = dedup_frames([paths["blurred"], paths["sharp"], paths["other"], paths["broken"]])
+
+    assert [c.representative.path for c in clusters] == [paths["sharp"], paths["other"], paths["broken"]]
+    assert clusters[0].members == [paths["blurred"], paths["sharp"]]
+    assert clusters[0].first == 0
+
+def test_dedup_keeps_a_shot_that_comes_back(tmp_path):
+    paths = []
+    for name, image in (("a", _texture(0)), ("b", _texture(1)), ("a_again", cv2.add(_texture(0), 3))):
+        paths.append(str(tmp_path / f"{name}.png"))
+        cv2.imwrite(paths[-1], image)
+
+    # Only runs collapse: the returning shot stays where it reappears
+    clusters = dedup_frames(paths)
+    assert [c.representative.path for c in clusters] == paths
+    assert [c.first for c in clusters] == [0, 1, 2]
+
+def test_is_near_duplicate(tmp_path):
+    path = str(tmp_path / "frame.png")
+    cv2.imwrite(path, _texture(0))
+    info = inspect_frame(path)
+    assert is_near_duplicate(info, info)
+    assert not is_near_duplicate(None, info)
+    assert inspect_frame(str(tmp_path / "missing.png")) is None
+
+def test_manga_layout_collapses_near_duplicates(client):
+    texture = np.dstack([_texture(0)] * 3)
+    files = [
+        ("files", ("a.png", cv2.imencode(".png", texture)[1].tobytes(), "image/png")),
+        ("files", ("b.png", cv2.imencode(".png", cv2.add(texture, 3))[1].tobytes(), "image/png")),
+        ("files", ("c.png", cv2.imencode(".png", np.dstack([_texture(1)] * 3))[1].tobytes(), "image/png")),
+    ]
+    data = {"num_frames": "2", "width": "200", "height": "280", "stylize_style": "b"}
+    response = client.post("/manga-layout", files=files, data={**data, "dedup": "true"})
+    assert response.status_code == 200
+    assert response.json()["duplicates_removed"] == 1
+    assert len(response.json()["manga_urls"]) == 1
+
+    # Opt-in: by default every uploaded image gets a panel
+    response = client.post("/manga-layout", files=files, data=data)
+    assert response.json()["duplicates_removed"] == 0
+    assert len(response.json()["manga_urls"]) == 2
@@ -0,0 +1,87 @@
+import wave
+
+import numpy as np
+
+from Speech.diarization import diarize, assign_speakers, speakers_at, SAMPLE_RATE
+from Speech import process_audio
+
+# (f0, formants) of two synthetic voices
+VOICES = {
+    0: (110, [(700, 150), (1200, 200)]),
+    1: (210, [(400, 120), (2300, 300)]),
+}
+
+def _voice(seconds, speaker, rng):
+    f0, formants = VOICES[speaker]
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.03 * np.sin(2 * np.pi * 5 * t))) / SAMPLE_RATE
+    signal = np.zeros_like(t)
+    for harmonic in range(1, int(7000 / f0)):
+        amplitude = sum(np.exp(-((f0 * harmonic - center) / width) ** 2) for center, width in formants) + 0.02
+        signal += amplitude * np.sin(harmonic * phase)
+    # Syllable-rate loudness changes
+    signal *= 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t + rng.uniform(0, 6)) ** 2
+    return 0.3 * signal / np.abs(signal).max() + 0.003 * rng.standard_normal(len(t))
+
+def _conversation(turns, seed=0):
+    rng = np.random.default_rng(seed)
+    parts, truth, t = [], [], 0.0
+    for speaker, seconds in turns:
+        parts.append(_voice(seconds, speaker, rng))
+        truth.append((t, t + seconds, speaker))
+        # Short pause between turns
+        parts.append(0.003 * rng.standard_normal(int(0.3 * SAMPLE_RATE)))
+        t += seconds + 0.3
+    return np.concatenate(parts).astype(np.float32), truth
+
+def test_two_speakers_are_separated():
+    pcm, truth = _conversation([(0, 5), (1, 5), (0, 4), (1, 6)])
+    turns = diarize(pcm)
+
+    assert {turn["speaker"] for turn in turns} == {0, 1}
+    assert turns[0]["start"] == 0.0 and turns[-1]["end"] == round(len(pcm) / SAMPLE_RATE, 3)
+    # Away from the turn changes every instant gets its speaker
+    for start, end, speaker in truth:
+        times = np.arange(start + 0.8, end - 0.8, 0.1)
+        assert np.all(speakers_at(turns, times) == speaker)
+
+def test_single_speaker_stays_one_cluster():
+    pcm, _ = _conversation([(1, 15)])
+    assert {turn["speaker"] for turn in diarize(pcm)} == {0}
+
+def test_assign_speakers_labels_words_and_segments():
+    turns = [{"start": 0.0, "end": 2.0, "speaker": 0}, {"start": 2.0, "end": 5.0, "speaker": 1}]
+    result = {"segments": [
+        {"start": 0.2, "end": 2.4, "words": [
+            {"word": " Hi", "start": 0.2, "end": 0.6},
+            {"word": " there", "start": 0.7, "end": 1.0},
+            {"word": " you", "start": 2.1, "end": 2.4},
+        ]},
+        {"start": 3.0, "end": 4.0, "text": " No words here."},
+    ]}
+    assign_speakers(result, turns)
+
+    assert [w["speaker"] for w in result["segments"][0]["words"]] == [0, 0, 1]
+    assert [s["speaker"] for s in result["segments"]] == [0, 1]
+    assert result["speaker_count"] == 2
+
+def test_speech2text_diarizes_the_decoded_buffer(tmp_path):
+    pcm, _ = _conversation([(0, 5), (1, 5)])
+    path = tmp_path / "dialogue.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((pcm * 32767).astype(np.int16).tobytes())
+
+    process_audio.model.transcribe.return_value = {"text": "a b", "segments": [
+        {"start": 1.0, "end": 2.0, "words": [{"word": " a", "start": 1.0, "end": 2.0}]},
+        {"start": 7.0, "end": 8.0, "words": [{"word": " b", "start": 7.0, "end": 8.0}]},
+    ]}
+    # Absolute paths pass through the audio directory join
+    result = process_audio.speech2text(str(path), diarize=True)
+
+    audio = process_audio.model.transcribe.call_args.args[0]
+    assert isinstance(audio, np.ndarray) and audio.dtype == np.float32
+    assert [s["speaker"] for s in result["segments"]] == [0, 1]
+    assert result["speaker_turns"]
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+def test_app_import_defers_heavy_modules():
+    code = (
+        "import sys, main; "
+        "print(','.join(m for m in ('torch', 'transformers', 'whisper') if m in sys.modules))"
+    )
+    env = dict(os.environ, TASK_STORE_BACKEND="memory", WARMUP_MODELS="")
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
+
+def test_lazy_model_loads_on_first_use():
+    from Speech.process_audio import LazyModel
+
+    fake_whisper = MagicMock()
+    with patch.dict(sys.modules, {"whisper": fake_whisper}):
+        lazy = LazyModel("tiny")
+        assert not lazy.loaded
+        lazy.transcribe("clip.wav")
+        lazy.transcribe("clip.wav")
+
+    fake_whisper.load_model.assert_called_once_with("tiny", device="cpu")
+    assert fake_whisper.load_model.return_value.transcribe.call_count == 2
+
+def test_warm_up_loads_requested_models():
+    from services import warmup
+
+    whisper_loader, segmenter_loader = MagicMock(), MagicMock(side_effect=RuntimeError("no weights"))
+    with patch.dict(warmup._LOADERS, {"whisper": whisper_loader, "segmenter": segmenter_loader}):
+        loaded = warmup.warm_up(["whisper", "segmenter", "unknown"])
+
+    # A failed warm-up is not fatal; the model loads on first use instead
+    assert loaded == ["whisper"]
+    whisper_loader.assert_called_once()
+    segmenter_loader.assert_called_once()
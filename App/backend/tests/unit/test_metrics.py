@@ -0,0 +1,37 @@
+
+import pytest
+from core.metrics import MetricsRegistry, collect_timings, timed, registry
+
+def test_render_prometheus_histogram():
+    metrics = MetricsRegistry(prefix="test")
+    metrics.observe("stage_duration_seconds", 0.02, {"stage": "stylize_c"})
+    metrics.observe("stage_duration_seconds", 3.0, {"stage": "stylize_c"})
+    metrics.inc("stage_bytes_total", 100, {"stage": "stylize_c"})
+    metrics.set_gauge("pipeline_queue_depth", 2, {"queue": "extracted"})
+
+    text = metrics.render()
+    assert '# TYPE test_stage_duration_seconds histogram' in text
+    assert 'test_stage_duration_seconds_bucket{stage="stylize_c",le="0.025"} 1' in text
+    assert 'test_stage_duration_seconds_bucket{stage="stylize_c",le="+Inf"} 2' in text
+    assert 'test_stage_duration_seconds_count{stage="stylize_c"} 2' in text
+    assert 'test_stage_bytes_total{stage="stylize_c"} 100.0' in text
+    assert 'test_pipeline_queue_depth{queue="extracted"} 2.0' in text
+
+def test_timed_records_task_breakdown():
+    with collect_timings() as timings:
+        with timed("unit_stage", nbytes=10):
+            pass
+        with timed("unit_stage"):
+            pass
+    # Outside the block, stages are only recorded globally
+    with timed("unit_stage"):
+        pass
+
+    assert timings.summary()["unit_stage"]["calls"] == 2
+    assert 'vid2manga_stage_duration_seconds_count{stage="unit_stage"} 3' in registry.render()
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "vid2manga_result_cache_events_total" in response.text
@@ -0,0 +1,59 @@
+import numpy as np
+
+from Frame.detection import person_label_map, masks_to_label_map
+from services.manga_processor import draw_label_overlay, draw_masks_on_image
+
+def _reference_overlay(image, masks, color, alpha):
+    # The previous per-mask implementation
+    result = image.copy()
+    for mask in masks:
+        idx = mask > 0
+        result[idx] = (result[idx] * (1 - alpha) + np.array(color) * alpha).astype(np.uint8)
+    return result
+
+def _scene():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, (60, 80, 3), dtype=np.uint8)
+    first = np.zeros((60, 80), np.uint8)
+    first[5:30, 5:30] = 1
+    second = np.zeros((60, 80), np.uint8)
+    second[30:55, 40:70] = 1
+    return image, [first, second]
+
+def test_overlay_matches_per_mask_blend():
+    image, masks = _scene()
+    expected = _reference_overlay(image, masks, (255, 0, 0), 0.5)
+    actual = draw_masks_on_image(image, masks)
+    # addWeighted rounds where the old code truncated
+    assert np.abs(actual.astype(int) - expected.astype(int)).max() <= 1
+    assert actual is not image
+
+def test_overlay_colors_each_person_and_keeps_background():
+    image, masks = _scene()
+    labels = masks_to_label_map(masks, image.shape[:2])
+    colors = [(255, 0, 0), (0, 0, 255)]
+    out = draw_label_overlay(image, labels, colors=colors, alpha=1.0)
+
+    assert (out[labels == 1] == [255, 0, 0]).all()
+    assert (out[labels == 2] == [0, 0, 255]).all()
+    assert (out[labels == 0] == image[labels == 0]).all()
+
+def test_overlay_in_place_with_outline():
+    image, masks = _scene()
+    original = image.copy()
+    labels = masks_to_label_map(masks, image.shape[:2])
+    out = draw_label_overlay(image, labels, colors=[(0, 255, 0)], alpha=0.0, outline=1, out=image)
+
+    assert out is image
+    changed = (out != original).any(axis=-1)
+    # Only the borders change when the tint is transparent
+    assert changed.any()
+    assert not changed[15, 15] and not changed[0, 79]
+    assert (out[changed] == [0, 255, 0]).all()
+
+def test_person_label_map_picks_person_instances():
+    instance_map = np.array([[-1, 0, 1], [2, 2, -1]], dtype=np.int32)
+    # Instances 2 and 0 are people (in that order); instance 1 is something else
+    labels = person_label_map(instance_map, [2, 0])
+    assert labels.tolist() == [[0, 2, 0], [1, 1, 0]]
+    assert person_label_map(instance_map, []).max() == 0
@@ -0,0 +1,125 @@
+import itertools
+import os
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+from Frame.manga_layout import generate_manga_layout
+from Frame.pagination import panel_importance, panel_range, paginate
+from services.manga_processor import _PageWriter
+from services.video_manga_pipeline import Panel, PipelineOptions, _plan_pages
+from Speech.transcript_index import TranscriptIndex
+
+def _cost(importance, pages, panels_per_page):
+    # Objective of paginate, for comparing with every possible split
+    fills = np.add.reduceat(np.asarray(importance) / panels_per_page, np.cumsum([0] + pages[:-1]))
+    over = fills - 1.0
+    over[-1] = max(over[-1], 0.0)
+    return float((over ** 2).sum())
+
+def test_paginate_respects_bounds_and_keeps_the_last_page_short():
+    assert paginate(np.ones(5), 2, 4) == [4, 1]
+    assert paginate(np.ones(17), 4, 8) == [8, 8, 1]
+    assert paginate(np.ones(3), 4, 8) == [3]
+    assert paginate([], 4, 8) == []
+
+    pages = paginate(np.random.default_rng(0).uniform(0.25, 4.0, 500), 4, 8)
+    assert sum(pages) == 500
+    assert min(pages[:-1]) >= 4 and max(pages) <= 8
+
+def test_important_scenes_get_fewer_panels_per_page():
+    importance = [1.0] * 8 + [2.0] * 8 + [1.0] * 8
+    assert paginate(importance, *panel_range(8)) == [8, 4, 4, 8]
+
+def test_paginate_is_optimal():
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        importance = rng.uniform(0.25, 4.0, 9)
+        best = min(
+            _cost(importance, list(pages), 4)
+            for count in range(1, 10)
+            for pages in itertools.product(range(1, 5), repeat=count)
+            if sum(pages) == 9 and min(pages[:-1], default=2) >= 2
+        )
+        assert np.isclose(_cost(importance, paginate(importance, 2, 4), 4), best)
+
+def test_panel_importance_mixes_available_signals():
+    # Sharpness alone: a sharper image counts a bit more, on a log scale
+    sharpness_only = panel_importance([100.0, 10000.0])
+    assert sharpness_only[1] > sharpness_only[0]
+    assert sharpness_only[1] / sharpness_only[0] < 3
+
+    importance = panel_importance([500.0] * 4, shot_seconds=[1, 1, 1, 5], words_per_second=[0, 0, 0, 0])
+    # Silent transcripts are left out instead of zeroing every panel
+    assert importance[3] > 2 * importance[0]
+    assert np.all((importance >= 0.25) & (importance <= 4.0))
+    assert np.allclose(panel_importance([0.0, 0.0]), 1.0)
+
+def test_video_pages_follow_dialogue_density():
+    # 16 two-second shots; a dialogue-heavy exchange over shots 4..11
+    panels = [Panel(path=f"{i}.png", start=2.0 * i, sharpness=400.0) for i in range(16)]
+    words = [{"word": " w", "start": 8.0 + 0.25 * k, "end": 8.2 + 0.25 * k} for k in range(64)]
+    index = TranscriptIndex.from_whisper({"segments": [{"start": 8.0, "end": 24.0, "words": words}]})
+
+    pages = _plan_pages(panels, index, PipelineOptions(num_frames=4))
+    assert sum(pages) == 16
+    assert pages[0] == 4 and 2 in pages[1:]
+    # Without a transcript, equal shots give full pages
+    assert _plan_pages(panels, TranscriptIndex.from_whisper({}), PipelineOptions(num_frames=4)) == [4, 4, 4, 4]
+
+def test_page_writer_lays_out_a_short_last_page_without_padding():
+    from core.config import settings
+    writer = _PageWriter(400, 560, [4, 2], seed=1)
+    with patch("services.manga_processor.generate_manga_layout", wraps=generate_manga_layout) as layout:
+        for _ in range(3):
+            writer.add(Image.new("RGB", (80, 60), "red"))
+        # An unreadable image: the next images move up and the last page shrinks
+        writer.skip()
+        for _ in range(2):
+            writer.add(Image.new("RGB", (80, 60), "blue"))
+        writer.finish()
+
+    # The last page is laid out for its single image, no blank panel is rendered
+    assert [call.kwargs["num_frames"] for call in layout.call_args_list] == [4, 1]
+    assert len(writer.manga_urls) == 2
+    last = np.asarray(Image.open(os.path.join(settings.OUTPUT_DIR, writer.manga_urls[1][len("/output/"):])))
+    assert (last == [0, 0, 255]).all(axis=-1).mean() > 0.9
+
+def test_plan_pages_reuses_dedup_sharpness(tmp_path):
+    import cv2
+    from services.manga_processor import collapse_duplicates, plan_pages
+
+    rng = np.random.default_rng(3)
+    paths = []
+    for i in range(6):
+        path = str(tmp_path / f"{i}.png")
+        cv2.imwrite(path, rng.integers(0, 255, (48, 64), dtype=np.uint8))
+        paths.append(path)
+
+    kept, removed, sharpness = collapse_duplicates(paths)
+    assert removed == 0 and len(sharpness) == len(kept) == 6
+    with patch("services.manga_processor.cv2.imread", side_effect=AssertionError("decoded again")):
+        image_paths, pages = plan_pages(kept, num_frames=4, sharpness=sharpness)
+    assert image_paths == kept and sum(pages) == 6
+    # Same plan as decoding the images for it
+    assert plan_pages(kept, num_frames=4)[1] == pages
+
+def test_upload_endpoints_use_adaptive_pages_only_when_asked(client):
+    import cv2
+    from Frame.pagination import paginate as real_paginate
+
+    rng = np.random.default_rng(4)
+    files = [
+        ("files", (f"{i}.png", cv2.imencode(".png", rng.integers(0, 255, (60, 80, 3), dtype=np.uint8))[1].tobytes(), "image/png"))
+        for i in range(3)
+    ]
+    data = {"num_frames": "2", "width": "200", "height": "280", "stylize_style": "b"}
+    with patch("services.manga_processor.paginate", wraps=real_paginate) as paginate_mock:
+        # num_frames stays the panels per page unless adaptive_pages is requested
+        assert len(client.post("/manga-layout", files=files, data=data).json()["manga_urls"]) == 2
+        paginate_mock.assert_not_called()
+
+        response = client.post("/manga-layout", files=files, data={**data, "adaptive_pages": "true"})
+        assert response.status_code == 200
+        paginate_mock.assert_called_once()
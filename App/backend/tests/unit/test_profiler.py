@@ -0,0 +1,96 @@
+import os
+import time
+
+import pytest
+from core.config import settings
+from services.profiler import profile_task
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+def test_profile_task_disabled_is_noop():
+    with profile_task("task-off", None) as handle:
+        _busy(0.01)
+    assert handle is None
+    assert not os.path.exists(os.path.join(settings.OUTPUT_DIR, "profiles", "task-off"))
+
+def test_sampling_profile_writes_collapsed_stacks(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_SAMPLE_INTERVAL", 0.001)
+    with profile_task("task-sample", "sample") as handle:
+        _busy(0.1)
+
+    assert handle.url == "/output/profiles/task-sample/profile.collapsed"
+    with open(handle.path) as f:
+        lines = f.read().splitlines()
+    assert lines
+    assert any("_busy" in line for line in lines)
+    # Collapsed format: "frame;frame;frame <count>"
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+def test_cprofile_writes_stats_and_summary():
+    with profile_task("task-cprofile", "cprofile") as handle:
+        _busy(0.01)
+
+    assert os.path.exists(handle.path)
+    with open(os.path.join(handle.directory, "profile.txt")) as f:
+        assert "_busy" in f.read()
+
+def test_profile_task_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        profile_task("task-bad", "perf")
+
+def test_cprofile_runs_one_at_a_time():
+    from services.profiler import ProfilerBusy, profiler_busy
+    with profile_task("task-first", "cprofile"):
+        with pytest.raises(ProfilerBusy):
+            with profile_task("task-second", "cprofile"):
+                pass
+        assert profiler_busy("cprofile")
+        # The sampling profiler has no such restriction
+        assert not profiler_busy("sample")
+    # Released when the first run ends
+    assert not profiler_busy("cprofile")
+
+    # A profile that is never entered does not hold the slot
+    profile_task("task-unused", "cprofile")
+    with profile_task("task-third", "cprofile"):
+        pass
+
+@pytest.mark.asyncio
+async def test_profile_write_failure_marks_the_task_failed():
+    from unittest.mock import patch
+    from services.profiler import run_profiled, profiler_busy
+    from services.task_manager import create_task, get_task, update_task_result, TaskStatus
+
+    task = create_task()
+
+    async def job():
+        update_task_result(task.id, {"text": "done"})
+
+    with patch("services.profiler.precompress", side_effect=OSError("disk full")):
+        await run_profiled(task.id, "cprofile", job)
+
+    assert get_task(task.id).status == TaskStatus.FAILED
+    assert "disk full" in get_task(task.id).error
+    assert not profiler_busy("cprofile")
+
+@pytest.mark.asyncio
+async def test_job_runs_unprofiled_when_cprofile_is_taken():
+    from services.profiler import run_profiled
+    from services.task_manager import create_task, get_task, update_task_result, TaskStatus
+
+    task = create_task()
+
+    async def job():
+        update_task_result(task.id, {"text": "done"})
+
+    # Another request started a cprofile run after this one was accepted
+    with profile_task("task-other", "cprofile"):
+        await run_profiled(task.id, "cprofile", job)
+
+    result = get_task(task.id)
+    assert result.status == TaskStatus.COMPLETED
+    assert result.result["text"] == "done" and "profile_url" not in result.result
+    assert "already in progress" in result.result["profile_error"]
@@ -0,0 +1,59 @@
+
+import os
+import time
+import pytest
+from services.result_cache import ResultCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(root=str(tmp_path / "cache"), max_bytes=10_000)
+
+def test_transcript_roundtrip_and_counters(cache):
+    result = {"text": "hi", "segments": [{"start": 0.0, "end": 1.0, "words": [{"word": "hi", "start": 0.1, "end": 0.5}]}]}
+
+    assert cache.get_transcript("abc", "en", "base") is None
+    cache.put_transcript("abc", "en", "base", result)
+
+    assert cache.get_transcript("abc", "en", "base") == result
+    # Language and model are part of the key
+    assert cache.get_transcript("abc", "fr", "base") is None
+    assert cache.get_transcript("abc", "en", "small") is None
+
+    stats = cache.stats()
+    assert stats["transcript_hits"] == 1
+    assert stats["transcript_misses"] == 3
+
+def test_demux_requires_files_on_disk(cache, tmp_path):
+    audio = tmp_path / "a.wav"
+    video = tmp_path / "v.mp4"
+    audio.write_bytes(b"a")
+    video.write_bytes(b"v")
+
+    cache.put_demux("abc", str(audio), str(video))
+    assert cache.get_demux("abc") == (str(audio), str(video))
+
+    os.remove(audio)
+    assert cache.get_demux("abc") is None
+    assert cache.stats()["demux_hits"] == 1
+    assert cache.stats()["demux_misses"] == 1
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ResultCache(root=str(tmp_path / "cache"), max_bytes=2500)
+    payload = {"text": "x" * 1000}
+
+    cache.put_transcript("old", "en", "base", payload)
+    cache.put_transcript("recent", "en", "base", payload)
+    old_path = cache._path("transcripts", cache.transcript_key("old", "en", "base"))
+    past = time.time() - 100
+    os.utime(old_path, (past, past))
+    # Reading "old" refreshes it, so "recent" becomes the eviction candidate
+    cache.get_transcript("old", "en", "base")
+    recent_path = cache._path("transcripts", cache.transcript_key("recent", "en", "base"))
+    os.utime(recent_path, (past, past))
+
+    cache.put_transcript("new", "en", "base", payload)
+
+    assert cache.get_transcript("recent", "en", "base") is None
+    assert cache.get_transcript("old", "en", "base") == payload
+    assert cache.get_transcript("new", "en", "base") == payload
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,246 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+from unittest.mock import MagicMock
+
+from Frame.detection import PersonSegmenter, OnnxPersonSegmenter, create_segmenter
+
+def test_create_segmenter_backends(tmp_path):
+    assert type(create_segmenter("torch")) is PersonSegmenter
+    onnx = create_segmenter("onnx", cache_dir=str(tmp_path), intra_op_threads=2)
+    assert isinstance(onnx, OnnxPersonSegmenter)
+    assert onnx.onnx_path.startswith(str(tmp_path))
+    assert "/" not in onnx.onnx_path[len(str(tmp_path)) + 1:]
+    with pytest.raises(ValueError):
+        create_segmenter("tensorrt")
+
+def test_onnx_predict_feeds_session_and_wraps_logits():
+    segmenter = OnnxPersonSegmenter()
+    pixel_values = np.zeros((1, 3, 32, 32), dtype=np.float64)
+    segmenter.processor = MagicMock(return_value={"pixel_values": pixel_values})
+    class_logits = np.zeros((1, 5, 3), dtype=np.float32)
+    mask_logits = np.ones((1, 5, 8, 8), dtype=np.float32)
+    segmenter.session = MagicMock()
+    segmenter.session.run.return_value = [class_logits, mask_logits]
+
+    outputs = segmenter._predict(Image.new("RGB", (32, 32)))
+
+    names, feeds = segmenter.session.run.call_args.args
+    assert names == ["class_queries_logits", "masks_queries_logits"]
+    assert feeds["pixel_values"].dtype == np.float32
+    assert tuple(outputs.masks_queries_logits.shape) == (1, 5, 8, 8)
+    assert tuple(outputs.class_queries_logits.shape) == (1, 5, 3)
+
+def test_concurrent_first_load_loads_once():
+    import sys
+    import threading
+    import time
+    from unittest.mock import patch
+
+    loads = []
+
+    def from_pretrained(checkpoint):
+        loads.append(checkpoint)
+        # Slow enough for every thread to arrive while the first one loads
+        time.sleep(0.05)
+        return MagicMock()
+
+    transformers = MagicMock()
+    transformers.Mask2FormerForUniversalSegmentation.from_pretrained.side_effect = from_pretrained
+    torch = MagicMock()
+    torch.cuda.is_available.return_value = False
+    segmenter = PersonSegmenter()
+    seen = []
+
+    def first_call():
+        segmenter.load()
+        # A caller that returns from load() always finds the processor too
+        seen.append(segmenter.processor is not None)
+
+    with patch.dict(sys.modules, {"torch": torch, "transformers": transformers}):
+        threads = [threading.Thread(target=first_call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(loads) == 1
+    assert seen == [True] * 4 and segmenter.loaded
+
+def _mask_iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else np.logical_and(a, b).sum() / union
+
+def test_onnx_matches_torch_masks(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    torch_segmenter = PersonSegmenter(device="cpu")
+    try:
+        torch_segmenter.load()
+    except Exception as e:
+        pytest.skip(f"Mask2Former checkpoint unavailable: {e}")
+    onnx_segmenter = OnnxPersonSegmenter(cache_dir=str(tmp_path)).load()
+
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 255, (240, 320, 3), dtype=np.uint8))
+    expected = torch_segmenter._predict(image).masks_queries_logits.numpy() > 0
+    actual = onnx_segmenter._predict(image).masks_queries_logits.numpy() > 0
+
+    ious = [_mask_iou(e, a) for e, a in zip(expected[0], actual[0])]
+    assert min(ious) > 0.95
+
+class FakeDetector:
+    available = True
+
+    def __init__(self, detections):
+        self.detections = detections
+
+    def detect(self, image_np):
+        return self.detections
+
+def _precise_segmenter(shape=(120, 160)):
+    precise = MagicMock()
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[10:60, 20:50] = 1
+    precise.segment.return_value = (np.zeros(shape + (3,), np.uint8), mask.astype(np.int32), [mask], {})
+    return precise
+
+@pytest.fixture
+def frame_path(tmp_path):
+    path = tmp_path / "frame.png"
+    Image.new("RGB", (160, 120), "gray").save(path)
+    return str(path)
+
+def test_tiered_confident_detection_uses_coarse_mask(frame_path):
+    from Frame.detection import TieredPersonSegmenter
+
+    precise = _precise_segmenter()
+    tiered = TieredPersonSegmenter(precise=precise, detector=FakeDetector([(40, 10, 40, 100, 1.8)]))
+    image_np, instance_map, masks, outputs = tiered.segment(frame_path, min_area=100)
+
+    precise.segment.assert_not_called()
+    assert outputs["tier"] == "hog"
+    assert len(masks) == 1 and masks[0].shape == (120, 160)
+    # The ellipse sits inside the detection box
+    ys, xs = np.nonzero(masks[0])
+    assert xs.min() >= 40 and xs.max() < 80 and ys.min() >= 10 and ys.max() < 110
+    assert set(np.unique(instance_map)) == {-1, 0}
+
+def test_tiered_escalates_on_low_confidence_or_precise(frame_path):
+    from Frame.detection import TieredPersonSegmenter
+
+    precise = _precise_segmenter()
+    tiered = TieredPersonSegmenter(precise=precise, detector=FakeDetector([(40, 10, 40, 100, 0.4)]))
+    assert tiered.segment(frame_path)[3]["tier"] == "mask2former"
+    # The frame decoded for HOG is handed over instead of being read again
+    assert precise.segment.call_args.kwargs["image_np"].shape == (120, 160, 3)
+
+    confident = TieredPersonSegmenter(precise=precise, detector=FakeDetector([(40, 10, 40, 100, 1.8)]))
+    assert confident.segment(frame_path, precise=True)[3]["tier"] == "mask2former"
+    assert precise.segment.call_count == 2
+
+def test_tiered_keeps_typical_detections_on_the_fast_tier(frame_path):
+    from Frame.detection import TieredPersonSegmenter
+
+    precise = _precise_segmenter()
+    tiered = TieredPersonSegmenter(precise=precise, detector=FakeDetector([(40, 10, 40, 100, 0.8)]))
+    assert tiered.segment(frame_path, min_area=100)[3]["tier"] == "hog"
+    precise.segment.assert_not_called()
+
+def test_tiered_without_people_skips_model(frame_path):
+    from Frame.detection import TieredPersonSegmenter
+
+    precise = _precise_segmenter()
+    # Boxes below min_detection_score are noise
+    for detections in ([], [(0, 0, 64, 128, 0.1)]):
+        tiered = TieredPersonSegmenter(precise=precise, detector=FakeDetector(detections))
+        _, _, masks, outputs = tiered.segment(frame_path)
+        assert masks == [] and outputs["tier"] == "hog"
+    precise.segment.assert_not_called()
+
+def test_tiered_can_escalate_when_no_person_is_detected(frame_path):
+    from Frame.detection import TieredPersonSegmenter
+
+    precise = _precise_segmenter()
+    # For footage where HOG misses seated or partly visible people
+    tiered = TieredPersonSegmenter(precise=precise, detector=FakeDetector([]), escalate_on_empty=True)
+    _, _, masks, outputs = tiered.segment(frame_path)
+    assert len(masks) == 1 and outputs["tier"] == "mask2former"
+
+def test_hog_detector_runs_on_frame():
+    from Frame.detection import HogPersonDetector
+
+    detector = HogPersonDetector()
+    if not detector.available:
+        pytest.skip("OpenCV build without HOGDescriptor")
+    assert detector.detect(np.full((240, 320, 3), 127, dtype=np.uint8)) == []
+
+def test_invalid_segment_mode_is_rejected(client):
+    files = [("files", ("a.png", b"png", "image/png"))]
+    response = client.post("/manga-layout", files=files, data={"segment_mode": "fastest"})
+    assert response.status_code == 400
+
+def _scene(rng_seed, box, shape=(120, 160)):
+    """Textured background with a textured 'person' block at box=(x, y, w, h)."""
+    rng = np.random.default_rng(rng_seed)
+    background = cv2.GaussianBlur(rng.integers(0, 120, shape, dtype=np.uint8), (5, 5), 0)
+    person = cv2.GaussianBlur(np.random.default_rng(99).integers(130, 255, shape, dtype=np.uint8), (5, 5), 0)
+    x, y, w, h = box
+    frame = background.copy()
+    frame[y:y + h, x:x + w] = person[:h, :w]
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[y:y + h, x:x + w] = 1
+    return np.dstack([frame] * 3), mask
+
+class SceneSegmenter:
+    """Stands in for Mask2Former: returns the ground-truth mask registered for each path."""
+
+    def __init__(self):
+        self.masks = {}
+        self.calls = 0
+
+    def segment(self, image_path, **kwargs):
+        self.calls += 1
+        mask = self.masks[image_path]
+        return np.array(Image.open(image_path)), mask.astype(np.int32) - 1, [mask], {}
+
+def test_temporal_propagation_reuses_anchor(tmp_path):
+    from Frame.detection import TemporalMaskPropagator, mask_iou
+
+    segmenter = SceneSegmenter()
+    propagator = TemporalMaskPropagator(segmenter, min_area=50)
+    results = []
+    for i in range(5):
+        image, mask = _scene(0, (40 + 2 * i, 30, 30, 60))
+        path = str(tmp_path / f"shot_a_{i}.png")
+        Image.fromarray(image).save(path)
+        segmenter.masks[path] = mask
+        _, _, masks, outputs = propagator.segment(path)
+        results.append((masks, mask, outputs["temporal"]))
+
+    assert segmenter.calls == 1
+    assert [r[2] for r in results] == ["anchor"] + ["propagated"] * 4
+    for masks, truth, _ in results[1:]:
+        assert len(masks) == 1
+        assert mask_iou(masks[0], truth) > 0.7
+
+    # A different shot is segmented from scratch
+    image, mask = _scene(7, (100, 20, 30, 60))
+    Image.fromarray(255 - image).save(tmp_path / "shot_b.png")
+    segmenter.masks[str(tmp_path / "shot_b.png")] = mask
+    assert propagator.segment(str(tmp_path / "shot_b.png"))[3]["temporal"] == "anchor"
+    assert segmenter.calls == 2
+
+def test_temporal_reanchors_after_max_propagation(tmp_path):
+    from Frame.detection import TemporalMaskPropagator
+
+    segmenter = SceneSegmenter()
+    propagator = TemporalMaskPropagator(segmenter, max_propagation=2, min_area=50)
+    image, mask = _scene(0, (40, 30, 30, 60))
+    path = str(tmp_path / "still.png")
+    Image.fromarray(image).save(path)
+    segmenter.masks[path] = mask
+
+    kinds = [propagator.segment(path)[3]["temporal"] for _ in range(5)]
+    assert kinds == ["anchor", "propagated", "propagated", "anchor", "propagated"]
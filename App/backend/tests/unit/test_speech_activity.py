@@ -0,0 +1,132 @@
+import wave
+
+import numpy as np
+
+from Speech import process_audio
+from Speech.speech_activity import SAMPLE_RATE, speech_spans, trim_non_speech, TrimmedAudio
+
+rng = np.random.default_rng(0)
+
+def _speech(seconds, f0=130):
+    # Harmonic voice with formants, cut into syllables (~3.5 per second)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.05 * np.sin(2 * np.pi * 3 * t))) / SAMPLE_RATE
+    signal = np.zeros_like(t)
+    for harmonic in range(1, int(5000 / f0)):
+        frequency = f0 * harmonic
+        signal += (np.exp(-((frequency - 600) / 200) ** 2) + 0.6 * np.exp(-((frequency - 1500) / 300) ** 2) + 0.02) * np.sin(harmonic * phase)
+    return 0.3 * signal / np.abs(signal).max() * np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None) ** 0.7
+
+def _music(seconds):
+    # Sustained chord
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = sum(np.sin(2 * np.pi * f * t) + 0.3 * np.sin(4 * np.pi * f * t) for f in (220, 277, 330, 440))
+    return 0.2 * signal / np.abs(signal).max()
+
+def _silence(seconds, level=0.001):
+    return level * rng.standard_normal(int(seconds * SAMPLE_RATE))
+
+def _fixture():
+    parts = [
+        ("silence", _silence(3)), ("speech", _speech(2)), ("music", _music(4)), ("speech", _speech(2.5)),
+        ("silence", _silence(3)), ("noise", _silence(2, level=0.05)), ("speech", _speech(1.5)), ("silence", _silence(2)),
+    ]
+    regions, t = [], 0.0
+    for kind, samples in parts:
+        regions.append((kind, t, t + len(samples) / SAMPLE_RATE))
+        t += len(samples) / SAMPLE_RATE
+    return np.concatenate([samples for _, samples in parts]).astype(np.float32), regions
+
+def _syllables(audio):
+    # Onset/offset (s) of every syllable: runs of 10 ms frames well above the noise floor
+    frames = audio[:len(audio) // 160 * 160].reshape(-1, 160)
+    loud = (frames ** 2).mean(axis=1) > 1e-4
+    edges = np.diff(np.concatenate([[0], loud.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1) * 0.01, np.flatnonzero(edges == -1) * 0.01
+
+def test_speech_spans_skip_silence_music_and_noise():
+    pcm, regions = _fixture()
+    spans = speech_spans(pcm) / SAMPLE_RATE
+    kept = np.zeros(len(pcm) // 160, dtype=bool)
+    for start, end in spans:
+        kept[int(start * 100):int(end * 100)] = True
+
+    for kind, start, end in regions:
+        inner = kept[int(start * 100) + 100:int(end * 100) - 100]
+        if kind == "speech":
+            assert kept[int(start * 100):int(end * 100)].all()
+        elif len(inner):
+            # Away from the borders (padding/context) nothing but speech is kept
+            assert not inner.any(), kind
+
+    trimmed = trim_non_speech(pcm)
+    assert 40 < trimmed.skipped_percent < 75
+
+def test_trimmed_audio_maps_times_back():
+    pcm = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    trimmed = TrimmedAudio(pcm, [[SAMPLE_RATE, 2 * SAMPLE_RATE], [5 * SAMPLE_RATE, 8 * SAMPLE_RATE]])
+
+    # Second span starts after one second of audio plus the join gap
+    assert len(trimmed.audio) == 4 * SAMPLE_RATE + int(0.2 * SAMPLE_RATE)
+    np.testing.assert_allclose(trimmed.to_original([0.0, 0.5, 1.1, 1.2, 2.2]), [1.0, 1.5, 2.0, 5.0, 6.0])
+    assert trimmed.skipped_percent == 60.0
+
+def _write_wav(path, pcm):
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((pcm * 32767).astype(np.int16).tobytes())
+
+def test_word_timestamps_survive_trimming(tmp_path):
+    pcm, regions = _fixture()
+    path = tmp_path / "fixture.wav"
+    _write_wav(path, pcm)
+
+    def fake_transcribe(audio, **kwargs):
+        # A perfectly timed "Whisper": one word per syllable of the buffer it is given
+        starts, ends = _syllables(audio)
+        words = [{"word": f" w{i}", "start": s, "end": e} for i, (s, e) in enumerate(zip(starts, ends))]
+        return {"text": "", "segments": [{"start": starts[0], "end": ends[-1], "words": words}]}
+
+    process_audio.model.transcribe.side_effect = fake_transcribe
+    try:
+        full = fake_transcribe(process_audio.load_pcm(str(path)))
+        trimmed = process_audio.speech2text(str(path), trim_silence=True)
+    finally:
+        process_audio.model.transcribe.side_effect = None
+
+    audio = process_audio.model.transcribe.call_args.args[0]
+    assert len(audio) < 0.6 * len(pcm)
+    assert trimmed["audio_skipped_percent"] > 40
+    # Compare the words of the speech regions (the music/noise "words" get cut at the span borders)
+    speech = [(start, end) for kind, start, end in regions if kind == "speech"]
+    in_speech = lambda w: any(start <= w["start"] < end for start, end in speech)
+    expected = [(w["start"], w["end"]) for w in full["segments"][0]["words"] if in_speech(w)]
+    actual = [(w["start"], w["end"]) for w in trimmed["segments"][0]["words"] if in_speech(w)]
+    assert len(actual) == len(expected)
+    np.testing.assert_allclose(actual, expected, atol=0.011)
+
+def test_silent_audio_is_not_transcribed(tmp_path):
+    path = tmp_path / "silence.wav"
+    _write_wav(path, _silence(5))
+    process_audio.model.transcribe.reset_mock()
+
+    result = process_audio.speech2text(str(path), trim_silence=True)
+
+    assert not process_audio.model.transcribe.called
+    assert result["segments"] == [] and result["audio_skipped_percent"] == 100.0
+
+def test_frame_features_match_per_frame_reference(monkeypatch):
+    from Speech import speech_activity
+    # Several blocks, the last one partial
+    monkeypatch.setattr(speech_activity, "BLOCK_FRAMES", 64)
+    pcm, _ = _fixture()
+    energy_db, zcr, _, _ = speech_activity.frame_features(pcm)
+
+    starts = np.arange(len(energy_db)) * 160
+    assert starts[-1] + 400 <= len(pcm) < starts[-1] + 560
+    for start in starts[::37]:
+        frame = pcm[start:start + 400].astype(np.float64)
+        assert np.isclose(energy_db[start // 160], 10 * np.log10((frame ** 2).mean() + 1e-10), atol=1e-3)
+        assert zcr[start // 160] == np.count_nonzero(np.signbit(frame[1:]) != np.signbit(frame[:-1])) / 399
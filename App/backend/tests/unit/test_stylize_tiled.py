@@ -0,0 +1,63 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from Frame import frame_processor
+from Frame.frame_processor import stylize_a, stylize_c
+from benchmarks.run_benchmarks import make_image
+
+@pytest.fixture(autouse=True)
+def four_workers(monkeypatch):
+    monkeypatch.setattr(frame_processor, "_strip_workers", lambda: 4)
+
+@pytest.mark.parametrize("size", [(1205, 803), (1200, 800), (333, 512)])
+def test_stylize_a_strips_match_full_image(tmp_path, size):
+    path = str(tmp_path / "frame.png")
+    cv2.imwrite(path, make_image(*size))
+
+    full = stylize_a(path, tiled=False)
+    strips = stylize_a(path, tiled=True)
+
+    assert strips.shape == full.shape
+    # ±1 CLAHE rounding at strip seams can flip an occasional threshold pixel
+    assert np.mean(strips != full) < 1e-4
+
+def test_stylize_c_strips_match_full_image(tmp_path):
+    path = str(tmp_path / "frame.png")
+    cv2.imwrite(path, make_image(1000, 1100))
+
+    full = stylize_c(path, tiled=False)
+    strips = stylize_c(path, tiled=True)
+
+    assert np.abs(strips.astype(int) - full.astype(int)).max() <= 2
+
+def test_auto_tiling_threshold(tmp_path, monkeypatch):
+    path = str(tmp_path / "frame.png")
+    cv2.imwrite(path, make_image(640, 480))
+    calls = []
+    original = frame_processor._stylize_a_tiled
+    monkeypatch.setattr(frame_processor, "_stylize_a_tiled", lambda *a: calls.append(1) or original(*a))
+
+    stylize_a(path)
+    assert calls == []
+
+    monkeypatch.setattr(frame_processor, "TILE_MIN_PIXELS", 640 * 480)
+    stylize_a(path)
+    assert calls == [1]
+
+def test_tiled_calls_share_one_strip_pool():
+    seen = set()
+
+    def process(start, end):
+        seen.add(threading.current_thread().name)
+
+    frame_processor._run_strips(process, [(0, 1), (1, 2), (2, 3), (3, 4)], 4)
+    pool = frame_processor._strip_executor(4)
+    frame_processor._run_strips(process, [(0, 1), (1, 2)], 4)
+
+    assert frame_processor._strip_executor(4) is pool
+    assert frame_processor._strip_executor(2) is pool
+    # The same threads serve every call
+    assert seen and all(name.startswith("stylize-strip") for name in seen)
@@ -0,0 +1,103 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from Frame.frame_processor import StylizerEngine, stylize_a, stylize_b
+from benchmarks.run_benchmarks import make_image
+
+def _reference_a(img):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    edges = cv2.adaptiveThreshold(enhanced, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 9, 9)
+    return cv2.cvtColor(cv2.bitwise_and(enhanced, enhanced, mask=edges), cv2.COLOR_GRAY2RGB)
+
+def test_style_a_matches_reference_across_reused_buffers():
+    engine = StylizerEngine()
+    first, second = make_image(320, 240, seed=1), make_image(320, 240, seed=2)
+
+    result_first = engine.style_a(first, tiled=False)
+    result_second = engine.style_a(second, tiled=False)
+
+    # Scratch reuse must not leak one frame into the next or alias the returned image
+    np.testing.assert_array_equal(result_first, _reference_a(first))
+    np.testing.assert_array_equal(result_second, _reference_a(second))
+    assert not np.shares_memory(result_first, result_second)
+
+def test_scratch_buffers_are_reused_per_shape_and_thread():
+    engine = StylizerEngine(max_shapes=1)
+    buffer = engine.scratch("gray", (240, 320))
+    assert engine.scratch("gray", (240, 320)) is buffer
+    assert engine.clahe() is engine.clahe()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(engine.scratch("gray", (240, 320))))
+    thread.start()
+    thread.join()
+    assert other[0] is not buffer
+
+    # Only the most recent frame shape is kept
+    engine.scratch("gray", (480, 640))
+    assert engine.scratch("gray", (240, 320)) is not buffer
+
+def test_scratch_memory_is_bounded_and_released_after_batches():
+    engine = StylizerEngine(max_pixels=320 * 240, max_bytes=2 * 320 * 240)
+    # Frames over max_pixels are never cached
+    assert engine.scratch("gray", (480, 640)) is not engine.scratch("gray", (480, 640))
+
+    with engine.batch():
+        gray = engine.scratch("gray", (240, 320))
+        median = engine.scratch("gray_median", (240, 320))
+        # Over max_bytes: served, but not kept
+        assert engine.scratch("clahe", (240, 320)) is not engine.scratch("clahe", (240, 320))
+        with engine.batch():
+            pass
+        # Still reused while the outer batch runs
+        assert engine.scratch("gray", (240, 320)) is gray
+        assert engine.cached_bytes == gray.nbytes + median.nbytes
+
+    assert engine.cached_bytes == 0
+    assert engine.scratch("gray", (240, 320)) is not gray
+
+@pytest.mark.parametrize("stylize", [stylize_a, stylize_b])
+def test_wrappers_read_and_write_files(tmp_path, stylize):
+    source, target = str(tmp_path / "frame.png"), str(tmp_path / "styled.png")
+    cv2.imwrite(source, make_image(200, 120))
+
+    result = stylize(source, target)
+
+    assert result.shape == (120, 200, 3)
+    np.testing.assert_array_equal(cv2.imread(target)[..., ::-1], result)
+    assert stylize(str(tmp_path / "missing.png")) is None
+
+def test_shared_stages_run_once_per_frame(monkeypatch):
+    from Frame import frame_processor
+    calls = []
+    gray = frame_processor.STAGES["gray"]
+    monkeypatch.setitem(
+        frame_processor.STAGES, "gray",
+        frame_processor.Stage(gray.inputs, lambda engine, bgr: calls.append(1) or gray.fn(engine, bgr)),
+    )
+    engine = StylizerEngine()
+    img = make_image(200, 120)
+
+    results = engine.render(img, "abc", tiled=False)
+
+    assert calls == [1]
+    np.testing.assert_array_equal(results["a"], _reference_a(img))
+    np.testing.assert_array_equal(results["b"], engine.style_b(img))
+
+def test_stylize_many_writes_native_layout(tmp_path):
+    from Frame.frame_processor import stylize_many
+    source = str(tmp_path / "frame.png")
+    cv2.imwrite(source, make_image(200, 120))
+    outputs = {style: str(tmp_path / f"{style}.png") for style in "ac"}
+
+    results = stylize_many(source, "ac", outputs)
+
+    # Style a is saved as a single-channel image, style c as BGR
+    line_art = cv2.imread(outputs["a"], cv2.IMREAD_UNCHANGED)
+    assert line_art.ndim == 2
+    np.testing.assert_array_equal(line_art, results["a"][..., 0])
+    np.testing.assert_array_equal(cv2.imread(outputs["c"])[..., ::-1], results["c"])
@@ -0,0 +1,110 @@
+
+import time
+from unittest.mock import patch
+
+import pytest
+from services.task_store import SQLiteTaskStore, MemoryTaskStore, TaskStore
+from schemas.task import Task, TaskStatus
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path / "tasks.db"), ttl_seconds=60, cache_size=2)
+    yield store
+    store.close()
+
+def test_sqlite_store_roundtrip(sqlite_store):
+    task = Task(id="t1", status=TaskStatus.PENDING)
+    sqlite_store.save(task)
+
+    loaded = sqlite_store.load("t1")
+    assert loaded == task
+    assert "t1" in sqlite_store
+    assert sqlite_store.load("missing") is None
+    with pytest.raises(KeyError):
+        sqlite_store["missing"]
+
+def test_sqlite_store_uses_wal(sqlite_store):
+    mode = sqlite_store._conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode.lower() == "wal"
+
+def test_sqlite_store_shared_between_connections(sqlite_store):
+    # A second store on the same file simulates another uvicorn worker
+    other = SQLiteTaskStore(sqlite_store.path)
+    try:
+        task = Task(id="t1", status=TaskStatus.PROCESSING)
+        sqlite_store.save(task)
+        assert other.load("t1").status == TaskStatus.PROCESSING
+
+        task.status = TaskStatus.COMPLETED
+        task.result = {"text": "done"}
+        sqlite_store.save(task)
+        assert other.load("t1").result == {"text": "done"}
+    finally:
+        other.close()
+
+def test_sqlite_store_sees_changes_to_cached_finished_tasks(sqlite_store):
+    other = SQLiteTaskStore(sqlite_store.path)
+    try:
+        sqlite_store.save(Task(id="t1", status=TaskStatus.COMPLETED, result={"text": "done"}))
+        assert other.load("t1").result == {"text": "done"}
+        assert "t1" in other._cache
+
+        # e.g. the profiler adding profile_url to a completed task from another worker
+        task = sqlite_store.load("t1")
+        task.result["profile_url"] = "/output/profile.txt"
+        sqlite_store.save(task)
+        assert other.load("t1").result["profile_url"] == "/output/profile.txt"
+
+        task.status = TaskStatus.FAILED
+        sqlite_store.save(task)
+        assert other.load("t1").status == TaskStatus.FAILED
+
+        sqlite_store.delete("t1")
+        assert other.load("t1") is None
+    finally:
+        other.close()
+
+def test_sqlite_store_caches_only_finished_tasks(sqlite_store):
+    sqlite_store.save(Task(id="pending", status=TaskStatus.PENDING))
+    sqlite_store.save(Task(id="done", status=TaskStatus.COMPLETED, result={"a": 1}))
+    sqlite_store.load("pending")
+    sqlite_store.load("done")
+
+    assert "done" in sqlite_store._cache
+    assert "pending" not in sqlite_store._cache
+
+    # Cached copies must not leak mutations back into the cache
+    sqlite_store.load("done").result["a"] = 2
+    assert sqlite_store.load("done").result == {"a": 1}
+
+def test_sqlite_store_lru_cache_is_bounded(sqlite_store):
+    for i in range(5):
+        sqlite_store.save(Task(id=f"t{i}", status=TaskStatus.COMPLETED))
+    assert len(sqlite_store._cache) == 2
+    assert list(sqlite_store._cache) == ["t3", "t4"]
+
+@pytest.mark.parametrize("store_factory", [
+    lambda tmp_path: SQLiteTaskStore(str(tmp_path / "tasks.db"), ttl_seconds=60),
+    lambda tmp_path: MemoryTaskStore(ttl_seconds=60),
+])
+def test_evict_expired_only_removes_old_finished_tasks(tmp_path, store_factory):
+    store = store_factory(tmp_path)
+    old = time.time() - 120
+    with patch("services.task_store.time.time", return_value=old):
+        store.save(Task(id="old_done", status=TaskStatus.COMPLETED, created_at=old))
+        store.save(Task(id="old_failed", status=TaskStatus.FAILED, created_at=old))
+        store.save(Task(id="old_running", status=TaskStatus.PROCESSING, created_at=old))
+    store.save(Task(id="new_done", status=TaskStatus.COMPLETED))
+    # Started long ago but finished just now: kept for the full TTL
+    store.save(Task(id="long_job", status=TaskStatus.COMPLETED, created_at=old))
+
+    assert store.evict_expired() == 2
+    assert sorted(store) == ["long_job", "new_done", "old_running"]
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class PartialStore(TaskStore):
+        def load(self, task_id):
+            return None
+
+    with pytest.raises(TypeError, match="find_by_key"):
+        PartialStore()
@@ -0,0 +1,66 @@
+import numpy as np
+
+from Speech.transcript_index import TranscriptIndex
+
+RESULT = {
+    "text": " Hello there. General Kenobi!",
+    "segments": [
+        {"start": 0.0, "end": 1.2, "text": " Hello there.", "words": [
+            {"word": " Hello", "start": 0.1, "end": 0.5},
+            {"word": " there.", "start": 0.6, "end": 1.1},
+        ]},
+        {"start": 3.0, "end": 4.0, "text": " General Kenobi!", "words": [
+            {"word": " General", "start": 3.2, "end": 3.6},
+            {"word": " Kenobi!", "start": 3.6, "end": 4.0},
+        ]},
+        # Without word timestamps a segment is indexed as a single entry
+        {"start": 5.0, "end": 6.0, "text": " You are a bold one."},
+    ],
+}
+
+def test_words_between_uses_start_times():
+    index = TranscriptIndex.from_whisper(RESULT)
+
+    assert len(index) == 5
+    assert index.segment_count == 3
+    assert index.words_between(0.0, 1.0) == [("Hello", 0.1, 0.5), ("there.", 0.6, 1.1)]
+    assert index.text_between(0.5, 3.6) == "there. General"
+    assert index.text_between(4.5, np.inf) == "You are a bold one."
+    assert index.text_between(1.2, 3.0) == ""
+    assert [index.segment_of(i) for i in range(5)] == [0, 0, 1, 1, 2]
+
+def test_out_of_order_words_stay_searchable():
+    result = {"segments": [{"words": [
+        {"word": " a", "start": 1.0, "end": 1.2},
+        {"word": " b", "start": 0.9, "end": 1.4},
+        {"word": " c", "start": 2.0, "end": 2.2},
+    ]}]}
+    index = TranscriptIndex.from_whisper(result)
+    assert np.all(np.diff(index.starts) >= 0)
+    assert index.text_between(1.0, 2.0) == "a b"
+
+def test_save_and_load_round_trip(tmp_path):
+    index = TranscriptIndex.from_whisper({"segments": [{"words": [{"word": " Café", "start": 0.0, "end": 0.4}]}]})
+    path = str(tmp_path / "transcripts" / "task.npz")
+    index.save(path)
+
+    loaded = TranscriptIndex.load(path)
+    assert loaded.text == index.text
+    np.testing.assert_array_equal(loaded.offsets, index.offsets)
+    assert loaded.words_between(0, 1) == [("Café", 0.0, 0.4)]
+
+def test_empty_result():
+    index = TranscriptIndex.from_whisper({"text": ""})
+    assert len(index) == 0
+    assert index.text_between(0, 10) == ""
+
+def test_turns_between_splits_on_speaker_changes():
+    result = {"segments": [
+        {"speaker": 0, "words": [{"word": " Hi", "start": 0.0, "end": 0.2}, {"word": " Bob.", "start": 0.3, "end": 0.5}]},
+        {"speaker": 1, "words": [{"word": " Hey!", "start": 0.8, "end": 1.0, "speaker": 1}]},
+    ]}
+    index = TranscriptIndex.from_whisper(result)
+
+    assert index.turns_between(0, 2) == [(0, "Hi Bob."), (1, "Hey!")]
+    assert index.turns_between(0.8, 2) == [(1, "Hey!")]
+    assert index.turns_between(5, 6) == []
@@ -0,0 +1,36 @@
+
+import hashlib
+import io
+import os
+import pytest
+from fastapi import UploadFile
+from services.upload_store import save_upload
+
+def make_upload(content: bytes, filename: str = "clip.MP4") -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+@pytest.mark.asyncio
+async def test_save_upload_is_content_addressed(tmp_path):
+    content = b"x" * 2500
+    stored = await save_upload(make_upload(content), str(tmp_path), chunk_size=1000)
+
+    digest = hashlib.sha256(content).hexdigest()
+    assert stored.sha256 == digest
+    assert stored.filename == f"{digest}.mp4"
+    assert stored.size == len(content)
+    assert not stored.existed
+    with open(stored.path, "rb") as f:
+        assert f.read() == content
+
+@pytest.mark.asyncio
+async def test_save_upload_deduplicates_identical_content(tmp_path):
+    dest = tmp_path / "uploads"
+    first = await save_upload(make_upload(b"same", "a.mp4"), str(dest))
+    second = await save_upload(make_upload(b"same", "b.mp4"), str(dest))
+    other = await save_upload(make_upload(b"different", "a.mp4"), str(dest))
+
+    assert second.path == first.path
+    assert second.existed
+    assert other.path != first.path
+    # No temporary .part files are left behind
+    assert sorted(os.listdir(dest)) == sorted([first.filename, other.filename])
@@ -50,3 +50,58 @@ async def test_process_video_task_failure(mock_dependencies):
     assert tasks[task.id].status == TaskStatus.FAILED
     assert "Split failed" in tasks[task.id].error
 
+
+@pytest.mark.asyncio
+async def test_process_video_task_uses_result_cache(mock_dependencies, tmp_path):
+    mock_split, mock_speech = mock_dependencies
+
+    audio_path = tmp_path / "audio.wav"
+    video_path = tmp_path / "video.mp4"
+    audio_path.write_bytes(b"a")
+    video_path.write_bytes(b"v")
+    mock_split.return_value = (str(audio_path), str(video_path))
+    mock_speech.return_value = {"text": "Cached", "segments": []}
+
+    first = create_task()
+    await process_video_task(first.id, "input/abc.mp4", "abc.mp4", content_hash="abc")
+    second = create_task()
+    await process_video_task(second.id, "input/abc.mp4", "abc.mp4", content_hash="abc")
+
+    assert tasks[second.id].status == TaskStatus.COMPLETED
+    for key in ("video_url", "audio_url", "text"):
+        assert tasks[second.id].result[key] == tasks[first.id].result[key]
+    # Second run is served entirely from the cache
+    mock_split.assert_called_once()
+    mock_speech.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_process_video_task_reports_stage_timings(mock_dependencies):
+    mock_split, mock_speech = mock_dependencies
+    mock_split.return_value = ("/output/audio.wav", "/output/video.mp4")
+    mock_speech.return_value = {"text": "Hello world"}
+
+    task = create_task()
+    await process_video_task(task.id, "input/test.mp4", "test.mp4")
+
+    timings = tasks[task.id].result["timings"]
+    assert timings["split_video_audio"]["calls"] == 1
+    assert timings["speech2text"]["calls"] == 1
+
+@pytest.mark.asyncio
+async def test_process_video_task_saves_transcript_index(mock_dependencies):
+    from core.config import settings
+    from Speech.transcript_index import TranscriptIndex
+    mock_split, mock_speech = mock_dependencies
+    mock_split.return_value = ("/output/audio.wav", "/output/video.mp4")
+    mock_speech.return_value = {"text": " Hi you", "segments": [{"words": [
+        {"word": " Hi", "start": 0.0, "end": 0.3},
+        {"word": " you", "start": 0.4, "end": 0.6},
+    ]}]}
+
+    task = create_task()
+    await process_video_task(task.id, "input/test.mp4", "test.mp4")
+
+    result = tasks[task.id].result
+    assert result["word_count"] == 2
+    index = TranscriptIndex.load(os.path.join(settings.OUTPUT_DIR, result["transcript_index_url"][len("/output/"):]))
+    assert index.text_between(0.35, 1.0) == "you"
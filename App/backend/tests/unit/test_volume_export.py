@@ -0,0 +1,92 @@
+import io
+import re
+import zipfile
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from services.volume_export import iter_cbz, iter_pdf, READ_SIZE
+
+def _pages(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, (size, mode, ext) in enumerate([((60, 40), "RGB", "png"), ((30, 20), "RGB", "jpg"), ((16, 12), "RGBA", "png")]):
+        channels = len(mode)
+        path = tmp_path / f"page{i}.{ext}"
+        Image.fromarray(rng.integers(0, 255, (size[1], size[0], channels), dtype=np.uint8), mode).save(path)
+        paths.append(str(path))
+    return paths
+
+def _unfilter_png_rows(data, width, height, channels):
+    # Undo the PNG row filters (what /Predictor 15 asks a PDF reader to do)
+    stride = width * channels
+    rows = np.zeros((height, stride), dtype=np.int32)
+    previous = np.zeros(stride, dtype=np.int32)
+    for y in range(height):
+        kind, line = data[y * (stride + 1)], np.frombuffer(data, np.uint8, stride, y * (stride + 1) + 1).astype(np.int32)
+        row = np.zeros(stride, dtype=np.int32)
+        for x in range(stride):
+            left = row[x - channels] if x >= channels else 0
+            up, up_left = previous[x], previous[x - channels] if x >= channels else 0
+            if kind == 0:
+                predicted = 0
+            elif kind == 1:
+                predicted = left
+            elif kind == 2:
+                predicted = up
+            elif kind == 3:
+                predicted = (left + up) // 2
+            else:
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                predicted = left if pa <= pb and pa <= pc else (up if pb <= pc else up_left)
+            row[x] = (line[x] + predicted) & 0xFF
+        rows[y] = previous = row
+    return rows.astype(np.uint8).reshape(height, width, channels)
+
+def test_cbz_stores_pages_unchanged(tmp_path):
+    paths = _pages(tmp_path)
+    pieces = list(iter_cbz(paths, title="Vol <1>"))
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(pieces)))
+    assert archive.testzip() is None
+    assert archive.namelist() == ["0001.png", "0002.jpg", "0003.png", "ComicInfo.xml"]
+    for name, path in zip(archive.namelist(), paths):
+        assert archive.getinfo(name).compress_type == zipfile.ZIP_STORED
+        assert archive.read(name) == open(path, "rb").read()
+    assert "<PageCount>3</PageCount>" in archive.read("ComicInfo.xml").decode()
+    assert "Vol &lt;1&gt;" in archive.read("ComicInfo.xml").decode()
+    # Streamed as it is written: no piece is larger than one read plus headers
+    assert max(len(piece) for piece in pieces) < READ_SIZE + 4096
+
+def test_pdf_embeds_pages_without_reencoding(tmp_path):
+    paths = _pages(tmp_path)
+    pdf = b"".join(iter_pdf(paths))
+
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+    # Every cross-reference entry points at its object
+    xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    entries = re.findall(rb"(\d{10}) 00000 n ", pdf[xref:])
+    for obj_id, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(f"{obj_id} 0 obj".encode())
+    assert b"/Count 3" in pdf
+
+    streams = re.findall(rb"/Length (\d+) >>\nstream\n", pdf)
+    images = [m for m in re.finditer(rb"/Subtype /Image (.*?)/Length (\d+) >>\nstream\n", pdf)]
+    assert len(images) == 3 and len(streams) == 6
+
+    def stream_data(match):
+        return pdf[match.end():match.end() + int(match.group(2))]
+
+    # PNG: the IDAT data is copied as is and decodes to the original pixels
+    assert b"/Predictor 15" in images[0].group(1)
+    original = np.asarray(Image.open(paths[0]))
+    decoded = _unfilter_png_rows(zlib.decompress(stream_data(images[0])), 60, 40, 3)
+    np.testing.assert_array_equal(decoded, original)
+    # JPEG: the file itself is the stream
+    assert b"/DCTDecode" in images[1].group(1)
+    assert stream_data(images[1]) == open(paths[1], "rb").read()
+    # RGBA cannot be embedded directly and is flattened to RGB
+    flattened = np.frombuffer(zlib.decompress(stream_data(images[2])), np.uint8).reshape(12, 16, 3)
+    np.testing.assert_array_equal(flattened, np.asarray(Image.open(paths[2]).convert("RGB")))
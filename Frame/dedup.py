@@ -0,0 +1,162 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from Frame.frame_processor import sharpness_score
+
+def dhash(gray, hash_size=8):
+    """
+    Difference hash: sign of the horizontal gradient on a (hash_size+1) x hash_size thumbnail.
+
+    Args:
+        gray: Grayscale image (2D uint8 array).
+        hash_size: Bits per row/column; 8 gives a 64-bit hash.
+
+    Returns:
+        The hash as a np.uint64 (hash_size must be 8).
+    """
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits.reshape(-1)).view(">u8")[0].astype(np.uint64)
+
+def phash(gray, hash_size=8, highfreq_factor=4):
+    """
+    Perceptual hash: low-frequency DCT coefficients of a 32x32 thumbnail compared to their median.
+    More robust than dHash to re-encoding and small shifts, slightly slower.
+
+    Returns:
+        The hash as a np.uint64.
+    """
+    size = hash_size * highfreq_factor
+    small = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size]
+    # The DC term only carries overall brightness
+    bits = low > np.median(low.reshape(-1)[1:])
+    return np.packbits(bits.reshape(-1)).view(">u8")[0].astype(np.uint64)
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(values):
+        return np.bitwise_count(values)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+def hamming_distances(hashes, value):
+    """
+    Hamming distance between one 64-bit hash and an array of hashes.
+
+    Args:
+        hashes: np.ndarray of np.uint64.
+        value: np.uint64 hash.
+
+    Returns:
+        np.ndarray of bit distances (same length as hashes).
+    """
+    return _popcount(np.bitwise_xor(hashes, np.uint64(value)))
+
+class FrameHashIndex:
+    """
+    Growable index of 64-bit frame hashes packed in a uint64 array.
+    Lookups compare against every stored hash in one vectorized XOR + popcount.
+    """
+
+    def __init__(self, capacity=64):
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self.size = 0
+
+    def add(self, value):
+        """Store a hash and return its position."""
+        if self.size == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+        self._hashes[self.size] = value
+        self.size += 1
+        return self.size - 1
+
+    def nearest(self, value):
+        """Returns (position, distance) of the closest stored hash, or (None, None) if empty."""
+        if self.size == 0:
+            return None, None
+        distances = hamming_distances(self._hashes[:self.size], value)
+        position = int(np.argmin(distances))
+        return position, int(distances[position])
+
+@dataclass
+class FrameInfo:
+    path: str
+    hash: int
+    sharpness: float
+
+@dataclass
+class FrameCluster:
+    # Position of the first member in the input order
+    first: int
+    representative: FrameInfo
+    members: List[str] = field(default_factory=list)
+
+def inspect_frame(image_path, hash_name="dhash", gray=None, sharpness=None):
+    """
+    Decode a frame once and compute its perceptual hash and Laplacian sharpness.
+
+    Returns:
+        FrameInfo, or None if the image cannot be read.
+    """
+    if gray is None:
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None
+    if sharpness is None:
+        sharpness = sharpness_score(gray)
+    return FrameInfo(path=image_path, hash=int(HASHES[hash_name](gray)), sharpness=float(sharpness))
+
+def dedup_frames(image_paths, threshold=6, hash_name="dhash") -> List[FrameCluster]:
+    """
+    Collapse runs of near-duplicate frames.
+
+    Each frame is compared only with the current run, like the video filter
+    stage: it joins the run if its hash differs from the run's representative
+    by at most `threshold` bits, otherwise it starts a new run. A shot that
+    comes back later in the sequence is kept where it reappears. The sharpest
+    member (variance of the Laplacian, as in frame_clear) represents the run.
+    Unreadable files are kept as their own cluster so callers can report them
+    as before; they also end the current run.
+
+    Args:
+        image_paths: Frames in display order.
+        threshold: Maximum Hamming distance (out of 64 bits) for near-duplicates.
+        hash_name: "dhash" or "phash".
+
+    Returns:
+        Clusters ordered by their first member.
+    """
+    clusters: List[FrameCluster] = []
+    # Cluster of the current run, None after an unreadable frame
+    current: Optional[FrameCluster] = None
+
+    for position, path in enumerate(image_paths):
+        info = inspect_frame(path, hash_name)
+        if info is None:
+            clusters.append(FrameCluster(first=position, representative=FrameInfo(path, 0, 0.0), members=[path]))
+            current = None
+            continue
+
+        if current is not None and is_near_duplicate(current.representative, info, threshold):
+            current.members.append(path)
+            if info.sharpness > current.representative.sharpness:
+                current.representative = info
+            continue
+
+        current = FrameCluster(first=position, representative=info, members=[path])
+        clusters.append(current)
+    return clusters
+
+def is_near_duplicate(a: Optional[FrameInfo], b: Optional[FrameInfo], threshold=6):
+    """True if two inspected frames differ by at most `threshold` hash bits."""
+    if a is None or b is None:
+        return False
+    return int(hamming_distances(np.array([a.hash], dtype=np.uint64), b.hash)[0]) <= threshold
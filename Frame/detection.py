@@ -1,39 +1,68 @@
 import os
 import sys
+import threading
 
 project_root = os.path.abspath(os.path.join(os.getcwd(), ".."))
 if project_root not in sys.path:
     sys.path.append(project_root)
 
-from transformers import AutoImageProcessor, Mask2FormerForUniversalSegmentation, Mask2FormerImageProcessor
 from PIL import Image
-import requests
-import torch
-import matplotlib.pyplot as plt
 import numpy as np
 import cv2
 
+# torch and transformers take seconds to import; they are loaded on first use in load()
+
 class PersonSegmenter:
     def __init__(self, checkpoint=None, device=None):
-        self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
+        # None: resolved to "cuda" when available (or "cpu") once the model is loaded
+        self.device = device
         self.checkpoint = checkpoint or "qubvel-hf/finetune-instance-segmentation-ade20k-mini-mask2former"
         self.model = None
         self.processor = None
+        self.id2label = None
+        # Images are segmented concurrently in the threadpool: the first callers must not load twice
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.model is not None
 
     def load(self):
         '''
         Loads model and processor into memory/device.
+        The model is assigned last, so a caller that sees it loaded also sees the processor.
         '''
         if self.model is None:
-            print(f"Loading model from {self.checkpoint}...")
-            self.model = Mask2FormerForUniversalSegmentation.from_pretrained(
-                self.checkpoint
-            ).to(self.device)
-            self.processor = Mask2FormerImageProcessor.from_pretrained(self.checkpoint)
-            self.model.eval()
+            with self._load_lock:
+                if self.model is None:
+                    import torch
+                    from transformers import Mask2FormerForUniversalSegmentation, Mask2FormerImageProcessor
+
+                    if self.device is None:
+                        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                    print(f"Loading model from {self.checkpoint}...")
+                    model = Mask2FormerForUniversalSegmentation.from_pretrained(
+                        self.checkpoint
+                    ).to(self.device)
+                    model.eval()
+                    self.processor = Mask2FormerImageProcessor.from_pretrained(self.checkpoint)
+                    self.id2label = model.config.id2label
+                    self.model = model
         return self
 
-    def segment(self, image_path, min_area=700, min_score=0.7):
+    def _predict(self, image):
+        '''
+        Run the model on a PIL image and return the raw outputs
+        (class_queries_logits and masks_queries_logits).
+        '''
+        import torch
+
+        inputs = self.processor(images=[image], return_tensors="pt").to(self.device)
+
+        with torch.no_grad():
+            return self.model(**inputs)
+
+    def segment(self, image_path, min_area=700, min_score=0.7, image_np=None):
         """
         Segment people on an image
 
@@ -41,6 +70,7 @@ class PersonSegmenter:
             image_path (str): The file path to the image (should contain at least 1 human).
             min_area (int): Minimum pixel area for a mask to be kept.
             min_score (float): Minimum confidence score for a mask to be kept.
+            image_np (np.ndarray): The image already decoded as RGB, to skip reading image_path.
 
         Returns:
             tuple: A tuple containing:
@@ -49,19 +79,20 @@ class PersonSegmenter:
                   represents the instance ID of the segmented person.
                 - person_masks (list[np.ndarray]): A list of binary masks (0 or 1), 
                   each representing a single person instance. same resolution to original image.
-                - outputs (dict): The post-processed output dictionary.
+                - outputs (dict): The post-processed output dictionary. outputs["person_ids"]
+                  lists the instance_map id of each entry of person_masks.
         """
 
-        if self.model is None:
+        if not self.loaded:
             self.load()
             
-        image = Image.open(image_path).convert("RGB")
-        image_np = np.array(image)
+        if image_np is None:
+            image = Image.open(image_path).convert("RGB")
+            image_np = np.array(image)
+        else:
+            image = Image.fromarray(image_np)
 
-        inputs = self.processor(images=[image], return_tensors="pt").to(self.device)
-        
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        outputs = self._predict(image)
             
         outputs = self.processor.post_process_instance_segmentation(
             outputs, 
@@ -73,9 +104,10 @@ class PersonSegmenter:
         instance_map = outputs["segmentation"].cpu().numpy()
 
         # Label ID for 'person'
-        person_label_id = next((k for k, v in self.model.config.id2label.items() if v == "person"), None)
+        person_label_id = next((k for k, v in self.id2label.items() if v == "person"), None)
         
         person_masks = []
+        person_ids = []
         if person_label_id is not None:
             for segment in outputs["segments_info"]:
                 # Filter by label, score, and area
@@ -88,9 +120,445 @@ class PersonSegmenter:
                     # Area constraint
                     if area >= min_area:
                         person_masks.append(mask)
+                        person_ids.append(segment["id"])
                     else:
                         print(f"Dropping instance {segment['id']} with area {area} (min_area={min_area})")
                 elif segment["label_id"] == person_label_id:
                     print(f"Dropping instance {segment['id']} with low score {segment['score']:.2f}")
 
-        return image_np, instance_map, person_masks, outputs
\ No newline at end of file
+        outputs["person_ids"] = person_ids
+        return image_np, instance_map, person_masks, outputs
+
+def person_label_map(instance_map, person_ids):
+    """
+    Combine the person instances of an instance map into one uint8 label map.
+
+    Input:
+        instance_map: 2D array of instance ids (-1 for background), as returned by segment()
+        person_ids: instance ids of the people, in the order of person_masks
+
+    Output:
+        uint8 array, 0 for background and i + 1 for the i-th person (at most 255 people)
+    """
+    if not len(person_ids):
+        return np.zeros(instance_map.shape, dtype=np.uint8)
+    # One gather through a lookup table instead of one comparison per instance
+    lut = np.zeros(max(int(instance_map.max()), max(person_ids)) + 2, dtype=np.uint8)
+    for i, person_id in enumerate(person_ids[:255]):
+        lut[person_id + 1] = i + 1
+    return lut[instance_map + 1]
+
+def masks_to_label_map(masks, shape):
+    """Label map (0 background, i + 1 for masks[i]) built from binary masks; earlier masks win overlaps."""
+    labels = np.zeros(shape, dtype=np.uint8)
+    for i, mask in enumerate(masks[:255]):
+        labels[(mask > 0) & (labels == 0)] = i + 1
+    return labels
+
+def segmentation_labels(instance_map, person_masks, outputs):
+    """
+    Person label map for the result of any segmenter's segment(): uses the
+    instance map when the segmenter reports person_ids, else the masks.
+    """
+    if isinstance(outputs, dict) and "person_ids" in outputs:
+        return person_label_map(instance_map, outputs["person_ids"])
+    return masks_to_label_map(person_masks, instance_map.shape[:2])
+
+class OnnxPersonSegmenter(PersonSegmenter):
+    """
+    PersonSegmenter running Mask2Former through ONNX Runtime on CPU.
+
+    On first load the Hugging Face checkpoint is exported to ONNX and cached in
+    `cache_dir`; later loads only read the config, the image processor and the
+    .onnx file, so PyTorch never runs the model. Pre- and post-processing are
+    shared with PersonSegmenter, so segment() returns the same structure.
+
+    Requires the optional `onnxruntime` package (and `onnx` for the one-time export).
+    """
+
+    OUTPUT_NAMES = ("class_queries_logits", "masks_queries_logits")
+
+    def __init__(self, checkpoint=None, cache_dir=None, intra_op_threads=0, opset=17):
+        super().__init__(checkpoint=checkpoint, device="cpu")
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "vid2manga", "onnx")
+        # 0 lets onnxruntime use one thread per physical core
+        self.intra_op_threads = intra_op_threads
+        self.opset = opset
+        self.session = None
+
+    @property
+    def onnx_path(self):
+        name = self.checkpoint.replace("/", "__").replace("\\", "__")
+        return os.path.join(self.cache_dir, f"{name}.opset{self.opset}.onnx")
+
+    def export(self):
+        '''
+        Export the PyTorch checkpoint to ONNX (once) and return the cached path.
+        '''
+        path = self.onnx_path
+        if os.path.exists(path):
+            return path
+
+        import torch
+        from transformers import Mask2FormerForUniversalSegmentation
+
+        class _Logits(torch.nn.Module):
+            # ONNX export needs plain tensor outputs instead of a ModelOutput
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, pixel_values):
+                outputs = self.model(pixel_values=pixel_values)
+                return outputs.class_queries_logits, outputs.masks_queries_logits
+
+        print(f"Exporting {self.checkpoint} to ONNX at {path}...")
+        model = Mask2FormerForUniversalSegmentation.from_pretrained(self.checkpoint).eval()
+        size = self.processor.size
+        height = size.get("height") or size.get("shortest_edge", 384)
+        width = size.get("width") or size.get("shortest_edge", 384)
+        dummy = torch.randn(1, 3, height, width)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    _Logits(model),
+                    (dummy,),
+                    tmp_path,
+                    input_names=["pixel_values"],
+                    output_names=list(self.OUTPUT_NAMES),
+                    dynamic_axes={"pixel_values": {0: "batch", 2: "height", 3: "width"}},
+                    opset_version=self.opset,
+                    dynamo=False,
+                )
+            # Atomic so concurrent workers never load a half-written model
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def load(self):
+        '''
+        Loads the image processor and an ONNX Runtime session (exporting the model if needed).
+        The session is assigned last, so a caller that sees it loaded also sees the processor.
+        '''
+        if self.session is None:
+            with self._load_lock:
+                if self.session is None:
+                    import onnxruntime as ort
+                    from transformers import AutoConfig, Mask2FormerImageProcessor
+
+                    self.processor = Mask2FormerImageProcessor.from_pretrained(self.checkpoint)
+                    self.id2label = AutoConfig.from_pretrained(self.checkpoint).id2label
+                    path = self.export()
+
+                    options = ort.SessionOptions()
+                    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                    options.intra_op_num_threads = self.intra_op_threads
+                    options.inter_op_num_threads = 1
+                    print(f"Loading ONNX model from {path}...")
+                    self.session = ort.InferenceSession(
+                        path, sess_options=options, providers=["CPUExecutionProvider"]
+                    )
+        return self
+
+    @property
+    def loaded(self):
+        return self.session is not None
+
+    def _predict(self, image):
+        import torch
+        from transformers.models.mask2former.modeling_mask2former import Mask2FormerForUniversalSegmentationOutput
+
+        inputs = self.processor(images=[image], return_tensors="np")
+        class_logits, mask_logits = self.session.run(
+            list(self.OUTPUT_NAMES), {"pixel_values": inputs["pixel_values"].astype(np.float32)}
+        )
+        # The processor's post-processing works on torch tensors
+        return Mask2FormerForUniversalSegmentationOutput(
+            class_queries_logits=torch.from_numpy(class_logits),
+            masks_queries_logits=torch.from_numpy(mask_logits),
+        )
+
+SEGMENTER_BACKENDS = ("torch", "onnx")
+
+def create_segmenter(backend="torch", checkpoint=None, **kwargs):
+    '''
+    Build a person segmenter for the given backend.
+
+    Input:
+        backend: "torch" (eager PyTorch, CPU or CUDA) or "onnx" (ONNX Runtime on CPU)
+        checkpoint: Hugging Face Mask2Former checkpoint
+        kwargs: backend specific options (device for torch; cache_dir, intra_op_threads for onnx)
+
+    Output:
+        A PersonSegmenter; the model is loaded on first segment() or load()
+    '''
+    if backend == "onnx":
+        return OnnxPersonSegmenter(checkpoint=checkpoint, **kwargs)
+    if backend == "torch":
+        return PersonSegmenter(checkpoint=checkpoint, **kwargs)
+    raise ValueError(f"Unknown segmenter backend: {backend}. Use one of {SEGMENTER_BACKENDS}")
+
+class HogPersonDetector:
+    """
+    OpenCV HOG + linear SVM pedestrian detector (the model ships with OpenCV, no download).
+    Runs on a downscaled copy of the frame; boxes are returned in original coordinates.
+    """
+
+    def __init__(self, max_side=640, win_stride=(8, 8), scale=1.05, nms_threshold=0.4):
+        self.max_side = max_side
+        self.win_stride = win_stride
+        self.scale = scale
+        self.nms_threshold = nms_threshold
+        self._hog = None
+
+    @property
+    def available(self):
+        # Some OpenCV builds (e.g. 5.x wheels) no longer include the HOG descriptor
+        return hasattr(cv2, "HOGDescriptor")
+
+    def detect(self, image_np):
+        """
+        Detect people on an RGB image.
+
+        Returns:
+            list of (x, y, w, h, score), highest score first
+        """
+        if self._hog is None:
+            self._hog = cv2.HOGDescriptor()
+            self._hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+        height, width = image_np.shape[:2]
+        ratio = min(1.0, self.max_side / max(height, width))
+        small = image_np if ratio == 1.0 else cv2.resize(
+            image_np, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_AREA
+        )
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+        boxes, weights = self._hog.detectMultiScale(gray, winStride=self.win_stride, padding=(8, 8), scale=self.scale)
+        if len(boxes) == 0:
+            return []
+
+        weights = np.asarray(weights, dtype=np.float32).reshape(-1)
+        keep = cv2.dnn.NMSBoxes([list(map(int, box)) for box in boxes], weights.tolist(), 0.0, self.nms_threshold)
+        detections = []
+        for i in np.asarray(keep).reshape(-1):
+            x, y, w, h = (float(v) / ratio for v in boxes[i])
+            detections.append((x, y, w, h, float(weights[i])))
+        return sorted(detections, key=lambda d: d[4], reverse=True)
+
+SEGMENT_MODES = ("accuracy", "speed")
+
+class TieredPersonSegmenter:
+    """
+    Fast person regions with escalation to Mask2Former.
+
+    The HOG detector finds people and each box becomes a coarse elliptical mask,
+    which is enough for keeping speech bubbles off characters. The precise
+    segmenter only runs when:
+        - a detection is ambiguous (score below `escalate_below`)
+        - no person is detected and escalate_on_empty=True. Off by default: HOG
+          only knows upright, fully visible people, so on anime frames most
+          empty results would escalate and the fast tier would cost more than
+          running Mask2Former alone
+        - precise outlines are requested (precise=True, e.g. show_mask)
+        - HOG is not available in the installed OpenCV build
+
+    segment() returns the same tuple as PersonSegmenter.segment(); outputs["tier"]
+    tells which tier produced the masks ("hog" or "mask2former").
+    """
+
+    def __init__(self, precise=None, detector=None, min_detection_score=0.3, escalate_below=0.6,
+                 escalate_on_empty=False):
+        self.precise = precise or PersonSegmenter()
+        self.detector = detector or HogPersonDetector()
+        # HOG SVM margins: below min_detection_score a box is ignored, between the
+        # two thresholds it is ambiguous and triggers Mask2Former. Clear detections
+        # of the default people detector score well above escalate_below, so only
+        # borderline boxes pay for the precise model
+        self.min_detection_score = min_detection_score
+        self.escalate_below = escalate_below
+        self.escalate_on_empty = escalate_on_empty
+
+    def load(self):
+        # The HOG model is built in; only the precise tier has weights to load
+        self.precise.load()
+        return self
+
+    @staticmethod
+    def _coarse_mask(shape, box):
+        # HOG boxes include background padding; an inscribed ellipse follows a standing person better
+        x, y, w, h = box
+        mask = np.zeros(shape, dtype=np.uint8)
+        center = (int(round(x + w / 2)), int(round(y + h / 2)))
+        axes = (max(1, int(round(w * 0.35))), max(1, int(round(h * 0.47))))
+        cv2.ellipse(mask, center, axes, 0, 0, 360, 1, -1)
+        return mask
+
+    def segment(self, image_path, min_area=700, min_score=0.7, precise=False):
+        """
+        Segment people on an image, using the precise model only when needed.
+
+        Input:
+            image_path (str): The file path to the image.
+            min_area (int): Minimum pixel area for a mask to be kept.
+            min_score (float): Minimum confidence score for Mask2Former masks.
+            precise (bool): Skip the fast tier and return Mask2Former outlines.
+
+        Returns:
+            (image_np, instance_map, person_masks, outputs) like PersonSegmenter.segment
+        """
+        if precise or not self.detector.available:
+            return self._escalate(image_path, min_area, min_score)
+
+        image_np = np.array(Image.open(image_path).convert("RGB"))
+        detections = [d for d in self.detector.detect(image_np) if d[4] >= self.min_detection_score]
+        if (not detections and self.escalate_on_empty) or any(score < self.escalate_below for *_, score in detections):
+            # The frame is already decoded; the precise tier reuses it
+            return self._escalate(image_path, min_area, min_score, image_np)
+
+        shape = image_np.shape[:2]
+        instance_map = np.full(shape, -1, dtype=np.int32)
+        person_masks = []
+        segments_info = []
+        for *box, score in detections:
+            mask = self._coarse_mask(shape, box)
+            if mask.sum() < min_area:
+                continue
+            segment_id = len(person_masks)
+            instance_map[(mask > 0) & (instance_map < 0)] = segment_id
+            person_masks.append(mask)
+            segments_info.append({"id": segment_id, "label": "person", "score": score, "box": tuple(box)})
+
+        outputs = {"tier": "hog", "segments_info": segments_info, "person_ids": list(range(len(person_masks)))}
+        return image_np, instance_map, person_masks, outputs
+
+    def _escalate(self, image_path, min_area, min_score, image_np=None):
+        image_np, instance_map, person_masks, outputs = self.precise.segment(
+            image_path, min_area=min_area, min_score=min_score, image_np=image_np
+        )
+        outputs["tier"] = "mask2former"
+        return image_np, instance_map, person_masks, outputs
+
+def mask_iou(a, b):
+    """IoU of two binary masks (1.0 when both are empty)."""
+    a = a > 0
+    b = b > 0
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(a, b).sum() / union)
+
+class TemporalMaskPropagator:
+    """
+    Segments consecutive frames of a video by propagating masks with optical flow.
+
+    The wrapped segmenter runs only on anchor frames. Each following frame gets
+    the previous frame's masks warped by dense Farneback flow (computed on a
+    downscaled grayscale copy). A new anchor is segmented when:
+        - the shot changes (grayscale histogram correlation below `shot_threshold`)
+        - the propagated masks drifted too far from the anchor (IoU below `iou_threshold`)
+        - `max_propagation` frames were propagated since the anchor
+
+    Frames must be passed in time order; use one instance per video.
+    """
+
+    def __init__(self, segmenter, iou_threshold=0.5, shot_threshold=0.6, max_propagation=8,
+                 flow_max_side=320, **segment_kwargs):
+        self.segmenter = segmenter
+        self.iou_threshold = iou_threshold
+        self.shot_threshold = shot_threshold
+        self.max_propagation = max_propagation
+        self.flow_max_side = flow_max_side
+        self.segment_kwargs = segment_kwargs
+        self.min_area = segment_kwargs.get("min_area", 700)
+        self.anchors = 0
+        self.propagated = 0
+        self.reset()
+
+    def reset(self):
+        self._prev_gray = None
+        self._prev_hist = None
+        self._prev_labels = None
+        self._anchor_union = None
+        self._since_anchor = 0
+
+    def _small_gray(self, image_np):
+        gray = cv2.cvtColor(image_np, cv2.COLOR_RGB2GRAY)
+        height, width = gray.shape
+        ratio = min(1.0, self.flow_max_side / max(height, width))
+        if ratio < 1.0:
+            gray = cv2.resize(gray, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_AREA)
+        return gray
+
+    @staticmethod
+    def _histogram(gray):
+        hist = cv2.calcHist([gray], [0], None, [64], [0, 256])
+        return cv2.normalize(hist, hist).flatten()
+
+    def _warp(self, labels, prev_gray, gray):
+        # Backward flow: for each pixel of the current frame, where it was in the previous one
+        flow = cv2.calcOpticalFlowFarneback(gray, prev_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        height, width = labels.shape
+        small_h, small_w = gray.shape
+        if (small_h, small_w) != (height, width):
+            flow = cv2.resize(flow, (width, height), interpolation=cv2.INTER_LINEAR)
+            flow[..., 0] *= width / small_w
+            flow[..., 1] *= height / small_h
+        grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        return cv2.remap(labels, grid_x + flow[..., 0], grid_y + flow[..., 1], cv2.INTER_NEAREST,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    def _anchor(self, image_path, gray, hist):
+        image_np, instance_map, person_masks, outputs = self.segmenter.segment(image_path, **self.segment_kwargs)
+        labels = segmentation_labels(instance_map, person_masks, outputs)
+        self._prev_gray, self._prev_hist, self._prev_labels = gray, hist, labels
+        self._anchor_union = labels > 0
+        self._since_anchor = 0
+        self.anchors += 1
+        outputs = dict(outputs) if isinstance(outputs, dict) else {"model_outputs": outputs}
+        outputs["temporal"] = "anchor"
+        return image_np, instance_map, person_masks, outputs
+
+    def segment(self, image_path, **_):
+        """
+        Segment the next frame of the video.
+
+        Returns:
+            (image_np, instance_map, person_masks, outputs) like PersonSegmenter.segment;
+            outputs["temporal"] is "anchor" or "propagated"
+        """
+        image_np = np.array(Image.open(image_path).convert("RGB"))
+        gray = self._small_gray(image_np)
+        hist = self._histogram(gray)
+
+        if (
+            self._prev_gray is None
+            or self._since_anchor >= self.max_propagation
+            or cv2.compareHist(self._prev_hist, hist, cv2.HISTCMP_CORREL) < self.shot_threshold
+        ):
+            return self._anchor(image_path, gray, hist)
+        if self._prev_labels.shape != image_np.shape[:2]:
+            return self._anchor(image_path, gray, hist)
+
+        labels = self._warp(self._prev_labels, self._prev_gray, gray)
+        if mask_iou(labels, self._anchor_union) < self.iou_threshold:
+            return self._anchor(image_path, gray, hist)
+
+        instance_map = np.full(labels.shape, -1, dtype=np.int32)
+        person_masks = []
+        for label in range(1, int(labels.max()) + 1):
+            mask = (labels == label).astype(np.uint8)
+            if mask.sum() >= self.min_area:
+                instance_map[mask > 0] = len(person_masks)
+                person_masks.append(mask)
+
+        self._prev_gray, self._prev_hist, self._prev_labels = gray, hist, labels
+        self._since_anchor += 1
+        self.propagated += 1
+        outputs = {"temporal": "propagated", "person_ids": list(range(len(person_masks)))}
+        return image_np, instance_map, person_masks, outputs
@@ -1,6 +1,9 @@
 import random
 import math
-from PIL import Image, ImageDraw, ImageOps
+import textwrap
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageOps
 
 def generate_manga_layout(width = 1000, height = 1400, num_frames=8, seed=None, std_dev=0.1, margin=10, min_ratio=0.3):
     """
@@ -230,4 +233,63 @@ def create_bubble_mask(image_shape, axes, character_mask=None, proximity_target=
     final_mask = np.zeros((h, w), dtype=np.uint8)
     cv2.ellipse(final_mask, (center_x, center_y), (bw // 2, bh // 2), 0, 0, 360, 255, -1)
     
-    return final_mask, (center_x, center_y)
\ No newline at end of file
+    return final_mask, (center_x, center_y)
+
+def draw_speech_bubble(page, frame, text, character_mask=None, max_chars=120, font_size=16):
+    """
+    Draws an oval speech bubble with text inside a frame of a manga page.
+    The bubble is placed with create_bubble_mask, so it avoids characters when a mask is given.
+
+    Args:
+        page: PIL Image of the whole manga page (modified in place).
+        frame: (x, y, w, h) coordinates of the frame on the page.
+        text: Dialogue to write in the bubble.
+        character_mask: Optional binary mask (h, w) of the characters inside the frame.
+        max_chars: Longer dialogue is truncated with an ellipsis.
+        font_size: Size of the bubble text.
+
+    Returns:
+        (x, y) center of the bubble in page coordinates, or None if nothing was drawn.
+    """
+    text = " ".join(text.split())
+    if not text:
+        return None
+    if len(text) > max_chars:
+        text = text[:max_chars - 3].rstrip() + "..."
+
+    x, y, w, h = (int(v) for v in frame)
+    bw = max(40, int(w * 0.5))
+    bh = max(30, int(h * 0.3))
+    if bw >= w or bh >= h:
+        return None
+
+    _, (cx, cy) = create_bubble_mask((h, w), (bw, bh), character_mask=character_mask,
+                                     proximity_target=(w // 2, h // 4) if character_mask is not None else None)
+
+    draw = ImageDraw.Draw(page)
+    box = (x + cx - bw // 2, y + cy - bh // 2, x + cx + bw // 2, y + cy + bh // 2)
+    draw.ellipse(box, fill="white", outline="black", width=3)
+
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:
+        # Pillow < 10.1 has a single fixed-size default font
+        font = ImageFont.load_default()
+
+    # Text area is the rectangle inscribed in the ellipse
+    inner_w = int(bw * 0.7)
+    inner_h = int(bh * 0.7)
+    char_w = max(1.0, font.getlength("abcdefghijklmnopqrstuvwxyz") / 26)
+    line_h = max(1, font.getbbox("Mg")[3]) + 2
+    lines = textwrap.wrap(text, width=max(1, int(inner_w / char_w)))
+    max_lines = max(1, inner_h // line_h)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = lines[-1][:max(0, len(lines[-1]) - 3)] + "..."
+
+    top = y + cy - (len(lines) * line_h) // 2
+    for i, line in enumerate(lines):
+        line_w = draw.textlength(line, font=font)
+        draw.text((x + cx - line_w / 2, top + i * line_h), line, fill="black", font=font)
+
+    return x + cx, y + cy
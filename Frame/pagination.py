@@ -0,0 +1,117 @@
+import math
+
+import numpy as np
+
+# Weight of each importance signal; signals that are missing or all zero are left out
+SHARPNESS_WEIGHT = 0.2
+SHOT_WEIGHT = 0.4
+WORDS_WEIGHT = 0.4
+
+# A panel is never treated as less than a quarter or more than four times an average one
+MIN_IMPORTANCE = 0.25
+MAX_IMPORTANCE = 4.0
+
+def panel_range(num_frames):
+    """
+    Panels per page allowed around the requested density: ordinary scenes fill
+    pages of num_frames panels, key scenes go down to half as many (larger) panels.
+
+    Returns:
+        (min_panels, max_panels)
+    """
+    num_frames = max(1, num_frames)
+    return math.ceil(num_frames / 2), num_frames
+
+def panel_importance(sharpness, shot_seconds=None, words_per_second=None):
+    """
+    Relative importance of every panel of a volume, 1.0 for an average panel.
+
+    Each signal is divided by its mean over the volume and the ratios are mixed
+    with SHARPNESS_WEIGHT / SHOT_WEIGHT / WORDS_WEIGHT:
+        - sharpness: variance of the Laplacian (the frame_clear score), on a log
+          scale since it spans orders of magnitude
+        - shot_seconds: how long the panel's shot stays on screen
+        - words_per_second: dialogue density while the panel is shown; dense
+          dialogue needs room for its bubbles
+
+    Args:
+        sharpness: One score per panel.
+        shot_seconds: Optional shot length per panel.
+        words_per_second: Optional word density per panel.
+
+    Returns:
+        float64 array, clipped to [MIN_IMPORTANCE, MAX_IMPORTANCE].
+    """
+    count = len(sharpness)
+    signals = [
+        (SHARPNESS_WEIGHT, np.log1p(np.maximum(np.asarray(sharpness, dtype=np.float64), 0.0))),
+        (SHOT_WEIGHT, shot_seconds),
+        (WORDS_WEIGHT, words_per_second),
+    ]
+    total = np.zeros(count)
+    weights = 0.0
+    for weight, values in signals:
+        if values is None:
+            continue
+        values = np.asarray(values, dtype=np.float64)
+        mean = values.mean() if count else 0.0
+        if not np.isfinite(mean) or mean <= 0:
+            continue
+        total += weight * values / mean
+        weights += weight
+    if weights == 0:
+        return np.ones(count)
+    return np.clip(total / weights, MIN_IMPORTANCE, MAX_IMPORTANCE)
+
+def paginate(importance, min_panels, max_panels, panels_per_page=None):
+    """
+    Split a volume's panels (in reading order) into pages of min_panels..max_panels.
+
+    An average panel takes 1 / panels_per_page of a page and a panel of
+    importance w takes w times that, so runs of important panels get fewer,
+    larger panels per page. The split minimizes the summed squared over/underfill
+    of the pages, by dynamic programming over the panels in one pass: O(n * (max_panels - min_panels + 1)).
+
+    The last page may hold fewer than min_panels and is not penalized for being
+    underfilled, so no blank padding panels are needed.
+
+    Args:
+        importance: One value per panel (see panel_importance).
+        min_panels: Fewest panels on a page (except the last).
+        max_panels: Most panels on a page.
+        panels_per_page: Panels of average importance that fill a page (default max_panels).
+
+    Returns:
+        List of page sizes that sum to the number of panels.
+    """
+    min_panels = max(1, min(min_panels, max_panels))
+    panels_per_page = panels_per_page or max_panels
+    count = len(importance)
+    if count == 0:
+        return []
+
+    fill = np.zeros(count + 1)
+    np.cumsum(np.asarray(importance, dtype=np.float64) / panels_per_page, out=fill[1:])
+    cost = np.full(count + 1, np.inf)
+    cost[0] = 0.0
+    size = np.zeros(count + 1, dtype=np.int64)
+    for end in range(1, count + 1):
+        # Larger pages first, so ties go to fewer pages
+        lowest = 1 if end == count else min_panels
+        sizes = np.arange(min(max_panels, end), lowest - 1, -1)
+        if len(sizes) == 0:
+            continue
+        page_fill = fill[end] - fill[end - sizes]
+        over = page_fill - 1.0
+        if end == count:
+            over = np.maximum(over, 0.0)
+        totals = cost[end - sizes] + over * over
+        best = int(np.argmin(totals))
+        cost[end], size[end] = totals[best], sizes[best]
+
+    pages = []
+    end = count
+    while end > 0:
+        pages.append(int(size[end]))
+        end -= size[end]
+    return pages[::-1]
@@ -0,0 +1,272 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Whisper's input format: mono float32 PCM at 16 kHz
+SAMPLE_RATE = 16000
+
+# Feature frames: 25 ms windows every 10 ms
+FRAME_LENGTH = 400
+FRAME_HOP = 160
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 20
+# Frames per feature block, bounds the memory of the FFT on long audio (60 s)
+BLOCK_FRAMES = 6000
+
+# Embedding windows: 1.5 s every 0.75 s, in feature frames
+WINDOW_FRAMES = 150
+WINDOW_HOP = 75
+# Fraction of voiced frames a window needs to get an embedding
+MIN_VOICED = 0.3
+
+def _mel_filterbank(sample_rate=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS, fmin=20.0, fmax=None):
+    fmax = fmax or sample_rate / 2
+    mel = lambda f: 2595.0 * np.log10(1.0 + f / 700.0)
+    hz = lambda m: 700.0 * (10.0 ** (m / 2595.0) - 1.0)
+    points = hz(np.linspace(mel(fmin), mel(fmax), n_mels + 2))
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    lower, center, upper = points[:-2, None], points[1:-1, None], points[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+def _dct_matrix(n_mfcc=N_MFCC, n_mels=N_MELS):
+    # Orthonormal DCT-II, as used for MFCCs
+    k = np.arange(n_mfcc)[:, None]
+    n = np.arange(n_mels)[None, :]
+    matrix = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2.0 / n_mels)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+def mfcc_features(pcm, sample_rate=SAMPLE_RATE):
+    '''
+    MFCCs and log energy of every 25 ms frame (10 ms hop)
+
+    Frames are strided views of the PCM buffer (no copy); the FFT runs in blocks
+    of BLOCK_FRAMES so memory stays flat for hour-long audio.
+
+    Input:
+        pcm: mono float32 samples
+
+    Output:
+        (mfcc (n_frames, N_MFCC) float32, log_energy (n_frames,) float32)
+    '''
+    pcm = np.asarray(pcm, dtype=np.float32)
+    if len(pcm) < FRAME_LENGTH:
+        return np.zeros((0, N_MFCC), np.float32), np.zeros(0, np.float32)
+    frames = sliding_window_view(pcm, FRAME_LENGTH)[::FRAME_HOP]
+    window = np.hamming(FRAME_LENGTH).astype(np.float32)
+    filterbank = _mel_filterbank(sample_rate)
+    dct = _dct_matrix()
+
+    mfcc = np.empty((len(frames), N_MFCC), np.float32)
+    log_energy = np.empty(len(frames), np.float32)
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        # Pre-emphasis inside the frame, then windowing
+        emphasized = np.empty_like(block)
+        emphasized[:, 0] = block[:, 0]
+        np.subtract(block[:, 1:], 0.97 * block[:, :-1], out=emphasized[:, 1:])
+        emphasized *= window
+        power = np.abs(np.fft.rfft(emphasized, n=N_FFT)) ** 2
+        mel_energy = power.astype(np.float32) @ filterbank.T
+        np.log(mel_energy + 1e-10, out=mel_energy)
+        mfcc[start:start + len(block)] = mel_energy @ dct.T
+        log_energy[start:start + len(block)] = np.log(np.einsum("ij,ij->i", block, block) + 1e-10)
+    return mfcc, log_energy
+
+def voiced_frames(log_energy):
+    '''Energy-based voice activity: frames well above the quiet floor of the recording.'''
+    if len(log_energy) == 0:
+        return np.zeros(0, bool)
+    floor, loud = np.percentile(log_energy, [10, 90])
+    return log_energy > max(floor + 0.3 * (loud - floor), np.log(1e-6))
+
+def window_embeddings(mfcc, voiced):
+    '''
+    Speaker embedding of every window: the mean MFCCs of its voiced frames (c0,
+    the loudness term, is left out), i.e. the window's average vocal-tract shape.
+
+    Means come from prefix sums, so all windows cost O(n_frames) together.
+
+    Output:
+        (embeddings (n_windows, N_MFCC - 1), window start frames, valid mask)
+    '''
+    n_frames = len(mfcc)
+    starts = np.arange(0, max(1, n_frames - WINDOW_FRAMES + 1), WINDOW_HOP)
+    sums = np.zeros((n_frames + 1, N_MFCC - 1))
+    counts = np.zeros(n_frames + 1)
+    np.cumsum(mfcc[:, 1:].astype(np.float64) * voiced[:, None], axis=0, out=sums[1:])
+    np.cumsum(voiced, out=counts[1:])
+
+    ends = np.minimum(starts + WINDOW_FRAMES, n_frames)
+    count = counts[ends] - counts[starts]
+    valid = count >= MIN_VOICED * (ends - starts)
+    return (sums[ends] - sums[starts]) / np.maximum(count, 1)[:, None], starts, valid
+
+def agglomerative_clusters(embeddings, max_clusters=8):
+    '''
+    Average-linkage agglomerative clustering on cosine similarity
+
+    Repeatedly merges the most similar pair of clusters (one argmax over the
+    similarity matrix, rows updated in place) and records the partition at every
+    cluster count up to `max_clusters`. O(n^3) overall, so callers bound n.
+
+    Input:
+        embeddings: (n, d) array
+
+    Output:
+        {k: labels (n,) numbered 0..k-1 in order of first appearance} for k = 1..min(n, max_clusters)
+    '''
+    n = len(embeddings)
+    normalized = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12)
+    similarity = normalized @ normalized.T
+    np.fill_diagonal(similarity, -np.inf)
+    sizes = np.ones(n)
+    labels = np.arange(n)
+    cuts = {}
+    for clusters in range(n, 0, -1):
+        if clusters <= max_clusters:
+            _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+            # Renumber by first appearance so speaker 0 is the first one heard
+            cuts[clusters] = np.argsort(np.argsort(first))[inverse]
+        if clusters == 1:
+            break
+        a, b = divmod(int(np.argmax(similarity)), n)
+        row = (sizes[a] * similarity[a] + sizes[b] * similarity[b]) / (sizes[a] + sizes[b])
+        similarity[a], similarity[:, a] = row, row
+        similarity[b], similarity[:, b] = -np.inf, -np.inf
+        similarity[a, a] = -np.inf
+        sizes[a] += sizes[b]
+        labels[labels == b] = a
+    return cuts
+
+def separation(points, labels):
+    '''
+    Smallest Fisher separation between two clusters: distance of their means
+    along the line joining them, over the pooled standard deviation on that line.
+    '''
+    k = int(labels.max()) + 1
+    smallest = np.inf
+    for i in range(k):
+        for j in range(i + 1, k):
+            first, second = points[labels == i], points[labels == j]
+            direction = first.mean(axis=0) - second.mean(axis=0)
+            direction /= np.linalg.norm(direction) + 1e-12
+            a, b = first @ direction, second @ direction
+            smallest = min(smallest, abs(a.mean() - b.mean()) / np.sqrt((a.var() + b.var()) / 2 + 1e-12))
+    return smallest
+
+def _smooth(labels, k):
+    # Majority over each window and its two neighbours removes single-window flips
+    if len(labels) < 3:
+        return labels
+    onehot = np.eye(k, dtype=np.int8)[labels]
+    votes = onehot.copy()
+    votes[1:] += onehot[:-1]
+    votes[:-1] += onehot[1:]
+    smoothed = votes.argmax(axis=1)
+    # Keep the label on ties (1-1-1 between three speakers)
+    ties = votes.max(axis=1) < 2
+    smoothed[ties] = labels[ties]
+    return smoothed
+
+def diarize(pcm, sample_rate=SAMPLE_RATE, num_speakers=None, max_speakers=8, min_separation=5.0,
+            max_cluster_windows=400, components=6, refine_iterations=2):
+    '''
+    Speaker turns of a recording from MFCC-statistics embeddings
+
+    Window embeddings are standardized and projected on their top principal
+    components. Agglomerative clustering runs on at most `max_cluster_windows`
+    evenly spaced windows; without num_speakers, the largest cluster count whose
+    clusters are all pairwise separated by `min_separation` (see separation) and
+    hold at least 5% of the windows is kept. Every window is then assigned to the
+    nearest centroid, refined with a few k-means steps. Everything but the
+    bounded clustering step is linear in the audio length.
+
+    Input:
+        pcm: mono float32 samples at `sample_rate` (the buffer already decoded for Whisper)
+        num_speakers: fixed number of speakers, or None to estimate it (up to max_speakers)
+
+    Output:
+        list of {"start", "end", "speaker"} turns tiling the recording (seconds, speaker index)
+    '''
+    if sample_rate != SAMPLE_RATE:
+        raise ValueError(f"diarize expects {SAMPLE_RATE} Hz PCM, got {sample_rate}")
+    duration = len(pcm) / sample_rate
+    if duration == 0:
+        return []
+    mfcc, log_energy = mfcc_features(pcm, sample_rate)
+    embeddings, starts, valid = window_embeddings(mfcc, voiced_frames(log_energy))
+    if valid.sum() < 4:
+        return [{"start": 0.0, "end": duration, "speaker": 0}]
+
+    embeddings, starts = embeddings[valid], starts[valid]
+    embeddings = (embeddings - embeddings.mean(axis=0)) / (embeddings.std(axis=0) + 1e-8)
+    sample = np.unique(np.linspace(0, len(embeddings) - 1, min(len(embeddings), max_cluster_windows)).astype(int))
+    # Principal axes of the sample; few components keep the clustering robust on short clips
+    _, _, axes = np.linalg.svd(embeddings[sample], full_matrices=False)
+    points = embeddings @ axes[:max(1, min(components, len(sample) // 4))].T
+
+    cuts = agglomerative_clusters(points[sample], max_clusters=num_speakers or max_speakers)
+    if num_speakers:
+        sample_labels = cuts[min(num_speakers, max(cuts))]
+    else:
+        sample_labels = cuts[1]
+        min_size = max(2, 0.05 * len(sample))
+        for k in sorted(cuts)[1:]:
+            if np.bincount(cuts[k]).min() >= min_size and separation(points[sample], cuts[k]) >= min_separation:
+                sample_labels = cuts[k]
+    k = int(sample_labels.max()) + 1
+    centroids = np.stack([points[sample][sample_labels == c].mean(axis=0) for c in range(k)])
+
+    for _ in range(refine_iterations + 1):
+        distances = (points ** 2).sum(axis=1)[:, None] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)
+        labels = np.argmin(distances, axis=1)
+        for c in range(k):
+            members = labels == c
+            if members.any():
+                centroids[c] = points[members].mean(axis=0)
+    labels = _smooth(labels, k)
+
+    # Turn boundaries halfway between the centres of windows with different speakers
+    centers = (starts + WINDOW_FRAMES / 2) * FRAME_HOP / sample_rate
+    changes = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    bounds = np.concatenate([[0.0], (centers[changes - 1] + centers[changes]) / 2, [duration]])
+    return [
+        {"start": round(float(bounds[i]), 3), "end": round(float(bounds[i + 1]), 3), "speaker": int(labels[first])}
+        for i, first in enumerate(np.concatenate([[0], changes]))
+    ]
+
+def speakers_at(turns, times):
+    '''Speaker index at each time (seconds), by locating the turn with searchsorted.'''
+    if not turns:
+        return np.full(len(times), -1, dtype=np.int64)
+    turn_starts = np.array([turn["start"] for turn in turns])
+    turn_speakers = np.array([turn["speaker"] for turn in turns])
+    index = np.clip(np.searchsorted(turn_starts, times, side="right") - 1, 0, len(turns) - 1)
+    return turn_speakers[index]
+
+def assign_speakers(result, turns):
+    '''
+    Label a Whisper result with the diarization turns, in place
+
+    Every word gets the speaker at its midpoint; a segment gets the most common
+    speaker of its words (or of its midpoint when it has no word timestamps).
+
+    Output:
+        the same result with "speaker" on segments/words and "speaker_count"
+    '''
+    segments = result.get("segments", []) or []
+    words = [word for segment in segments for word in segment.get("words") or []]
+    word_speakers = speakers_at(turns, np.array([(w.get("start", 0.0) + w.get("end", 0.0)) / 2 for w in words]))
+    for word, speaker in zip(words, word_speakers):
+        word["speaker"] = int(speaker)
+
+    mids = np.array([(s.get("start", 0.0) + s.get("end", 0.0)) / 2 for s in segments])
+    segment_speakers = speakers_at(turns, mids)
+    for segment, fallback in zip(segments, segment_speakers):
+        labels = [word["speaker"] for word in segment.get("words") or []]
+        segment["speaker"] = int(np.bincount(labels).argmax()) if labels and min(labels) >= 0 else int(fallback)
+    result["speaker_count"] = len({turn["speaker"] for turn in turns})
+    return result
@@ -1,9 +1,45 @@
 import ffmpeg
 import os
 import sys
-import whisper
+import threading
+import wave
 
-model = whisper.load_model("base", device = 'cpu')
+import numpy as np
+
+from Speech.diarization import diarize, assign_speakers
+from Speech.speech_activity import speech_spans, plan_chunks, TrimmedAudio, MIN_SKIP
+
+# Whisper checkpoint used for transcription (also part of the transcript cache key)
+MODEL_NAME = os.getenv("WHISPER_MODEL", "base")
+
+class LazyModel:
+    '''
+    Stand-in for the Whisper model that imports whisper and loads the checkpoint
+    on first attribute access (e.g. model.transcribe), so importing this module is cheap.
+    '''
+
+    def __init__(self, name, device='cpu'):
+        self._name = name
+        self._device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import whisper
+                    self._model = whisper.load_model(self._name, device=self._device)
+        return self._model
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+model = LazyModel(MODEL_NAME, device = 'cpu')
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
@@ -44,26 +80,153 @@ def split_video_audio(input_file_path):
 
     return output_audio.replace('\\', '/'), output_video.replace('\\', '/')
 
-def speech2text(input_audio_path, language = 'en'):
+# Whisper (and diarization) input: mono float32 PCM at this rate
+SAMPLE_RATE = 16000
+
+def load_pcm(input_audio_path, sample_rate=SAMPLE_RATE):
+    '''
+    Decode an audio file once into the buffer shared by transcription and diarization
+
+    Input:
+        input_audio_path: path to the audio file
+        sample_rate: target sample rate
+
+    Output:
+        mono float32 NumPy array in [-1, 1]
+    '''
+    try:
+        with wave.open(input_audio_path, 'rb') as f:
+            if f.getsampwidth() == 2 and f.getframerate() == sample_rate:
+                pcm = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+                channels = f.getnchannels()
+                if channels > 1:
+                    pcm = pcm.reshape(-1, channels).mean(axis=1)
+                return (pcm / 32768.0).astype(np.float32)
+    except (wave.Error, EOFError):
+        pass
+
+    # Other formats/rates: resample and downmix with ffmpeg, like whisper.load_audio
+    out, _ = (
+        ffmpeg.input(input_audio_path)
+        .output('-', format='s16le', acodec='pcm_s16le', ac=1, ar=sample_rate)
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return (np.frombuffer(out, dtype=np.int16) / 32768.0).astype(np.float32)
+
+def speech2text(input_audio_path, language = 'en', diarize = False, trim_silence = False, chunk_seconds = None, chunks = None):
     '''
     Extract the sound in the audio to text with annotated timestamp
 
     Input:
         input_audio_path: path to the audio file
+        language: spoken language
+        diarize: also label every segment and word with a speaker index
+        trim_silence: transcribe only the speech spans (see Speech/speech_activity.py),
+            timestamps are mapped back to the original audio
+        chunk_seconds: transcribe the audio in chunks of at most this many seconds
+        chunks: dict-like store of finished chunk results (see transcribe_pcm), for resuming
 
     Output:
-        result: resulted text from speech
+        result: resulted text from speech (with "speaker" fields and "speaker_count" when diarized,
+            and "audio_skipped_percent" when trimmed)
     '''
 
     input_audio_path = os.path.join(audio_dir, input_audio_path)
 
-    result = model.transcribe(
-        input_audio_path,
-        language=language,
-        word_timestamps = True
-    )
+    if not (diarize or trim_silence or chunk_seconds):
+        return model.transcribe(
+            input_audio_path,
+            language=language,
+            word_timestamps = True
+        )
+
+    # The audio is decoded once; Whisper and the diarizer read the same buffer
+    pcm = load_pcm(input_audio_path)
+    result = transcribe_pcm(pcm, language, trim_silence=trim_silence, chunk_seconds=chunk_seconds, chunks=chunks)
+
+    if diarize:
+        result = diarization(pcm, result)
 
     return result
 
-def diarization():
-    pass
\ No newline at end of file
+def transcribe_pcm(pcm, language = 'en', trim_silence = False, chunk_seconds = None, chunks = None):
+    '''
+    Transcribe decoded audio, optionally skipping non-speech and in resumable chunks
+
+    Every chunk is transcribed on its own and its result, already in original
+    time, is written to `chunks` under a "<start>-<end>" sample-range key before
+    the next chunk starts. Chunks found in `chunks` are not transcribed again, so
+    a restarted job passes the same store and continues after the last finished
+    chunk.
+
+    Input:
+        pcm: decoded audio from load_pcm
+        language: spoken language
+        trim_silence: transcribe only the speech spans
+        chunk_seconds: longest chunk in seconds (None transcribes in one piece)
+        chunks: dict-like store of chunk results, or None
+
+    Output:
+        merged Whisper-style result
+    '''
+    full = np.array([[0, len(pcm)]], dtype=np.int64)
+    spans = speech_spans(pcm) if trim_silence else full
+    kept = int((spans[:, 1] - spans[:, 0]).sum())
+    if trim_silence and kept > (1.0 - MIN_SKIP) * len(pcm):
+        # Trimming is not worth the remapping
+        spans, kept = full, len(pcm)
+
+    planned = plan_chunks(pcm, spans, int(chunk_seconds * SAMPLE_RATE)) if chunk_seconds else [spans]
+    parts = []
+    for chunk_spans in planned:
+        if len(chunk_spans) == 0:
+            continue
+        key = f"{chunk_spans[0, 0]}-{chunk_spans[-1, 1]}"
+        if chunks is not None and key in chunks:
+            parts.append(chunks[key])
+            continue
+        trimmed = TrimmedAudio(pcm, chunk_spans)
+        part = trimmed.remap(model.transcribe(
+            trimmed.audio,
+            language=language,
+            word_timestamps = True
+        ))
+        if chunks is not None:
+            chunks[key] = part
+        parts.append(part)
+
+    if len(parts) == 1:
+        result = parts[0]
+    else:
+        # Nothing but silence/music (no parts) skips Whisper, which would only hallucinate
+        segments = [segment for part in parts for segment in part.get("segments", []) or []]
+        for i, segment in enumerate(segments):
+            segment["id"] = i
+        result = {
+            "text": "".join(part.get("text", "") for part in parts),
+            "segments": segments,
+            "language": parts[0].get("language", language) if parts else language,
+        }
+
+    if trim_silence:
+        result["audio_skipped_percent"] = round(100.0 * (1.0 - kept / len(pcm)), 1) if len(pcm) else 0.0
+        print(f"Skipped {result['audio_skipped_percent']}% of the audio as silence/music")
+    return result
+
+def diarization(pcm, result=None, num_speakers=None):
+    '''
+    Find who speaks when (see Speech/diarization.py)
+
+    Input:
+        pcm: decoded audio from load_pcm
+        result: optional Whisper result to label with speakers (in place)
+        num_speakers: known number of speakers, or None to estimate it
+
+    Output:
+        the labelled result, or the list of speaker turns when no result is given
+    '''
+    turns = diarize(pcm, SAMPLE_RATE, num_speakers=num_speakers)
+    if result is None:
+        return turns
+    result["speaker_turns"] = turns
+    return assign_speakers(result, turns)
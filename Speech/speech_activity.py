@@ -0,0 +1,258 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from Speech.diarization import SAMPLE_RATE, FRAME_LENGTH, FRAME_HOP, N_FFT, BLOCK_FRAMES
+
+# Frames this far (dB) above the quiet floor of the recording count as active
+ACTIVE_DB = 10.0
+# ... but never more than this far below the loudest frames, or below an absolute floor
+DYNAMIC_RANGE_DB = 50.0
+MIN_ACTIVE_DB = -60.0
+
+# Spectral flatness above this is noise-like (hiss, hum-free noise beds)
+MAX_FLATNESS = 0.45
+FLATNESS_BAND = (300.0, 6000.0)
+
+# Speech/music discrimination over 1 s windows evaluated every 0.1 s:
+# speech has many low-energy frames between syllables (LSTER) and bursts of
+# high zero-crossing rate on fricatives (HZCRR); sustained music has neither
+STATS_WINDOW = 100
+STATS_HOP = 10
+MIN_LSTER = 0.1
+MIN_HZCRR = 0.05
+
+# Span clean-up, in seconds
+MERGE_GAP = 1.0
+MIN_SPAN = 0.25
+PADDING = 0.25
+# Silence inserted between kept spans so Whisper sees clean boundaries
+JOIN_GAP = 0.2
+# Below this fraction of skippable audio, trimming is not worth the remapping
+MIN_SKIP = 0.05
+
+def frame_features(pcm, sample_rate=SAMPLE_RATE):
+    '''
+    Energy, zero-crossing rate and spectral flatness of every 25 ms frame (10 ms hop)
+
+    All features read the samples through one strided view of the frames, in
+    blocks of BLOCK_FRAMES, so memory stays at a block of frames plus a few
+    values per frame however long the audio is. The FFT for spectral flatness
+    only runs on active frames.
+
+    Input:
+        pcm: mono float32 samples
+
+    Output:
+        (energy_db, zcr, flatness, active), one value per frame; flatness is 1.0 on inactive frames
+    '''
+    pcm = np.asarray(pcm, dtype=np.float32)
+    n_frames = 0 if len(pcm) < FRAME_LENGTH else (len(pcm) - FRAME_LENGTH) // FRAME_HOP + 1
+    if n_frames == 0:
+        return np.zeros(0), np.zeros(0), np.ones(0), np.zeros(0, dtype=bool)
+
+    frames = sliding_window_view(pcm, FRAME_LENGTH)[::FRAME_HOP]
+    energy = np.empty(n_frames)
+    crossings = np.empty(n_frames)
+    for start in range(0, n_frames, BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        # float32 sums over 400 samples; einsum reads the strided view without a squared copy
+        energy[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+        signs = np.signbit(block)
+        crossings[start:start + len(block)] = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+    energy_db = 10.0 * np.log10(energy / FRAME_LENGTH + 1e-10)
+    zcr = crossings / (FRAME_LENGTH - 1)
+
+    floor = np.percentile(energy_db, 10)
+    threshold = max(floor + ACTIVE_DB, energy_db.max() - DYNAMIC_RANGE_DB, MIN_ACTIVE_DB)
+    active = energy_db > threshold
+
+    flatness = np.ones(n_frames)
+    window = np.hanning(FRAME_LENGTH).astype(np.float32)
+    bins = np.fft.rfftfreq(N_FFT, 1.0 / sample_rate)
+    band = (bins >= FLATNESS_BAND[0]) & (bins <= FLATNESS_BAND[1])
+    indices = np.flatnonzero(active)
+    for start in range(0, len(indices), BLOCK_FRAMES):
+        block = indices[start:start + BLOCK_FRAMES]
+        power = np.abs(np.fft.rfft(frames[block] * window, n=N_FFT))[:, band] ** 2 + 1e-12
+        # Geometric over arithmetic mean of the power spectrum: ~0 for tones, ~0.56 for white noise
+        flatness[block] = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+    return energy_db, zcr, flatness, active
+
+def _window_stats(energy_db, zcr):
+    # LSTER and HZCRR of the 1 s window centred on every frame
+    n_frames = len(energy_db)
+    width = min(STATS_WINDOW, n_frames)
+    energy = 10.0 ** (energy_db / 10.0)
+    energy_windows = sliding_window_view(energy, width)[::STATS_HOP]
+    zcr_windows = sliding_window_view(zcr, width)[::STATS_HOP]
+    lster = (energy_windows < 0.5 * energy_windows.mean(axis=1, keepdims=True)).mean(axis=1)
+    hzcrr = (zcr_windows > 1.5 * zcr_windows.mean(axis=1, keepdims=True)).mean(axis=1)
+    window_of_frame = np.clip((np.arange(n_frames) - width // 2) // STATS_HOP, 0, len(lster) - 1)
+    return lster[window_of_frame], hzcrr[window_of_frame]
+
+def _runs(mask):
+    # (start, end) frame indices of the True runs in a boolean array
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def speech_spans(pcm, sample_rate=SAMPLE_RATE):
+    '''
+    Find the stretches of audio that may contain speech
+
+    A frame is speech-like when it is active (above the recording's quiet floor),
+    not noise-like (low spectral flatness) and sits in a window with speech
+    rhythm (enough low-energy frames or zero-crossing bursts). Spans closer than
+    MERGE_GAP are merged, shorter than MIN_SPAN dropped and padded by PADDING.
+
+    Input:
+        pcm: mono float32 samples
+
+    Output:
+        (n, 2) int64 array of [start, end) sample offsets, sorted and non-overlapping
+    '''
+    energy_db, zcr, flatness, active = frame_features(pcm, sample_rate)
+    if not active.any():
+        return np.zeros((0, 2), dtype=np.int64)
+    lster, hzcrr = _window_stats(energy_db, zcr)
+    speech = active & (flatness < MAX_FLATNESS) & ((lster >= MIN_LSTER) | (hzcrr >= MIN_HZCRR))
+
+    starts, ends = _runs(speech)
+    if len(starts) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    frame_rate = sample_rate / FRAME_HOP
+    # Merge runs separated by short pauses, then drop isolated blips
+    keep = np.concatenate([[True], starts[1:] - ends[:-1] > MERGE_GAP * frame_rate])
+    starts = starts[keep]
+    ends = np.maximum.reduceat(ends, np.flatnonzero(keep))
+    long_enough = ends - starts >= MIN_SPAN * frame_rate
+    starts, ends = starts[long_enough], ends[long_enough]
+
+    pad = int(PADDING * sample_rate)
+    sample_starts = np.maximum(starts * FRAME_HOP - pad, 0)
+    sample_ends = np.minimum(ends * FRAME_HOP + FRAME_LENGTH + pad, len(pcm))
+    # Padding can make neighbours overlap again
+    overlaps = np.concatenate([[True], sample_starts[1:] > sample_ends[:-1]])
+    heads = np.flatnonzero(overlaps)
+    return np.stack([sample_starts[heads], np.maximum.reduceat(sample_ends, heads)], axis=1).astype(np.int64)
+
+class TrimmedAudio:
+    '''
+    Speech spans of a recording packed into one buffer, with the map back to original time
+
+    Kept spans are concatenated with JOIN_GAP of silence between them, so one
+    Whisper call covers all of them. remap() turns timestamps in the packed
+    buffer back into timestamps in the original recording.
+    '''
+
+    def __init__(self, pcm, spans, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.duration = len(pcm) / sample_rate
+        self.spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        lengths = self.spans[:, 1] - self.spans[:, 0]
+        gap = int(JOIN_GAP * sample_rate)
+
+        # Start of every span in the packed buffer (in samples)
+        packed_starts = np.zeros(len(self.spans), dtype=np.int64)
+        if len(self.spans):
+            np.cumsum(lengths[:-1] + gap, out=packed_starts[1:])
+        if len(self.spans) == 1:
+            # A single span needs no packing: Whisper reads a view of the original buffer
+            self.audio = pcm[self.spans[0, 0]:self.spans[0, 1]]
+        else:
+            self.audio = np.zeros(int(packed_starts[-1] + lengths[-1]) if len(self.spans) else 0, dtype=np.float32)
+            for (start, end), packed in zip(self.spans, packed_starts):
+                self.audio[packed:packed + end - start] = pcm[start:end]
+
+        self._packed_starts = packed_starts / sample_rate
+        self._original_starts = self.spans[:, 0] / sample_rate
+        self._lengths = lengths / sample_rate
+
+    @property
+    def kept_seconds(self):
+        return float(self._lengths.sum())
+
+    @property
+    def skipped_percent(self):
+        if self.duration == 0:
+            return 0.0
+        return round(100.0 * (1.0 - self.kept_seconds / self.duration), 1)
+
+    def to_original(self, times):
+        '''Map packed-buffer times (seconds) to original times; times inside a join gap snap to the end of the span before it.'''
+        times = np.asarray(times, dtype=np.float64)
+        if len(self.spans) == 0:
+            return times
+        index = np.clip(np.searchsorted(self._packed_starts, times, side="right") - 1, 0, len(self.spans) - 1)
+        offset = np.clip(times - self._packed_starts[index], 0.0, self._lengths[index])
+        return self._original_starts[index] + offset
+
+    def remap(self, result):
+        '''Rewrite segment and word timestamps of a Whisper result (in place) to original time.'''
+        segments = result.get("segments", []) or []
+        words = [word for segment in segments for word in segment.get("words") or []]
+        for entries in (segments, words):
+            if not entries:
+                continue
+            starts = self.to_original([entry.get("start", 0.0) for entry in entries])
+            ends = self.to_original([entry.get("end", 0.0) for entry in entries])
+            for entry, start, end in zip(entries, starts, ends):
+                entry["start"] = round(float(start), 3)
+                entry["end"] = round(float(end), 3)
+        return result
+
+def trim_non_speech(pcm, sample_rate=SAMPLE_RATE):
+    '''
+    Drop silence, noise and music from a recording before transcription
+
+    Input:
+        pcm: mono float32 samples
+
+    Output:
+        TrimmedAudio, or None when less than MIN_SKIP of the audio could be skipped
+    '''
+    spans = speech_spans(pcm, sample_rate)
+    kept = int((spans[:, 1] - spans[:, 0]).sum())
+    if len(pcm) == 0 or kept > (1.0 - MIN_SKIP) * len(pcm):
+        return None
+    return TrimmedAudio(pcm, spans, sample_rate)
+
+def _quietest_cut(pcm, start, end):
+    # Sample offset of the quietest 10 ms frame in [start, end)
+    frames = pcm[start:start + (end - start) // FRAME_HOP * FRAME_HOP].reshape(-1, FRAME_HOP)
+    if len(frames) == 0:
+        return end
+    return start + int(np.argmin(np.einsum("ij,ij->i", frames, frames))) * FRAME_HOP
+
+def plan_chunks(pcm, spans, max_samples):
+    '''
+    Group speech spans into chunks of at most max_samples of original audio
+
+    Chunks are transcribed (and checkpointed) one at a time. They end between
+    spans where possible; spans longer than a chunk are cut at the quietest
+    10 ms frame of the last fifth of the chunk, so cuts rarely split a word.
+
+    Input:
+        pcm: mono float32 samples
+        spans: (n, 2) [start, end) sample offsets from speech_spans
+        max_samples: longest chunk
+
+    Output:
+        list of (m, 2) int64 span arrays, one per chunk, in time order
+    '''
+    pieces = []
+    for start, end in np.asarray(spans, dtype=np.int64).reshape(-1, 2):
+        while end - start > max_samples:
+            cut = _quietest_cut(pcm, start + max_samples * 4 // 5, start + max_samples)
+            pieces.append((start, cut))
+            start = cut
+        pieces.append((start, end))
+
+    chunks, current = [], []
+    for start, end in pieces:
+        if current and end - current[0][0] > max_samples:
+            chunks.append(np.array(current, dtype=np.int64))
+            current = []
+        current.append((start, end))
+    if current:
+        chunks.append(np.array(current, dtype=np.int64))
+    return chunks
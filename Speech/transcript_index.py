@@ -0,0 +1,156 @@
+import os
+import tempfile
+
+import numpy as np
+
+class TranscriptIndex:
+    '''
+    Columnar index over a Whisper result for time-range lookups.
+
+    Words are kept in start-time order as NumPy arrays (starts, ends) plus char
+    offsets into one packed text buffer, so the text of words i..j-1 is a single
+    slice. Segments are stored as the index of their first word. Lookups use
+    np.searchsorted, so mapping a frame's time range to its dialogue is
+    O(log n) instead of a scan over the result dict.
+
+    Segments without word timestamps are indexed as one "word" each, so the
+    index works for results transcribed without word_timestamps too. Diarized
+    results add a per-word speaker column (-1 where unknown).
+    '''
+
+    def __init__(self, starts, ends, offsets, text, segment_words, speakers=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        # offsets[i]:offsets[i + 1] is word i in text
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.text = text
+        # segment_words[k] is the index of segment k's first word; one extra entry closes the last segment
+        self.segment_words = np.asarray(segment_words, dtype=np.int64)
+        self.speakers = (
+            np.full(len(self.starts), -1, dtype=np.int16) if speakers is None else np.asarray(speakers, dtype=np.int16)
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def segment_count(self):
+        return len(self.segment_words) - 1
+
+    @classmethod
+    def from_whisper(cls, result):
+        '''
+        Build the index from a Whisper transcription result
+
+        Input:
+            result: dict returned by model.transcribe (segments with optional words)
+
+        Output:
+            TranscriptIndex
+        '''
+        words = []
+        segment_words = [0]
+        for segment in result.get("segments", []) or []:
+            entries = segment.get("words") or [
+                {"word": segment.get("text", ""), "start": segment.get("start", 0.0), "end": segment.get("end", 0.0)}
+            ]
+            for entry in entries:
+                word = entry.get("word", "")
+                if word.strip():
+                    speaker = entry.get("speaker", segment.get("speaker", -1))
+                    words.append((float(entry.get("start", 0.0)), float(entry.get("end", 0.0)), word, speaker))
+            segment_words.append(len(words))
+
+        starts = np.array([w[0] for w in words], dtype=np.float64)
+        # searchsorted needs sorted starts; Whisper emits words in time order, but
+        # rare overlaps at segment joins are clamped to the previous start
+        np.maximum.accumulate(starts, out=starts)
+        offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        np.cumsum([len(w[2]) for w in words], out=offsets[1:])
+        return cls(
+            starts=starts,
+            ends=np.array([w[1] for w in words], dtype=np.float64),
+            offsets=offsets,
+            text="".join(w[2] for w in words),
+            segment_words=segment_words,
+            speakers=[w[3] for w in words],
+        )
+
+    def word_range(self, t0, t1):
+        '''Indices (i, j) of the words starting in [t0, t1).'''
+        i = int(np.searchsorted(self.starts, t0, side="left"))
+        j = int(np.searchsorted(self.starts, t1, side="left"))
+        return i, max(i, j)
+
+    def word(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]].strip()
+
+    def words_between(self, t0, t1):
+        '''
+        Words starting in [t0, t1)
+
+        Output:
+            list of (word, start, end)
+        '''
+        i, j = self.word_range(t0, t1)
+        return [(self.word(k), float(self.starts[k]), float(self.ends[k])) for k in range(i, j)]
+
+    def text_between(self, t0, t1):
+        '''Dialogue of the words starting in [t0, t1) as one string (a single slice of the packed text).'''
+        i, j = self.word_range(t0, t1)
+        return " ".join(self.text[self.offsets[i]:self.offsets[j]].split())
+
+    def turns_between(self, t0, t1):
+        '''
+        Dialogue of the words starting in [t0, t1), split where the speaker changes
+
+        Output:
+            list of (speaker, text); speaker is -1 for undiarized transcripts
+        '''
+        i, j = self.word_range(t0, t1)
+        if i == j:
+            return []
+        changes = np.flatnonzero(self.speakers[i + 1:j] != self.speakers[i:j - 1]) + i + 1
+        bounds = [i, *changes.tolist(), j]
+        return [
+            (int(self.speakers[a]), " ".join(self.text[self.offsets[a]:self.offsets[b]].split()))
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def segment_of(self, word_index):
+        '''Index of the segment containing a word.'''
+        return int(np.searchsorted(self.segment_words, word_index, side="right")) - 1
+
+    def save(self, path):
+        '''Write the index as an uncompressed .npz file (atomically).'''
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    starts=self.starts,
+                    ends=self.ends,
+                    offsets=self.offsets,
+                    text=np.frombuffer(self.text.encode("utf-8"), dtype=np.uint8),
+                    segment_words=self.segment_words,
+                    speakers=self.speakers,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                starts=data["starts"],
+                ends=data["ends"],
+                offsets=data["offsets"],
+                text=data["text"].tobytes().decode("utf-8"),
+                segment_words=data["segment_words"],
+                speakers=data["speakers"] if "speakers" in data else None,
+            )